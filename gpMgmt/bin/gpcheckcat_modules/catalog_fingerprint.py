@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Purpose : Per-segment fingerprints of catalog tables for gpcheckcat's
+          incremental mode.
+
+A fingerprint is the row count and an order independent hash (the sum of
+the first 64 bits of the md5 of every row) of a catalog table on one
+segment.  After a clean run the fingerprints are saved to a state file;
+a later run only needs to re-check the cross segment consistency of a
+table whose fingerprint has changed on at least one segment.
+"""
+
+import os
+
+
+# Columns that vacuum and analyze update on their own.  None of the cross
+# consistency tests compare them, so a change in them must not make a table
+# look changed.
+VOLATILE_COLUMNS = ['relpages', 'reltuples', 'relallvisible', 'relfrozenxid', 'datfrozenxid']
+
+
+class CatalogFingerprints:
+
+    def __init__(self, state_dir, dbname):
+        self._state_dir = state_dir
+        self._state_file = os.path.join(state_dir, 'gpcheckcat.fingerprint.%s' % dbname)
+
+    @staticmethod
+    def get_fingerprint_query(catalog_table_obj):
+        catname = catalog_table_obj.getTableName()
+        columns = ', '.join(catalog_table_obj.getTableColumns(excluding=VOLATILE_COLUMNS))
+        row_hash = "coalesce(sum(('x' || substr(md5(ROW({columns})::text), 1, 16))::bit(64)::bigint::numeric), 0)::text".format(
+            columns=columns)
+
+        return """
+          SELECT -1 AS content, count(*) AS nrows, {row_hash} AS hash
+          FROM {catalog}
+          UNION ALL
+          SELECT gp_segment_id, count(*), {row_hash}
+          FROM gp_dist_random('{catalog}')
+          GROUP BY gp_segment_id
+          """.format(catalog=catname, row_hash=row_hash)
+
+    def collect(self, db_connection, catalog_table_obj, all_contents):
+        """
+        return: {content: (nrows, hash)} for the master and every segment in
+                all_contents; segments without any rows get (0, '0')
+        """
+        qry = self.get_fingerprint_query(catalog_table_obj)
+        fingerprint = dict((content, (0, '0')) for content in all_contents)
+        for (content, nrows, row_hash) in db_connection.query(qry).getresult():
+            fingerprint[content] = (int(nrows), row_hash)
+        return fingerprint
+
+    def load(self):
+        """
+        return: {catname: {content: (nrows, hash)}} from the last clean run,
+                or an empty dict if there is none
+        """
+        fingerprints = {}
+        if not os.path.exists(self._state_file):
+            return fingerprints
+
+        with open(self._state_file) as f:
+            for line in f:
+                (catname, content, nrows, row_hash) = line.strip().split('|')
+                fingerprints.setdefault(catname, {})[int(content)] = (int(nrows), row_hash)
+        return fingerprints
+
+    def save(self, fingerprints):
+        if not os.path.exists(self._state_dir):
+            os.makedirs(self._state_dir)
+
+        tmp_file = self._state_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            for catname in sorted(fingerprints):
+                for content, (nrows, row_hash) in sorted(fingerprints[catname].iteritems()):
+                    f.write('%s|%d|%d|%s\n' % (catname, content, nrows, row_hash))
+        os.rename(tmp_file, self._state_file)
+
+    @staticmethod
+    def get_unchanged_tables(current, previous):
+        """
+        return: names of the tables whose fingerprint is the same as in
+                previous on every segment
+        """
+        return set(catname for catname, fingerprint in current.iteritems()
+                   if previous.get(catname) == fingerprint)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+
+import sys
+from collections import deque
+from threading import Condition, Lock, Thread, local
+
+
+class _Task:
+    def __init__(self, name, fn, depends, context, output=None):
+        self.name = name
+        self.fn = fn
+        self.depends = set(depends)
+        self.context = context
+        # buffered emit() calls, see CheckScheduler.emit()
+        self.output = output
+        self.result = None
+        self.exc_info = None
+
+
+class _Group:
+    """
+    The tasks handed to a single run() call.  Tasks are released in the
+    order they were given, as soon as everything they depend on is done.
+    """
+
+    def __init__(self, tasks):
+        names = set(task.name for task in tasks)
+        for task in tasks:
+            # dependencies outside of this run are considered satisfied
+            task.depends &= names
+        self._check_cycles(tasks)
+        self.tasks = tasks
+        self.waiting = list(tasks)
+        self.ready = deque()
+        self.done = set()
+        self.flushed = 0
+        self.release()
+
+    @staticmethod
+    def _check_cycles(tasks):
+        done = set()
+        remaining = list(tasks)
+        while remaining:
+            runnable = [task for task in remaining if task.depends <= done]
+            if not runnable:
+                raise Exception('circular dependency between: %s' %
+                                ', '.join(str(task.name) for task in remaining))
+            for task in runnable:
+                remaining.remove(task)
+                done.add(task.name)
+
+    def release(self):
+        for task in list(self.waiting):
+            if task.depends <= self.done:
+                self.waiting.remove(task)
+                self.ready.append(task)
+
+    def finish(self, task):
+        self.done.add(task.name)
+        self.release()
+
+    def is_complete(self):
+        return len(self.done) == len(self.tasks)
+
+    def take_flushable(self):
+        """
+        The tasks whose output is next in order and that have finished
+        """
+        tasks = []
+        while self.flushed < len(self.tasks) and self.tasks[self.flushed].name in self.done:
+            tasks.append(self.tasks[self.flushed])
+            self.flushed += 1
+        return tasks
+
+
+class CheckScheduler:
+    """
+    Runs gpcheckcat checks on a fixed number of lanes.  A lane is a thread
+    with its own database connections; the caller's thread is lane 0 and
+    num_lanes - 1 worker threads are started on first use.  With a single
+    lane every task runs inline, in order, in the caller's thread.
+
+    Each task started by run() gets a fresh context dictionary.  Tasks
+    started by map() share the context of the task that started them, so
+    per-table work is accounted to the check it belongs to.
+
+    With more than one lane, the output a task started by run() passes to
+    emit() is held back until the task has finished, and then written in
+    the order of the tasks, so that the output of concurrent checks does
+    not interleave.
+    """
+
+    def __init__(self, num_lanes=1):
+        self.num_lanes = max(1, num_lanes)
+        self.cond = Condition()
+        self.output_lock = Lock()
+        self.groups = deque()
+        self.workers = []
+        self.local = local()
+
+    def current_lane(self):
+        return getattr(self.local, 'lane', 0)
+
+    def _get_context(self):
+        if not hasattr(self.local, 'context'):
+            self.local.context = {}
+        return self.local.context
+
+    context = property(_get_context)
+
+    def emit(self, write, *args):
+        """
+        Call write(*args), or hold the call back until the current task
+        and the tasks before it have finished.
+        """
+        output = self._get_context().get('output')
+        if output is None:
+            write(*args)
+        else:
+            output.append((write, args))
+
+    def _flush(self, group):
+        with self.output_lock:
+            with self.cond:
+                tasks = group.take_flushable()
+            for task in tasks:
+                if task.output is None:
+                    continue
+                parent = task.context.get('parent_output')
+                for (write, args) in task.output:
+                    # a run() nested in a task adds to the output of that task
+                    if parent is not None:
+                        parent.append((write, args))
+                    else:
+                        write(*args)
+
+    def _start_workers(self):
+        while len(self.workers) < self.num_lanes - 1:
+            worker = Thread(target=self._work, args=(len(self.workers) + 1,))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def _next_task(self, group=None):
+        """
+        Take the next ready task, from the given group only or from any
+        group.  Must be called with self.cond held.
+        """
+        groups = [group] if group else self.groups
+        for g in groups:
+            if g.ready:
+                return g, g.ready.popleft()
+        return None, None
+
+    def _execute(self, group, task):
+        saved = self.context
+        self.local.context = task.context
+        try:
+            task.result = task.fn()
+        except BaseException:
+            task.exc_info = sys.exc_info()
+        finally:
+            self.local.context = saved
+
+        with self.cond:
+            group.finish(task)
+            self.cond.notify_all()
+        self._flush(group)
+
+    def _work(self, lane):
+        self.local.lane = lane
+        while True:
+            with self.cond:
+                group, task = self._next_task()
+                while task is None:
+                    self.cond.wait()
+                    group, task = self._next_task()
+            self._execute(group, task)
+
+    def _run_group(self, group):
+        if self.num_lanes == 1:
+            while not group.is_complete():
+                self._execute(group, group.ready.popleft())
+        else:
+            self._start_workers()
+            with self.cond:
+                self.groups.append(group)
+                self.cond.notify_all()
+            try:
+                # the calling thread works on its own tasks while it waits,
+                # so nested runs from inside a task cannot starve
+                while True:
+                    with self.cond:
+                        _, task = self._next_task(group)
+                        while task is None and not group.is_complete():
+                            self.cond.wait()
+                            _, task = self._next_task(group)
+                    if task is None:
+                        break
+                    self._execute(group, task)
+            finally:
+                with self.cond:
+                    self.groups.remove(group)
+
+        for task in group.tasks:
+            if task.exc_info:
+                raise task.exc_info[0], task.exc_info[1], task.exc_info[2]
+        return [task.result for task in group.tasks]
+
+    def run(self, tasks):
+        """
+        tasks is a list of (name, fn, depends) in the order they would run
+        serially; fn() is started once every task named in depends has
+        finished.  Returns the results of fn() in the order of tasks.  If
+        any task raised, the first such exception is re-raised once all
+        tasks are done.
+        """
+        tasks = [_Task(name, fn, depends, {}) for (name, fn, depends) in tasks]
+        if self.num_lanes > 1:
+            parent = self.context.get('output')
+            for task in tasks:
+                task.output = []
+                task.context['output'] = task.output
+                task.context['parent_output'] = parent
+        return self._run_group(_Group(tasks))
+
+    def map(self, fn, items):
+        """
+        Call fn(item) for every item, in parallel, and return the results
+        in the order of items.
+        """
+        context = self.context
+        return self._run_group(_Group([_Task(i, (lambda item=item: fn(item)), [], context)
+                                       for i, item in enumerate(items)]))
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+import time
+from Queue import Queue
+from threading import Lock, RLock, Thread
+
+
+class SegmentLatency:
+    """
+    Connect and query timings for a single segment over the life of a run.
+    """
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.connects = 0
+        self.connect_time = 0.0
+        self.queries = 0
+        self.query_time = 0.0
+        self.max_query_time = 0.0
+        self.errors = 0
+
+    def add_connect(self, elapsed):
+        self.connects += 1
+        self.connect_time += elapsed
+
+    def add_query(self, elapsed):
+        self.queries += 1
+        self.query_time += elapsed
+        self.max_query_time = max(self.max_query_time, elapsed)
+
+    def avg_query_time(self):
+        if self.queries == 0:
+            return 0.0
+        return self.query_time / self.queries
+
+
+class SegmentConnectionPool:
+    """
+    Keeps one long-lived connection per segment (per database and lane) and
+    runs queries against them from a fixed set of worker threads.  Lanes
+    let concurrently running checks each have their own connections; the
+    worker threads cap the number of segment queries in flight across all
+    lanes.
+
+    connect_fn(cfg, database, **options) must return a connection object
+    that supports query() and close().  A connection is never used by more
+    than one thread at a time.
+    """
+
+    def __init__(self, connect_fn, num_workers):
+        self.connect_fn = connect_fn
+        self.num_workers = max(1, num_workers)
+        self.conns = {}       # key = (dbid, database, lane, options), value = connection
+        self.conn_locks = {}  # key = (dbid, database, lane, options), value = RLock
+        self.latency = {}     # key = dbid, value = SegmentLatency
+        self.lock = Lock()
+        self.work_queue = Queue()
+        self.workers = []
+
+    def _start_workers(self):
+        while len(self.workers) < self.num_workers:
+            worker = Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def _work(self):
+        while True:
+            (cfg, database, qry, lane, done, index) = self.work_queue.get()
+            done.put((index, self._run_one(cfg, database, qry, lane)))
+
+    def _get_latency(self, cfg):
+        with self.lock:
+            if cfg['dbid'] not in self.latency:
+                self.latency[cfg['dbid']] = SegmentLatency(cfg)
+            return self.latency[cfg['dbid']]
+
+    def _get_conn_lock(self, key):
+        with self.lock:
+            if key not in self.conn_locks:
+                self.conn_locks[key] = RLock()
+            return self.conn_locks[key]
+
+    def get_connection(self, cfg, database, lane=0, options=None):
+        """
+        Return the pooled connection for this segment, connecting on first
+        use.  options are passed on to connect_fn, e.g. other credentials;
+        connections made with different options are pooled separately.
+        """
+        options = options or {}
+        key = (cfg['dbid'], database, lane, tuple(sorted(options.items())))
+        with self._get_conn_lock(key):
+            conn = self.conns.get(key)
+            if conn is None:
+                stime = time.time()
+                conn = self.connect_fn(cfg, database, **options)
+                elapsed = time.time() - stime
+                latency = self._get_latency(cfg)
+                with self.lock:
+                    latency.add_connect(elapsed)
+                    self.conns[key] = conn
+            return conn
+
+    def _run_one(self, cfg, database, qry, lane):
+        latency = self._get_latency(cfg)
+        with self._get_conn_lock((cfg['dbid'], database, lane, ())):
+            try:
+                db = self.get_connection(cfg, database, lane)
+                stime = time.time()
+                curs = db.query(qry)
+                elapsed = time.time() - stime
+                with self.lock:
+                    latency.add_query(elapsed)
+                return (cfg, curs, None)
+            except Exception, e:
+                with self.lock:
+                    latency.errors += 1
+                return (cfg, None, e)
+            except (SystemExit, KeyboardInterrupt), e:
+                # e.g. gpcheckcat's connect() exits when it cannot connect;
+                # run() raises it again in the calling thread
+                return (cfg, None, e)
+
+    def run(self, cfgs, database, qry, lane=0):
+        """
+        Run qry against every segment in cfgs and wait for all of them.
+        Returns a list of (cfg, cursor, error) tuples in the order of cfgs;
+        exactly one of cursor and error is None.  A SystemExit or
+        KeyboardInterrupt on any segment is raised once all of them are
+        done.
+        """
+        self._start_workers()
+        done = Queue()
+        for index, cfg in enumerate(cfgs):
+            self.work_queue.put((cfg, database, qry, lane, done, index))
+
+        results = [None] * len(cfgs)
+        for _ in cfgs:
+            (index, result) = done.get()
+            results[index] = result
+
+        for (cfg, curs, error) in results:
+            if isinstance(error, (SystemExit, KeyboardInterrupt)):
+                raise error
+        return results
+
+    def close(self, database=None):
+        """
+        Close pooled connections, either all of them or only those to the
+        given database.  Worker threads and latency statistics are kept.
+        """
+        with self.lock:
+            for key in self.conns.keys():
+                if database is None or key[1] == database:
+                    self.conns.pop(key).close()
+
+    def latency_report(self):
+        """
+        Return per-segment latency lines, slowest average query first.
+        """
+        lines = ['    dbid | content | host:port | connects | connect (s) | queries | avg query (s) | max query (s) | errors']
+        for latency in sorted(self.latency.values(), key=lambda l: l.avg_query_time(), reverse=True):
+            lines.append('    %s | %s | %s:%s | %d | %.3f | %d | %.3f | %.3f | %d' % (
+                latency.cfg['dbid'], latency.cfg['content'],
+                latency.cfg['hostname'], latency.cfg['port'],
+                latency.connects, latency.connect_time,
+                latency.queries, latency.avg_query_time(),
+                latency.max_query_time, latency.errors))
+        return lines
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""
+Compares a catalog table across the master and all primary segments by
+reading it from each of them in primary key order, through a server side
+cursor, and merging the sorted streams on this host.  Only one batch of
+rows per segment is held in memory at a time, however large the catalog
+table is.
+
+The results have the same columns as the SQL versions of the missing,
+duplicate and inconsistent checks in gpcheckcat, so they can be reported
+and repaired the same way.
+"""
+
+import heapq
+import itertools
+
+# key columns of these types are compared as numbers, all others as text
+NUMERIC_TYPES = set(['int2', 'int4', 'int8', 'oid'])
+
+
+def key_expressions(pkey, coltypes, casts):
+    """
+    Return (select, order by) expressions for the key columns such that
+    Python compares the fetched values in the same order as the server
+    sorts them: numbers as numbers, and everything else as text in byte
+    order.  NULLs sort first, as None does in Python.
+    """
+    select_exprs = []
+    order_exprs = []
+    for col in pkey:
+        coltype = coltypes.get(col, 'oid')
+        cast = casts.get(coltype, '')
+        if cast:
+            coltype = cast.lstrip(':')
+        expr = col + cast
+        if coltype not in NUMERIC_TYPES:
+            expr = '(%s)::text' % expr
+            select_exprs.append(expr)
+            order_exprs.append('%s COLLATE "C" NULLS FIRST' % expr)
+        else:
+            select_exprs.append(expr)
+            order_exprs.append('%s NULLS FIRST' % expr)
+    return select_exprs, order_exprs
+
+
+def ordered_query(catname, key_select, key_order, columns=None, where=''):
+    return 'SELECT {keys}{columns} FROM {catalog} {where} ORDER BY {order}'.format(
+        keys=', '.join(key_select),
+        columns=''.join(', ' + c for c in (columns or [])),
+        catalog=catname,
+        where=where,
+        order=', '.join(key_order))
+
+
+class SegmentCursor:
+    """
+    Iterates over the rows of qry on one segment, batch_size rows at a
+    time, using a cursor in its own transaction.
+    """
+
+    def __init__(self, db, segid, qry, name, batch_size=10000):
+        self.db = db
+        self.segid = segid
+        self.qry = qry
+        self.name = name
+        self.batch_size = batch_size
+
+    def __iter__(self):
+        self.db.query('BEGIN ISOLATION LEVEL SERIALIZABLE')
+        try:
+            self.db.query('DECLARE %s NO SCROLL CURSOR FOR %s' % (self.name, self.qry))
+            while True:
+                rows = self.db.query('FETCH %d FROM %s' % (self.batch_size, self.name)).getresult()
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            self.db.query('ROLLBACK')
+
+
+def merge_by_key(cursors, key_len):
+    """
+    k-way merge of the cursors, which must each be sorted on their first
+    key_len columns.  Yields (key, [(segid, row), ...]) once per key, with
+    one entry for every row with that key on any segment.
+    """
+    def tagged(cursor):
+        for row in cursor:
+            yield (tuple(row[:key_len]), cursor.segid, row)
+
+    merged = heapq.merge(*[tagged(c) for c in cursors])
+    for key, entries in itertools.groupby(merged, key=lambda e: e[0]):
+        yield key, [(segid, row) for (_, segid, row) in entries]
+
+
+def segids_array(segids):
+    return '{%s}' % ','.join(str(s) for s in segids)
+
+
+class StreamingCompare:
+    """
+    Checks for missing, duplicate and inconsistent rows given the merged
+    key groups of one catalog table; all_segids are the content ids of
+    the master and every primary segment.
+    """
+
+    def __init__(self, all_segids, key_len):
+        self.all_segids = sorted(all_segids)
+        self.key_len = key_len
+
+    def missing(self, groups):
+        """
+        Rows: key columns, segids (where the key is present), for every
+        key that is not present on the master and all segments.
+        """
+        for key, entries in groups:
+            present = sorted(set(segid for (segid, _) in entries))
+            if present != self.all_segids:
+                yield key + (segids_array(present),)
+
+    def duplicate(self, groups):
+        """
+        Rows: key columns, total, segids (that have total copies of the
+        key), for every key that is present more than once on a segment.
+        """
+        for key, entries in groups:
+            counts = {}
+            for (segid, _) in entries:
+                counts[segid] = counts.get(segid, 0) + 1
+
+            by_total = {}
+            for segid, total in counts.iteritems():
+                if total > 1:
+                    by_total.setdefault(total, []).append(segid)
+
+            for total in sorted(by_total):
+                yield key + (total, segids_array(sorted(by_total[total])))
+
+    def inconsistent(self, groups):
+        """
+        Rows: columns, segids, for every key present once on the master and
+        each segment whose columns differ between them.  Values held by more
+        than half of the segments are reported once with segids {NULL};
+        each other set of values is reported with the segments holding it.
+        """
+        nsegs = len(self.all_segids)
+        for key, entries in groups:
+            if len(entries) != nsegs:
+                continue
+
+            by_value = {}
+            for (segid, row) in entries:
+                by_value.setdefault(tuple(row[self.key_len:]), []).append(segid)
+            if len(by_value) == 1:
+                continue
+
+            rows = []
+            for value, segids in by_value.iteritems():
+                if len(segids) <= nsegs / 2.0:
+                    rows.append(value + (segids_array(sorted(segids)),))
+                else:
+                    rows.append(value + ('{NULL}',))
+            for row in sorted(rows, key=lambda r: r[-1]):
+                yield row
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Progress of the tables gpexpand is redistributing.
+
+ALTER TABLE ... SET WITH(REORGANIZE=TRUE) writes the table into new
+relfiles which are not in pg_class until it commits.  The bytes written
+so far are sampled by adding up, on every primary segment, the size of
+the files in the database directory that do not belong to any relation
+in pg_class and have been written to since the oldest table in progress
+was started.  When several tables of one database are in progress the
+bytes are attributed to them in proportion to their size.
+
+Relfiles in other tablespaces than the default one are not seen.  Files
+of other transactions that create or rewrite relations while the tables
+are redistributed are counted as progress.
+"""
+
+# run in utility mode on each primary segment, with the time the oldest
+# table in progress was started as the since parameter.  Mapped catalogs have relfilenode 0, so
+# pg_relation_filenode() is used to find the files of every relation.
+NEW_RELFILE_BYTES_SQL = """
+SELECT coalesce(sum(size), 0)
+FROM (SELECT file, (pg_stat_file(dir || '/' || file)).size, (pg_stat_file(dir || '/' || file)).modification
+      FROM (SELECT dir, pg_ls_dir(dir) AS file
+            FROM (SELECT 'base/' || oid AS dir FROM pg_database WHERE datname = current_database()) d) f
+      WHERE file ~ '^[0-9]+([.][0-9]+)?$') s
+WHERE modification >= %(since)s
+  AND split_part(file, '.', 1)::oid NOT IN (SELECT pg_relation_filenode(oid) FROM pg_class
+                                            WHERE pg_relation_filenode(oid) IS NOT NULL)
+"""
+
+
+def apportion(written, tables):
+    """
+    tables: {key: source bytes} of the tables in progress in one database
+    return: {key: bytes written}, splitting written in proportion to the
+            source bytes
+    """
+    total = sum(tables.itervalues())
+    if total == 0:
+        return dict((key, written / len(tables)) for key in tables)
+    return dict((key, written * nbytes / total) for key, nbytes in tables.iteritems())
+
+
+def table_progress(source_bytes, source_rows, bytes_written, elapsed):
+    """
+    return: (percent complete, bytes per second, rows per second, seconds
+            left or None)
+    """
+    bytes_written = min(bytes_written, source_bytes)
+    percent = 100.0 * bytes_written / source_bytes if source_bytes else 0.0
+    # it is not done until the ALTER TABLE commits
+    percent = min(percent, 99.9)
+    bytes_per_second = bytes_written / elapsed if elapsed > 0 else 0.0
+    rows_per_second = bytes_per_second * source_rows / source_bytes if source_bytes else 0.0
+    eta = None
+    if bytes_per_second > 0:
+        eta = (source_bytes - bytes_written) / bytes_per_second
+    return percent, bytes_per_second, rows_per_second, eta
+
+
+def format_bytes(nbytes):
+    for unit in ['bytes', 'kB', 'MB', 'GB']:
+        if abs(nbytes) < 1024:
+            return '%.1f %s' % (nbytes, unit)
+        nbytes /= 1024.0
+    return '%.1f TB' % nbytes
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return 'unknown'
+    seconds = int(seconds)
+    return '%d:%02d:%02d' % (seconds / 3600, seconds / 60 % 60, seconds % 60)
+
+
+def render_status(summary, tables):
+    """
+    summary: (name, value) rows of the gpexpand.expansion_progress view
+    tables: (dbname, fq_name, percent, bytes per second, rows per second,
+            seconds left, sampled) rows of gpexpand.expansion_table_progress
+    return: the lines of the gpexpand --status report
+    """
+    lines = ['Expansion progress']
+    for (name, value) in sorted(summary):
+        if name:
+            lines.append('  %-30s %s' % (name + ':', value))
+
+    throughput = sum(float(row[3] or 0) for row in tables)
+    rows = sum(float(row[4] or 0) for row in tables)
+    lines.append('  %-30s %s/s, %d rows/s' % ('Current throughput:', format_bytes(throughput), rows))
+
+    if tables:
+        lines.append('')
+        lines.append('Tables in progress')
+        lines.append('  %-50s %8s %12s %12s %10s' % ('Table', 'Done', 'Rate', 'Rows/s', 'ETA'))
+        for (dbname, fq_name, percent, bytes_per_second, rows_per_second, eta, sampled) in tables:
+            lines.append('  %-50s %7.1f%% %10s/s %12d %10s' % (
+                '%s.%s' % (dbname, fq_name), float(percent or 0), format_bytes(float(bytes_per_second or 0)),
+                float(rows_per_second or 0), format_seconds(eta)))
+    return lines
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""
+Decides which table gpexpand redistributes next.
+
+Tables are taken in rank order, and the largest first within a rank, so
+that a few very large tables do not end up running alone at the end of
+the expansion window while the other workers sit idle.  The rate at
+which tables were redistributed so far is used to estimate how long the
+remaining ones will take, which in turn is used to
+
+  * keep small tables from delaying a large table that is waiting for
+    room in the I/O budget (the total size of the tables being
+    redistributed at a time): a smaller table may only go ahead of it if
+    it is expected to finish before the large table could start anyway;
+
+  * skip tables that are not expected to finish before the end of the
+    window, in favour of smaller ones that are, since a redistribution
+    that is canceled at the end of the window is rolled back.
+"""
+
+import datetime
+
+
+class _Table:
+    def __init__(self, item, rank, nbytes, order):
+        self.item = item
+        self.rank = rank
+        self.nbytes = nbytes
+        self.order = order
+        self.started = None
+
+    def sort_key(self):
+        return (self.rank, -self.nbytes, self.order)
+
+
+class RedistributionScheduler:
+
+    def __init__(self, num_workers, io_budget=None, end_time=None, now=datetime.datetime.now):
+        """
+        io_budget: the most bytes to redistribute at a time, or None
+        end_time: the end of the expansion window, or None
+        """
+        self.num_workers = num_workers
+        self.io_budget = io_budget
+        self.end_time = end_time
+        self.now = now
+        self.pending = []
+        self.running = {}
+        self.bytes_done = 0
+        self.seconds_spent = 0.0
+
+    def add(self, item, rank, nbytes):
+        self.pending.append(_Table(item, rank or 0, int(nbytes or 0), len(self.pending)))
+        self.pending.sort(key=_Table.sort_key)
+
+    def rate(self):
+        """
+        return: bytes per second that one worker redistributes, or None
+                before any table of a known size has been redistributed
+        """
+        if self.bytes_done == 0 or self.seconds_spent <= 0:
+            return None
+        return self.bytes_done / self.seconds_spent
+
+    def estimate(self, nbytes):
+        """
+        return: estimated seconds to redistribute nbytes, or None
+        """
+        rate = self.rate()
+        if rate is None:
+            return None
+        return nbytes / rate
+
+    def _bytes_in_flight(self):
+        return sum(table.nbytes for table in self.running.itervalues())
+
+    def _seconds_left(self, table, now):
+        estimate = self.estimate(table.nbytes)
+        if estimate is None:
+            return None
+        return max(0, estimate - _seconds(now - table.started))
+
+    def _shadow_time(self, blocked, now):
+        """
+        return: seconds until enough of the running tables are expected to
+                have finished for blocked to fit in the I/O budget, or None
+                if that cannot be estimated yet
+        """
+        in_flight = self._bytes_in_flight()
+        for table in sorted(self.running.itervalues(), key=lambda t: self._seconds_left(t, now)):
+            seconds = self._seconds_left(table, now)
+            if seconds is None:
+                return None
+            in_flight -= table.nbytes
+            if in_flight + blocked.nbytes <= self.io_budget:
+                return seconds
+        return 0
+
+    def next_table(self):
+        """
+        return: the item of the table to redistribute next, or None if no
+                table should be started now
+        """
+        if len(self.running) >= self.num_workers:
+            return None
+
+        now = self.now()
+        window = _seconds(self.end_time - now) if self.end_time else None
+        in_flight = self._bytes_in_flight()
+        shadow = None
+        for table in self.pending:
+            estimate = self.estimate(table.nbytes)
+            if window is not None and estimate is not None and estimate > window:
+                continue
+
+            fits = (self.io_budget is None or not self.running or
+                    in_flight + table.nbytes <= self.io_budget)
+            if shadow is None:
+                if fits:
+                    return self._start(table, now)
+                shadow = self._shadow_time(table, now)
+                if shadow is None:
+                    # nothing is known about how long anything takes, so
+                    # nothing may jump ahead of the blocked table
+                    return None
+            elif fits and estimate is not None and estimate <= shadow:
+                return self._start(table, now)
+        return None
+
+    def _start(self, table, now):
+        self.pending.remove(table)
+        table.started = now
+        self.running[id(table.item)] = table
+        return table.item
+
+    def finished(self, item, expanded=True):
+        """
+        Record that item is done; only tables that were actually
+        redistributed count towards the rate.
+        """
+        table = self.running.pop(id(item))
+        if expanded and table.nbytes > 0:
+            self.bytes_done += table.nbytes
+            self.seconds_spent += max(_seconds(self.now() - table.started), 0.001)
+
+    def is_running(self):
+        return bool(self.running)
+
+    def has_pending(self):
+        return bool(self.pending)
+
+    def bytes_left(self):
+        return sum(table.nbytes for table in self.pending) + self._bytes_in_flight()
+
+    def eta(self):
+        """
+        return: estimated seconds until all tables are redistributed, with
+                all workers busy, or None if it cannot be estimated yet
+        """
+        rate = self.rate()
+        if rate is None:
+            return None
+        return self.bytes_left() / (rate * self.num_workers)
+
+
+def _seconds(delta):
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1e6
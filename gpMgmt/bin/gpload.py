@@ -18,6 +18,11 @@ Options:
     -l logfile: log output to logfile
     --no_auto_trans: do not wrap gpload in transaction
     --gpfdist_timeout timeout: gpfdist timeout value
+    --max_connections n: load at most n of the LOADS at a time
+    --progress_interval seconds: how often to report progress, 0 for never
+    --stream statefile: keep running, loading new input files in batches
+    --stream_interval seconds: how often to look for new input files
+    --stream_batch n: load at most n new input files at a time
     --version: print version number and exit
     -?: help
 '''
@@ -49,7 +54,10 @@ except Exception, e:
     sys.exit(2)
 
 import hashlib
-import datetime,getpass,os,signal,socket,subprocess,threading,time,traceback,re
+import datetime,getpass,glob,os,signal,socket,subprocess,threading,time,traceback,re
+import copy
+import json
+import Queue
 import uuid
 import socket
 
@@ -86,7 +94,9 @@ valid_tokens = {
     "host": {'parse_children': True, 'parent': None},
     "port": {'parse_children': True, 'parent': [None, "source"]},
     "password": {'parse_children': True, 'parent': None},
-    "gpload": {'parse_children': True, 'parent': None},
+    "loads": {'parse_children': True, 'parent': None},
+    "gpfdist_directory": {'parse_children': True, 'parent': None},
+    "gpload": {'parse_children': True, 'parent': [None, "loads"]},
     "input": {'parse_children': True, 'parent': "gpload"},
     "source": {'parse_children': True, 'parent': "input"},
     "local_hostname": {'parse_children': False, 'parent': "source"},
@@ -796,81 +806,354 @@ class CatThread(threading.Thread):
 
 class Progress(threading.Thread):
     """
-    Determine our progress from the gpfdist daemon
+    Determine our progress from the gpfdist daemons. Every interval seconds
+    all of them are asked for their status at the same time, and the amount
+    transferred, the transfer rate and the estimated time left are logged.
+    A daemon that does not answer is counted and skipped, it never stops
+    the thread.
     """
-    def __init__(self,gpload,ports):
+    def __init__(self,gpload,ports,interval=10,row_size=None,expected_bytes=0):
         threading.Thread.__init__(self)
+        self.daemon = True
         self.gpload = gpload
         self.ports = ports
-        self.number = 0
-        self.condition = threading.Condition()
+        self.interval = interval
+        self.row_size = row_size
+        self.expected_bytes = expected_bytes
+        self.timeout = 5
+        self.started = time.time()
+        self.last_time = self.started
+        self.last_bytes = 0
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.stats = dict((port, {'read_bytes': 0, 'total_bytes': 0,
+                                  'sessions': 0, 'errors': 0})
+                          for port in ports)
 
     def get(self,port):
         """
         Connect to gpfdist and issue an HTTP query. No need to do this with
         httplib as the transaction is extremely simple
         """
-        addrinfo = socket.getaddrinfo('localhost', port)
+        addrinfo = socket.getaddrinfo('localhost', port, 0, socket.SOCK_STREAM)
         s = socket.socket(addrinfo[0][0],socket.SOCK_STREAM)
-        s.connect(('localhost',port))
-        s.sendall('GET gpfdist/status HTTP/1.0\r\n\r\n')
-        f = s.makefile()
-        read_bytes = -1
-        total_bytes = -1
-        total_sessions = -1
-        for line in f:
-            self.gpload.log(self.gpload.DEBUG, "gpfdist stat: %s" % \
-                        line.strip('\n'))
-            a = line.split(' ')
-            if not a:
-                continue
-            if a[0]=='read_bytes':
-                read_bytes = int(a[1])
-            elif a[0]=='total_bytes':
-                total_bytes = int(a[1])
-            elif a[0]=='total_sessions':
-                total_sessions = int(a[1])
-        s.close()
-        f.close()
+        s.settimeout(self.timeout)
+        try:
+            s.connect(addrinfo[0][4])
+            s.sendall('GET gpfdist/status HTTP/1.0\r\n\r\n')
+            f = s.makefile()
+            read_bytes = -1
+            total_bytes = -1
+            total_sessions = -1
+            for line in f:
+                self.gpload.log(self.gpload.DEBUG, "gpfdist stat: %s" % \
+                            line.strip('\n'))
+                a = line.split(' ')
+                if len(a) < 2:
+                    continue
+                if a[0]=='read_bytes':
+                    read_bytes = int(a[1])
+                elif a[0]=='total_bytes':
+                    total_bytes = int(a[1])
+                elif a[0]=='total_sessions':
+                    total_sessions = int(a[1])
+            f.close()
+        finally:
+            s.close()
         return read_bytes,total_bytes,total_sessions
 
-    def get1(self):
+    def poll(self):
+        """
+        Query every gpfdist at the same time, and update the statistics
+        """
+        results = {}
+
+        def query(port):
+            try:
+                results[port] = self.get(port)
+            except (socket.error, ValueError), e:
+                self.gpload.log(self.gpload.DEBUG, "gpfdist on port %d did not report status: %s" % (port, e))
+
+        threads = [threading.Thread(target=query, args=(port,)) for port in self.ports]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join(self.timeout)
+
+        self.lock.acquire()
+        try:
+            for port in self.ports:
+                a = results.get(port)
+                stat = self.stats[port]
+                if a is None:
+                    stat['errors'] += 1
+                    continue
+                if a[0] != -1:
+                    stat['read_bytes'] = a[0]
+                if a[1] != -1:
+                    stat['total_bytes'] = a[1]
+                if a[2] != -1:
+                    stat['sessions'] = a[2]
+        finally:
+            self.lock.release()
+
+    def totals(self):
+        self.lock.acquire()
+        try:
+            read_bytes = sum(stat['read_bytes'] for stat in self.stats.values())
+            total_bytes = sum(stat['total_bytes'] for stat in self.stats.values())
+        finally:
+            self.lock.release()
+        return read_bytes, max(total_bytes, self.expected_bytes)
+
+    def report(self):
         """
-        Parse gpfdist output
+        Log one progress line, with the rate since the previous one
         """
-        read_bytes = 0
-        total_bytes = 0
+        now = time.time()
+        read_bytes, total_bytes = self.totals()
+        rate = max(read_bytes - self.last_bytes, 0) / max(now - self.last_time, 0.001)
+        self.last_time = now
+        self.last_bytes = read_bytes
+
+        msg = 'transferred %s of %s (%s/s' % (bytestr(read_bytes), bytestr(total_bytes), bytestr(int(rate)))
+        if self.row_size:
+            msg += ', about %d rows/s' % (rate / self.row_size)
+        if rate > 0 and total_bytes > read_bytes:
+            msg += ', %d seconds left' % ((total_bytes - read_bytes) / rate)
+        msg += ')'
+        self.gpload.log(self.gpload.INFO, msg)
+
+    def summary(self):
+        """
+        Final statistics, per gpfdist and in total, as a dictionary that can
+        be written out as JSON
+        """
+        elapsed = max(time.time() - self.started, 0.001)
+        read_bytes, total_bytes = self.totals()
+        summary = {'elapsed_seconds': round(elapsed, 2),
+                   'read_bytes': read_bytes,
+                   'total_bytes': total_bytes,
+                   'bytes_per_second': int(read_bytes / elapsed),
+                   'gpfdist': []}
+        if self.row_size:
+            summary['estimated_rows'] = int(read_bytes / self.row_size)
+            summary['estimated_rows_per_second'] = int(read_bytes / self.row_size / elapsed)
         for port in self.ports:
-            a = self.get(port)
-            if a[2]<1:
-                return
-            if a[0]!=-1:
-                read_bytes += a[0]
-            if a[1]!=-1:
-                total_bytes += a[1]
-        self.gpload.log(self.gpload.INFO,'transferred %s of %s' % \
-            (bytestr(read_bytes),bytestr(total_bytes)))
+            stat = self.stats[port]
+            summary['gpfdist'].append({'port': port,
+                                       'read_bytes': stat['read_bytes'],
+                                       'total_bytes': stat['total_bytes'],
+                                       'sessions': stat['sessions'],
+                                       'bytes_per_second': int(stat['read_bytes'] / elapsed),
+                                       'failed_polls': stat['errors']})
+        return summary
+
+    def stop(self):
+        """
+        Stop polling, take a last look at the daemons and log the summary
+        """
+        self.stopped.set()
+        self.join(self.timeout * 2)
+        self.poll()
+        self.report()
+        self.gpload.log(self.gpload.INFO, 'transfer summary: %s' % json.dumps(self.summary(), sort_keys=True))
 
     def run(self):
         """
         Thread worker
         """
+        while not self.stopped.wait(self.interval):
+            self.poll()
+            self.report()
+
+class LoadWorker(threading.Thread):
+    """
+    Runs the table loads of a multi-table control file, one after the
+    other, over a single database connection of its own.
+    """
+    def __init__(self, gpload, loaders, db=None):
+        threading.Thread.__init__(self)
+        self.gpload = gpload
+        self.loaders = loaders
+        self.db = db
+
+    def run(self):
         while 1:
             try:
-                self.condition.acquire()
-                n = self.number
-                self.condition.release()
-                self.get1()
-                if n:
-                    self.gpload.log(self.gpload.DEBUG, "gpfdist status thread told to stop")
-                    self.condition.acquire()
-                    self.condition.notify()
-                    self.condition.release()
-                    break
-            except socket.error, e:
-                self.gpload.log(self.gpload.DEBUG, "got socket exception: %s" % e)
+                loader = self.loaders.get_nowait()
+            except Queue.Empty:
                 break
-            time.sleep(1)
+            loader.db = self.db
+            loader.load_table()
+            self.db = loader.db
+        if self.db != None:
+            self.db.close()
+            self.db = None
+
+class StreamState:
+    """
+    The input files of a stream mode load. Files matching the input patterns
+    of each source are loaded once they have stopped changing. The batch to
+    load is linked into a directory per source, which the gpfdist of that
+    source serves, so the external table location never changes.
+
+    The state file records how many bytes of each file have been loaded.
+    When a loaded file grows, only the bytes appended to it are loaded. A
+    loaded file that is rewritten instead, so that it did not grow but has
+    changed, is not loaded again; a warning is given.
+
+    Loaded files are recorded in the state file only after their batch has
+    been committed: a file is loaded at least once, and again after a
+    restart if gpload stopped between the commit and the record.
+    """
+    EMPTY_FILE = 'gpload_empty'
+
+    def __init__(self, state_file, sources, warn=None):
+        """
+        @param state_file: record of loaded files
+        @param sources: list of the file patterns of each source
+        @param warn: called with a message for every rewritten file
+        """
+        self.state_file = state_file
+        self.batch_dir = state_file + '.batch'
+        self.sources = sources
+        self.warn = warn
+        self.seen = {}
+        self.rejected = {}
+        self.loaded = self.read_state()
+
+    def read_state(self):
+        """
+        Returns {path: (size, mtime)} of the part of every file that has
+        been loaded; the last record of a file is the current one.
+        """
+        loaded = {}
+        if not os.path.exists(self.state_file):
+            return loaded
+        f = open(self.state_file)
+        try:
+            for line in f:
+                size, mtime, path = line.rstrip('\n').split('\t', 2)
+                loaded[path] = (int(size), int(mtime))
+        finally:
+            f.close()
+        return loaded
+
+    def source_dir(self, index):
+        return os.path.join(self.batch_dir, str(index))
+
+    def prepare(self):
+        """
+        Create an empty batch directory for every source. Each holds an empty
+        file, so that the external table can be read when a source has no
+        files in a batch.
+        """
+        for index in range(len(self.sources)):
+            directory = self.source_dir(index)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+            open(os.path.join(directory, self.EMPTY_FILE), 'w').close()
+
+    def scan(self):
+        """
+        Returns (source index, path, offset, size, mtime) for every file
+        with bytes from offset to size that are not loaded yet, and that has
+        not changed since the previous scan.
+        """
+        ready = []
+        seen = {}
+        for index, patterns in enumerate(self.sources):
+            for pattern in patterns:
+                for path in sorted(glob.glob(pattern)):
+                    path = os.path.abspath(path)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    if not os.path.isfile(path):
+                        continue
+                    key = (st.st_size, int(st.st_mtime))
+                    seen[path] = key
+                    if self.seen.get(path) != key:
+                        continue
+                    loaded = self.loaded.get(path)
+                    if loaded is None:
+                        ready.append((index, path, 0) + key)
+                        continue
+                    if loaded == key:
+                        continue
+                    offset = loaded[0]
+                    if st.st_size <= offset:
+                        if self.rejected.get(path) != key and self.warn:
+                            self.warn('%s has been rewritten since it was loaded, not loading it again' % path)
+                        self.rejected[path] = key
+                        continue
+                    ready.append((index, path, offset) + key)
+        self.seen = seen
+        return ready
+
+    def next_batch(self, max_files):
+        batch = []
+        paths = set()
+        for f in self.scan():
+            # a file matching more than one source is loaded by the first
+            if f[1] not in paths and len(batch) < max_files:
+                batch.append(f)
+                paths.add(f[1])
+        return batch
+
+    def stage(self, batch):
+        """
+        Link the new files of a batch into the directories of their sources,
+        and copy the bytes appended to the files loaded before.
+        """
+        for i, (index, path, offset, size, mtime) in enumerate(batch):
+            staged = os.path.join(self.source_dir(index), '%06d_%s' % (i, os.path.basename(path)))
+            if offset == 0:
+                os.symlink(path, staged)
+                continue
+            src = open(path, 'rb')
+            dst = open(staged, 'wb')
+            try:
+                src.seek(offset)
+                left = size - offset
+                while left > 0:
+                    data = src.read(min(left, 1 << 20))
+                    if not data:
+                        break
+                    dst.write(data)
+                    left -= len(data)
+            finally:
+                src.close()
+                dst.close()
+
+    def commit(self, batch):
+        """
+        Record the files of a batch as loaded, then unlink them
+        """
+        f = open(self.state_file, 'a')
+        try:
+            for index, path, offset, size, mtime in batch:
+                f.write('%d\t%d\t%s\n' % (size, mtime, path))
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+        for index, path, offset, size, mtime in batch:
+            self.loaded[path] = (size, mtime)
+        self.unstage()
+
+    def unstage(self):
+        for index in range(len(self.sources)):
+            directory = self.source_dir(index)
+            for name in os.listdir(directory):
+                if name != self.EMPTY_FILE:
+                    os.remove(os.path.join(directory, name))
+
 def cli_help():
     help_path = os.path.join(sys.path[0], '..', 'docs', 'cli_help', EXECNAME +
                              '_help');
@@ -907,6 +1190,74 @@ def quote_no_slash(a):
     """
     return "'"+a.replace("'","''")+"'"
 
+def gpfdist_common_directory(files):
+    """
+    Returns the deepest directory that contains all of files, which may be
+    glob patterns.
+    """
+    common = None
+    for f in files:
+        parts = os.path.abspath(f).split(os.sep)[:-1]
+        for i, part in enumerate(parts):
+            if glob.has_magic(part):
+                parts = parts[:i]
+                break
+        if common is None:
+            common = parts
+        else:
+            i = 0
+            while i < min(len(common), len(parts)) and common[i] == parts[i]:
+                i += 1
+            common = common[:i]
+    return os.sep.join(common) or os.sep
+
+def gpfdist_directory(files, allowed=None):
+    """
+    Returns the directory for a gpfdist serving all of files, which may be
+    glob patterns, with -d, or None if they must be served with -f.
+
+    gpfdist does no authentication and serves everything under -d, so a
+    directory is only used when it is under allowed, the GPFDIST_DIRECTORY
+    of the control file.  Even a directory the files are all directly in
+    may be /tmp or a home directory holding other files.
+    """
+    if allowed:
+        allowed = os.path.abspath(allowed)
+        directory = gpfdist_common_directory(files)
+        if directory == allowed or directory.startswith(allowed.rstrip(os.sep) + os.sep):
+            return directory
+    return None
+
+def average_row_size(files, sample_size=1<<20):
+    """
+    Estimates the size of a row from the start of the first of files (glob
+    patterns) that can be read, or returns None.
+    """
+    for pattern in files:
+        for f in sorted(glob.glob(pattern)):
+            if not os.path.isfile(f):
+                continue
+            try:
+                fd = open(f, 'rb')
+                try:
+                    data = fd.read(sample_size)
+                finally:
+                    fd.close()
+            except IOError:
+                continue
+            if data.count('\n'):
+                return len(data) / float(data.count('\n'))
+    return None
+
+def rowcount(result):
+    """
+    Number of rows affected, as returned by pg for an INSERT or UPDATE
+    """
+    try:
+        return int(result)
+    except (TypeError, ValueError):
+        return 0
+
 def splitPgpassLine(a):
     """
     If the user has specified a .pgpass file, we'll have to parse it. We simply
@@ -1124,11 +1475,17 @@ class gpload:
     """
 
     def __init__(self,argv):
+        self.logPrefix = ''
         self.threads = [] # remember threads so that we can join() against them
         self.exitValue = 0
         self.options = options()
         self.options.h = None
         self.options.gpfdist_timeout = None
+        self.options.max_connections = 4
+        self.options.progress_interval = 10
+        self.options.stream = None
+        self.options.stream_interval = 60
+        self.options.stream_batch = 100
         self.options.p = None
         self.options.U = None
         self.options.W = False
@@ -1143,23 +1500,13 @@ class gpload:
         self.ERROR = 1
         self.options.qv = self.INFO
         self.options.l = None
-        self.formatOpts = ""
         self.startTimestamp = time.time()
-        self.error_table = False
+        self.loads = None
+        self.reportProgress = True
         seenv = False
         seenq = False
 
-        # Create Temp and External table names. However external table name could
-        # get overwritten with another name later on (see create_external_table_name).
-        # MPP-20927: gpload external table name problem. We use uuid to avoid
-        # external table name confliction.
-        self.unique_suffix = str(uuid.uuid1()).replace('-', '_')
-        self.staging_table_name = 'temp_staging_gpload_' + self.unique_suffix
-        self.extTableName  = 'ext_gpload_' + self.unique_suffix
-
-        # SQL to run in order to undo our temporary work
-        self.cleanupSql = []
-        self.distkey = None
+        self.init_table_state()
         configFilename = None
         while argv:
             try:
@@ -1209,6 +1556,21 @@ class gpload:
                     elif argv[0]=='--no_auto_trans':
                         self.options.no_auto_trans = True
                         argv = argv[1:]
+                    elif argv[0]=='--max_connections':
+                        self.options.max_connections = int(argv[1])
+                        argv = argv[2:]
+                    elif argv[0]=='--progress_interval':
+                        self.options.progress_interval = int(argv[1])
+                        argv = argv[2:]
+                    elif argv[0]=='--stream':
+                        self.options.stream = argv[1]
+                        argv = argv[2:]
+                    elif argv[0]=='--stream_interval':
+                        self.options.stream_interval = int(argv[1])
+                        argv = argv[2:]
+                    elif argv[0]=='--stream_batch':
+                        self.options.stream_batch = int(argv[1])
+                        argv = argv[2:]
                     elif argv[0]=='-?':
                         usage()
                     else:
@@ -1272,6 +1634,10 @@ class gpload:
                 self.control_file_error("configuration file must begin with a mapping")
 
             yaml_walk(self, y.value, [])
+
+            self.loads = self.getconfig('loads', list, None)
+            if self.loads is not None and self.getconfig('gpload', None, None) is not None:
+                self.control_file_error("LOADS and GPLOAD cannot both be specified")
         except yaml.scanner.ScannerError,e:
             self.log(self.ERROR, "configuration file error: %s, line %s" % \
                 (e.problem, e.problem_mark.line))
@@ -1291,9 +1657,37 @@ class gpload:
 
         f.close()
         self.subprocesses = []
+        self.ports = []
         self.log(self.INFO,'gpload session started ' + \
                  datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
 
+    def init_table_state(self):
+        """
+        Reset everything that belongs to loading one output table
+        """
+        self.formatOpts = ""
+        self.error_table = False
+
+        # Create Temp and External table names. However external table name could
+        # get overwritten with another name later on (see create_external_table_name).
+        # MPP-20927: gpload external table name problem. We use uuid to avoid
+        # external table name confliction.
+        self.unique_suffix = str(uuid.uuid1()).replace('-', '_')
+        self.staging_table_name = 'temp_staging_gpload_' + self.unique_suffix
+        self.extTableName  = 'ext_gpload_' + self.unique_suffix
+
+        # SQL to run in order to undo our temporary work
+        self.cleanupSql = []
+        self.distkey = None
+        self.distkeyColumns = None
+        self.externalTableReady = False
+        self.stagingTableReady = False
+        self.streamBatches = 0
+        self.rowsInserted = 0
+        self.rowsUpdated  = 0
+        self.errorCount = 0
+        self.phaseTimes = []
+
     def control_file_warning(self, msg):
         self.log(self.WARN, "A gpload control file processing warning occurred. %s" % msg)
 
@@ -1322,7 +1716,7 @@ class gpload:
             t = time.localtime()
             str = '|'.join(
                        [datetime.datetime.today().strftime('%Y-%m-%d %H:%M:%S'),
-                        self.elevel2str(level), a]) + '\n'
+                        self.elevel2str(level), self.logPrefix + a]) + '\n'
 
             str = str.encode('utf-8')
         except Exception, e:
@@ -1409,7 +1803,14 @@ class gpload:
         """
         Configure ourselves
         """
+        if not self.loads:
+            self.read_output_config()
+
+        # Precendence for configuration: command line > config file > env
+        # variable
+        self.read_connection_config()
 
+    def read_output_config(self):
         # ensure output is of type list
         self.getconfig('gpload:output', list)
 
@@ -1426,9 +1827,13 @@ class gpload:
            self.schema = None
            self.table  = schemaTableList[0]
 
-        # Precendence for configuration: command line > config file > env
-        # variable
+        if self.getconfig('gpload:input:error_table', unicode, None):
+            self.error_table = True
+            self.log(self.WARN,
+                        "ERROR_TABLE is not supported. " +
+                        "We will set LOG_ERRORS and REUSE_TABLES to True for compatibility.")
 
+    def read_connection_config(self):
         # host to connect to
         if not self.options.h:
             self.options.h = self.getconfig('host', unicode, None)
@@ -1476,12 +1881,6 @@ class gpload:
             # like libpq, just inherit USER
             self.options.d = self.options.U
 
-        if self.getconfig('gpload:input:error_table', unicode, None):
-            self.error_table = True
-            self.log(self.WARN,
-                        "ERROR_TABLE is not supported. " +
-                        "We will set LOG_ERRORS and REUSE_TABLES to True for compatibility.")
-
     def gpfdist_port_options(self, name, availablePorts, popenList):
         """
         Adds gpfdist -p / -P port options to popenList based on port and port_range in YAML file.
@@ -1520,19 +1919,30 @@ class gpload:
         popenList.append(str(endPort))
 
 
-    def gpfdist_filenames(self, name, popenList):
+    def gpfdist_files(self, name):
         """
-        Adds gpfdist -f filenames to popenList.
         Raises errors if YAML file option is invalid.
 
         @param name: input source name from YAML file.
-        @param popenList: gpfdist options (updated)
         @return: list of files names
         """
         file = self.getconfig(name+':file',list)
         for i in file:
             if type(i)!= unicode and type(i) != str:
                 self.control_file_error(name + ":file must be a YAML sequence of strings")
+        return file
+
+
+    def gpfdist_filenames(self, name, popenList):
+        """
+        Adds gpfdist -f filenames to popenList.
+        Raises errors if YAML file option is invalid.
+
+        @param name: input source name from YAML file.
+        @param popenList: gpfdist options (updated)
+        @return: list of files names
+        """
+        file = self.gpfdist_files(name)
         popenList.append('-f')
         popenList.append('"'+' '.join(file)+'"')
         return file
@@ -1630,15 +2040,12 @@ class gpload:
                 self.control_file_error("CERTIFICATES_PATH is specified while SSL is not specified as true")
 
 
-    def start_gpfdists(self):
+    def gpfdist_sources(self):
         """
-        Start gpfdist daemon(s)
+        Return (name, local_hostname) for every input source in the YAML file.
         """
-        self.locations = []
-        self.ports = []
+        sources = []
         sourceIndex = 0
-        availablePorts = set(xrange(1,65535))
-        found_source = False
 
         self.getconfig('gpload:input', list)
 
@@ -1648,7 +2055,6 @@ class gpload:
             a = self.getconfig(name,None,None)
             if not a:
                 break
-            found_source = True
             local_hostname = self.getconfig(name+':local_hostname', list, False)
 
             # do default host, the current one
@@ -1660,7 +2066,120 @@ class gpload:
                     local_hostname = [socket.getfqdn()]
                 else:
                     local_hostname = [socket.gethostname()]
+            sources.append((name, local_hostname))
+
+        if not sources:
+            self.control_file_error("configuration file must contain source definition")
+        return sources
+
+
+    def start_gpfdist(self, popenList):
+        """
+        Start a gpfdist daemon and wait for it to report its port.
+
+        @param popenList: gpfdist command line
+        @return: port gpfdist is serving on
+        """
+        try:
+            self.log(self.LOG, 'trying to run %s' % ' '.join(popenList))
+            cfds = True
+            if platform.system() in ['Windows', 'Microsoft']: # not supported on win32
+                cfds = False
+                cmd = ' '.join(popenList)
+                needshell = False
+            else:
+                srcfile = None
+                if os.environ.get('GPHOME_LOADERS'):
+                    srcfile = os.path.join(os.environ.get('GPHOME_LOADERS'),
+                                       'greenplum_loaders_path.sh')
+                elif os.environ.get('GPHOME'):
+                    srcfile = os.path.join(os.environ.get('GPHOME'),
+                                       'greenplum_path.sh')
+
+                if (not (srcfile and os.path.exists(srcfile))):
+                    self.log(self.ERROR, 'cannot find greenplum environment ' +
+                                'file: environment misconfigured')
+
+                cmd = 'source %s ; exec ' % srcfile
+                cmd += ' '.join(popenList)
+                needshell = True
+
+            a = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE,
+                                 close_fds=cfds, shell=needshell)
+            self.subprocesses.append(a)
+        except Exception, e:
+            self.log(self.ERROR, "could not run %s: %s" % \
+                            (' '.join(popenList), str(e)))
+
+        """
+        Reading from stderr and stdout on a Popen object can result in a dead lock if done at the same time.
+        Create a lock to share when reading stderr and stdout from gpfdist.
+        """
+        readLock = threading.Lock()
+
+        # get all the output from the daemon(s)
+        t = CatThread(self,a.stderr, readLock)
+        t.start()
+        self.threads.append(t)
+
+        while 1:
+            readLock.acquire()
+            line = a.stdout.readline()
+            readLock.release()
+            if line=='':
+                self.log(self.ERROR,'failed to start gpfdist: ' +
+                         'gpfdist command line: ' + ' '.join(popenList))
+
+            line = line.strip('\n')
+            self.log(self.LOG,'gpfdist says: ' + line)
+            if (line.startswith('Serving HTTP on port ') or line.startswith('Serving HTTPS on port ')):
+                port = int(line[21:line.index(',')])
+                break
+
+        self.log(self.INFO, 'started %s' % ' '.join(popenList))
+        self.log(self.LOG,'gpfdist is running on port %d'%port)
+        t = CatThread(self,a.stdout,readLock)
+        t.start()
+        self.threads.append(t)
+        return port
+
+
+    def gpfdist_locations(self, name, local_hostname, port, file, fragment):
+        """
+        Return the external table locations for a source served by the
+        gpfdist daemon on port.
+        """
+        locations = []
+        ssl = self.getconfig('gpload:input:source:ssl', bool, False)
+        if ssl:
+            protocol = 'gpfdists'
+        else:
+            protocol = 'gpfdist'
+
+        for l in local_hostname:
+            if type(l) != str and type(l) != unicode:
+                self.control_file_error(name + ":local_hostname must be a YAML sequence of strings")
+            l = str(l)
+            sep = ''
+            if file[0] != '/':
+                sep = '/'
+            # MPP-13617
+            if ':' in l:
+                l = '[' + l + ']'
+            locations.append('%s://%s:%d%s%s%s' % (protocol, l, port, sep, '%20'.join(file), fragment))
+        return locations
+
+
+    def start_gpfdists(self):
+        """
+        Start gpfdist daemon(s)
+        """
+        self.locations = []
+        self.ports = []
+        availablePorts = set(xrange(1,65535))
 
+        for name, local_hostname in self.gpfdist_sources():
             # build gpfdist parameters
             popenList = ['gpfdist']
             self.gpfdist_ssl(popenList)
@@ -1671,91 +2190,74 @@ class gpload:
             self.gpfdist_max_line_length(popenList)
             fragment = self.gpfdist_transform(popenList)
 
-            try:
-                self.log(self.LOG, 'trying to run %s' % ' '.join(popenList))
-                cfds = True
-                if platform.system() in ['Windows', 'Microsoft']: # not supported on win32
-                    cfds = False
-                    cmd = ' '.join(popenList)
-                    needshell = False
-                else:
-                    srcfile = None
-                    if os.environ.get('GPHOME_LOADERS'):
-                        srcfile = os.path.join(os.environ.get('GPHOME_LOADERS'),
-                                           'greenplum_loaders_path.sh')
-                    elif os.environ.get('GPHOME'):
-                        srcfile = os.path.join(os.environ.get('GPHOME'),
-                                           'greenplum_path.sh')
-
-                    if (not (srcfile and os.path.exists(srcfile))):
-                        self.log(self.ERROR, 'cannot find greenplum environment ' +
-                                    'file: environment misconfigured')
-
-                    cmd = 'source %s ; exec ' % srcfile
-                    cmd += ' '.join(popenList)
-                    needshell = True
-
-                a = subprocess.Popen(cmd, stdout=subprocess.PIPE,
-                                     stderr=subprocess.PIPE,
-                                     close_fds=cfds, shell=needshell)
-                self.subprocesses.append(a)
-            except Exception, e:
-                self.log(self.ERROR, "could not run %s: %s" % \
-                                (' '.join(popenList), str(e)))
+            port = self.start_gpfdist(popenList)
+            if port in availablePorts:
+                availablePorts.remove(port)
+            self.ports.append(port)
+            self.locations.extend(self.gpfdist_locations(name, local_hostname, port, file, fragment))
 
-            """
-            Reading from stderr and stdout on a Popen object can result in a dead lock if done at the same time.
-            Create a lock to share when reading stderr and stdout from gpfdist.
-            """
-            readLock = threading.Lock()
+    def start_shared_gpfdists(self, loaders):
+        """
+        Start the gpfdist daemons for all the LOADS. Sources with the same
+        gpfdist options share one daemon when their files are all under
+        GPFDIST_DIRECTORY; the daemon serves the directory they have in
+        common, so each source gets a location per file. Otherwise each
+        source gets its own daemon serving just its files.
+        """
+        allowed = self.getconfig('gpfdist_directory', unicode, None, returnOriginal=True)
+        self.ports = []
+        availablePorts = set(xrange(1,65535))
+        daemons = {}
+        daemonOrder = []
+
+        for loader in loaders:
+            loader.locations = []
+            loader.ports = []
+            for name, local_hostname in loader.gpfdist_sources():
+                popenList = ['gpfdist']
+                loader.gpfdist_ssl(popenList)
+                loader.gpfdist_port_options(name, availablePorts, popenList)
+                file = loader.gpfdist_files(name)
+                loader.gpfdist_timeout_options(popenList)
+                loader.gpfdist_verbose_options(popenList)
+                loader.gpfdist_max_line_length(popenList)
+                fragment = loader.gpfdist_transform(popenList)
+
+                key = tuple(popenList)
+                if key not in daemons:
+                    daemons[key] = []
+                    daemonOrder.append(key)
+                daemons[key].append((loader, name, local_hostname, file, fragment))
+
+        for key in daemonOrder:
+            sources = daemons[key]
+            directory = None
+            if len(sources) > 1:
+                directory = gpfdist_directory([f for source in sources for f in source[3]], allowed)
+            if directory is None:
+                for loader, name, local_hostname, file, fragment in sources:
+                    popenList = list(key) + ['-f', '"'+' '.join(file)+'"']
+                    port = self.start_gpfdist(popenList)
+                    if port in availablePorts:
+                        availablePorts.remove(port)
+                    self.ports.append(port)
+                    loader.ports.append(port)
+                    loader.locations.extend(loader.gpfdist_locations(name, local_hostname, port, file, fragment))
+                continue
 
-            # get all the output from the daemon(s)
-            t = CatThread(self,a.stderr, readLock)
-            t.start()
-            self.threads.append(t)
+            popenList = list(key) + ['-d', directory]
 
-            while 1:
-                readLock.acquire()
-                line = a.stdout.readline()
-                readLock.release()
-                if line=='':
-                    self.log(self.ERROR,'failed to start gpfdist: ' +
-                             'gpfdist command line: ' + ' '.join(popenList))
-
-                line = line.strip('\n')
-                self.log(self.LOG,'gpfdist says: ' + line)
-                if (line.startswith('Serving HTTP on port ') or line.startswith('Serving HTTPS on port ')):
-                    port = int(line[21:line.index(',')])
-                    break
-
-            self.log(self.INFO, 'started %s' % ' '.join(popenList))
-            self.log(self.LOG,'gpfdist is running on port %d'%port)
+            port = self.start_gpfdist(popenList)
             if port in availablePorts:
                 availablePorts.remove(port)
             self.ports.append(port)
-            t = CatThread(self,a.stdout,readLock)
-            t.start()
-            self.threads.append(t)
 
-            ssl = self.getconfig('gpload:input:source:ssl', bool, False)
-            if ssl:
-                protocol = 'gpfdists'
-            else:
-                protocol = 'gpfdist'
-
-            for l in local_hostname:
-                if type(l) != str and type(l) != unicode:
-                    self.control_file_error(name + ":local_hostname must be a YAML sequence of strings")
-                l = str(l)
-                sep = ''
-                if file[0] != '/':
-                    sep = '/'
-                # MPP-13617
-                if ':' in l:
-                    l = '[' + l + ']'
-                self.locations.append('%s://%s:%d%s%s%s' % (protocol, l, port, sep, '%20'.join(file), fragment))
-        if not found_source:
-            self.control_file_error("configuration file must contain source definition")
+            for loader, name, local_hostname, file, fragment in sources:
+                loader.ports.append(port)
+                for f in file:
+                    path = os.path.relpath(os.path.abspath(f), directory).replace(' ', '%20')
+                    loader.locations.extend(loader.gpfdist_locations(name, local_hostname, port, [path], fragment))
+        self.log(self.INFO, 'loading %d table(s) through %d gpfdist daemon(s)' % (len(loaders), len(self.ports)))
 
     def readPgpass(self,pgpassname):
         """
@@ -2414,7 +2916,7 @@ class gpload:
             from_cols = self.from_columns
 
         # make sure we set the correct distribution policy
-        distcols = self.getconfig('gpload:output:match_columns', list)
+        distcols = self.get_staging_distribution()
 
         # MPP-13399, CR-2227
         including_defaults = ""
@@ -2498,6 +3000,7 @@ class gpload:
 
     def report_errors(self):
         errors = self.count_errors()
+        self.errorCount = errors
         if errors==1:
             self.log(self.WARN, '1 bad row')
         elif errors:
@@ -2528,28 +3031,61 @@ class gpload:
         sql += ' SELECT %s' % ','.join(map(lambda a:a[2], cols))
         sql += ' FROM %s' % self.extSchemaTable
 
-        # cktan: progress thread is not reliable. revisit later.
-        #progress = Progress(self,self.ports)
-        #progress.start()
-        #self.threads.append(progress)
         self.log(self.LOG, sql)
         if not self.options.D:
+            progress = None
+            if self.reportProgress:
+                progress = self.start_progress([self])
             try:
-                self.rowsInserted = self.db.query(sql.encode('utf-8'))
-            except Exception, e:
-                # We need to be a bit careful about the error since it may contain non-unicode characters
-                strE = unicode(str(e), errors = 'ignore')
-                strF = unicode(str(sql), errors = 'ignore')
-                self.log(self.ERROR, strE + ' encountered while running ' + strF)
+                try:
+                    self.rowsInserted = self.db.query(sql.encode('utf-8'))
+                except Exception, e:
+                    # We need to be a bit careful about the error since it may contain non-unicode characters
+                    strE = unicode(str(e), errors = 'ignore')
+                    strF = unicode(str(sql), errors = 'ignore')
+                    self.log(self.ERROR, strE + ' encountered while running ' + strF)
+            finally:
+                if progress:
+                    progress.stop()
 
-        #progress.condition.acquire()
-        #progress.number = 1
-        #progress.condition.wait()
-        #progress.condition.release()
         self.report_errors()
 
+    def start_progress(self, loaders):
+        """
+        Start reporting the progress of the gpfdist daemons serving loaders
+        """
+        if self.options.progress_interval <= 0 or not self.ports:
+            return None
+        files = []
+        for loader in loaders:
+            for name, local_hostname in loader.gpfdist_sources():
+                files.extend(loader.gpfdist_files(name))
+        progress = Progress(self, self.ports, self.options.progress_interval,
+                            average_row_size(files),
+                            sum(loader.input_bytes() for loader in loaders))
+        progress.start()
+        return progress
+
+    def prepare_external_table(self):
+        """
+        Create or find the external table, once for all the batches of a
+        stream mode load
+        """
+        if not self.externalTableReady:
+            self.create_external_table()
+            self.externalTableReady = True
+
+    def prepare_staging_table(self):
+        """
+        Create or find the staging table, once for all the batches of a
+        stream mode load; do_method() truncates it after every batch
+        """
+        if not self.stagingTableReady:
+            self.create_staging_table()
+            self.stagingTableReady = True
+
     def do_method_insert(self):
-        self.create_external_table()
+        self.prepare_external_table()
         self.do_insert(self.get_qualified_tablename())
 
     def map_stuff(self,config,format,index):
@@ -2631,6 +3167,38 @@ class gpload:
                 strF = unicode(str(sql), errors = 'ignore')
                 self.log(self.ERROR, strE + ' encountered while running ' + strF)
 				
+    def get_staging_distribution(self):
+        """
+        Distribute the staging table the same way as the target table when
+        the target's distribution key is made of match columns, so that the
+        joins between them need no motion. Otherwise distribute it on the
+        match columns.
+        """
+        matchColumns = self.getconfig('gpload:output:match_columns', list)
+        if not self.distkeyColumns:
+            return matchColumns
+
+        delimitedMatchColumns = convertListToDelimited(matchColumns)
+        stagingColumns = [column[0] for column in self.into_columns if column[2]]
+        for dk in self.distkeyColumns:
+            if dk not in delimitedMatchColumns or dk not in stagingColumns:
+                return matchColumns
+
+        self.log(self.LOG, 'distributing staging table like %s' % self.get_qualified_tablename())
+        return self.distkeyColumns
+
+    def run_phase(self, phase, fn, *args):
+        """
+        Run one phase of an update or merge, and remember how long it took
+        """
+        start = time.time()
+        fn(*args)
+        self.phaseTimes.append((phase, time.time() - start))
+
+    def report_phases(self, method):
+        self.log(self.INFO, '%s phases: %s' % (method, ', '.join(
+            ['%s %.2f seconds' % (phase, seconds) for phase, seconds in self.phaseTimes])))
+
     def get_qualified_tablename(self):
 
         tblname = "%s.%s" % (self.schema, self.table)
@@ -2640,12 +3208,15 @@ class gpload:
 
         # NOTE: this query should be re-written better. the problem is that it is
         # not possible to perform a cast on a table name with spaces...
-        sql = "select attname from pg_attribute a, gp_distribution_policy p , pg_class c, pg_namespace n "+\
+        # The columns are returned in distribution key order.
+        sql = "select attname from pg_attribute a, " + \
+              "(select localoid, attrnums, generate_series(1, array_upper(attrnums, 1)) as i " + \
+              " from gp_distribution_policy) p, pg_class c, pg_namespace n " + \
               "where a.attrelid = c.oid and " + \
               "a.attrelid = p.localoid and " + \
-              "a.attnum = any (p.attrnums) and " + \
+              "a.attnum = p.attrnums[p.i] and " + \
               "c.relnamespace = n.oid and " + \
-              "n.nspname = '%s' and c.relname = '%s'; " % (quote_unident(self.schema), quote_unident(self.table))
+              "n.nspname = '%s' and c.relname = '%s' order by p.i; " % (quote_unident(self.schema), quote_unident(self.table))
 
 
         resultList = self.db.query(sql.encode('utf-8')).getresult()
@@ -2665,6 +3236,7 @@ class gpload:
             distkey.add(quote_ident(dk))
 
         self.distkey = distkey
+        self.distkeyColumns = [quote_ident(dk) for dk in distKeyList]
         if len(distkey) != 0:
             # not randomly distributed - check that UPDATE_COLUMNS isn't part of the distribution key
             updateColumnList = self.getconfig('gpload:output:update_columns',
@@ -2680,39 +3252,47 @@ class gpload:
         """Load the data in and update an existing table based upon it"""
 
         self.table_supports_update()
-        self.create_staging_table()
+        self.prepare_staging_table()
 
-        self.create_external_table()
-        self.do_insert(self.staging_table_name)
+        self.prepare_external_table()
+        self.run_phase('load staging', self.do_insert, self.staging_table_name)
         # These rows are inserted temporarily for processing, so set inserted rows back to zero.
         self.rowsInserted = 0
-        self.do_update(self.staging_table_name, 0)
+        self.run_phase('update', self.do_update, self.staging_table_name, 0)
+        self.report_phases('update')
 
     def do_method_merge(self):
         """insert data not already in the table, update remaining items"""
 
         self.table_supports_update()
-        self.create_staging_table()
-        self.create_external_table()
-        self.do_insert(self.staging_table_name)
+        self.prepare_staging_table()
+        self.prepare_external_table()
+        self.run_phase('load staging', self.do_insert, self.staging_table_name)
         self.rowsInserted = 0 # MPP-13024. No rows inserted yet (only to temp table).
-        self.do_update(self.staging_table_name, 0)
-		
-        # insert new rows to the target table
+        self.run_phase('update', self.do_update, self.staging_table_name, 0)
+        self.run_phase('insert', self.do_merge_insert)
+        self.report_phases('merge')
+
+    def do_merge_insert(self):
+        """
+        Insert the staging rows that do not match any row of the target table.
+        Only the rows left by the anti-join are numbered to pick one of each
+        set of duplicates, instead of the whole staging table.
+        """
         match = self.map_stuff('gpload:output:match_columns',lambda x,y:'into_table.%s=from_table.%s'%(x,y),0)
-        matchColumns = self.getconfig('gpload:output:match_columns',list)
-		
-        cols = filter(lambda a:a[2] != None, self.into_columns)				
+        partition = self.map_stuff('gpload:output:match_columns',lambda x,y:'from_table.%s'%x,0)
+
+        cols = filter(lambda a:a[2] != None, self.into_columns)
         sql = 'INSERT INTO %s ' % self.get_qualified_tablename()
         sql += '(%s) ' % ','.join(map(lambda a:a[0], cols))
         sql += '(SELECT %s ' % ','.join(map(lambda a:'from_table.%s' % a[0], cols))
-        sql += 'FROM (SELECT *, row_number() OVER (PARTITION BY %s) AS gpload_row_number ' % ','.join(matchColumns)
-        sql += 'FROM %s) AS from_table ' % self.staging_table_name
+        sql += 'FROM (SELECT from_table.*, row_number() OVER (PARTITION BY %s) AS gpload_row_number ' % ','.join(partition)
+        sql += 'FROM %s from_table ' % self.staging_table_name
         sql += 'LEFT OUTER JOIN %s into_table ' % self.get_qualified_tablename()
         sql += 'ON %s '%' AND '.join(match)
         where = self.map_stuff('gpload:output:match_columns',lambda x,y:'into_table.%s IS NULL'%x,0)
-        sql += 'WHERE %s ' % ' AND '.join(where)
-        sql += 'AND gpload_row_number=1)'
+        sql += 'WHERE %s) AS from_table ' % ' AND '.join(where)
+        sql += 'WHERE gpload_row_number=1)'
 
         self.log(self.LOG, sql)
         if not self.options.D:
@@ -2755,7 +3335,8 @@ class gpload:
         if self.error_table:
             self.log_errors = True
             self.reuse_tables = True
-        if truncate == True:
+        # in stream mode the target is only truncated before the first batch
+        if truncate == True and self.streamBatches == 0:
             if method=='insert':
                 self.do_truncate(self.schemaTable)
             else:
@@ -2827,18 +3408,243 @@ class gpload:
         self.log(self.LOG, 'all threads are terminated')
 
 
+    def table_loader(self, index):
+        """
+        Returns a gpload for entry index (starting at 1) of LOADS. It shares
+        the options, log file and gpfdist daemons of this session, but has
+        its own table state and connection.
+        """
+        loader = copy.copy(self)
+        loader.config = dict(self.config)
+        loader.config['gpload'] = self.getconfig('loads:gpload(%d)' % index, dict)
+        loader.configOriginal = dict((k, v) for k, v in self.configOriginal.iteritems()
+                                     if k.lower() != 'loads')
+        loader.configOriginal['gpload'] = self.getconfig('loads:gpload(%d)' % index, dict,
+                                                         returnOriginal=True)
+        loader.loads = None
+        loader.reportProgress = False
+        loader.db = None
+        loader.exitValue = 0
+        loader.elapsed = 0
+        loader.init_table_state()
+        loader.read_output_config()
+        loader.logPrefix = '%s: ' % loader.schemaTable
+        return loader
+
+    def input_bytes(self):
+        """
+        Size of the local input files, for reporting throughput
+        """
+        size = 0
+        for name, local_hostname in self.gpfdist_sources():
+            for pattern in self.gpfdist_files(name):
+                for f in glob.glob(pattern):
+                    if os.path.isfile(f):
+                        size += os.path.getsize(f)
+        return size
+
+    def load_table(self):
+        """
+        Load the output table of one entry of LOADS over self.db, which is
+        kept open for the next table unless the load failed.
+        """
+        start = time.time()
+        self.log(self.INFO, 'started loading')
+        try:
+            try:
+                if self.db == None:
+                    self.setup_connection()
+                self.read_table_metadata()
+                self.read_columns()
+                self.read_mapping()
+                self.do_method()
+            except SystemExit:
+                # the error was logged before exiting
+                self.exitValue = 2
+            except Exception:
+                traceback.print_exc(file=self.logfile)
+                self.logfile.flush()
+                self.exitValue = 2
+                self.log(self.INFO, "unexpected error -- backtrace " +
+                         "written to log file")
+        finally:
+            if self.exitValue == 2 and self.db != None:
+                self.db.close()
+                self.db = None
+            try:
+                self.run_cleanup_sql(self.db == None)
+            except SystemExit:
+                self.exitValue = 2
+            self.elapsed = time.time() - start
+
+    def run_loads(self):
+        """
+        Load all of LOADS, at most max_connections at a time
+        """
+        start = time.time()
+        loaders = [self.table_loader(i + 1) for i in range(len(self.loads))]
+        self.start_shared_gpfdists(loaders)
+
+        queue = Queue.Queue()
+        for loader in loaders:
+            queue.put(loader)
+        workers = [LoadWorker(self, queue) for i in range(max(1, min(self.options.max_connections, len(loaders))))]
+
+        # the session connection becomes the first worker's
+        workers[0].db = self.db
+        self.db = None
+        progress = None
+        if not self.options.D:
+            progress = self.start_progress(loaders)
+        try:
+            for w in workers:
+                w.start()
+            for w in workers:
+                # join with a timeout, so that we are still told about signals
+                while w.isAlive():
+                    w.join(1)
+        finally:
+            if progress:
+                progress.stop()
+
+        self.report_loads(loaders, time.time() - start)
+
+    def report_loads(self, loaders, elapsed):
+        totalRows = 0
+        totalBytes = 0
+        for loader in loaders:
+            rows = rowcount(loader.rowsInserted) + rowcount(loader.rowsUpdated)
+            size = loader.input_bytes()
+            totalRows += rows
+            totalBytes += size
+            self.rowsInserted += rowcount(loader.rowsInserted)
+            self.rowsUpdated += rowcount(loader.rowsUpdated)
+            self.exitValue = max(self.exitValue, loader.exitValue)
+
+            if loader.exitValue == 2:
+                status = 'failed'
+            elif loader.exitValue == 1:
+                status = 'succeeded with %d bad rows' % loader.errorCount
+            else:
+                status = 'succeeded'
+            seconds = max(loader.elapsed, 0.001)
+            self.log(self.INFO, '%s %s: %d rows, %s in %.2f seconds (%d rows/s, %s/s)' %
+                     (loader.schemaTable, status, rows, bytestr(size), loader.elapsed,
+                      rows / seconds, bytestr(int(size / seconds))))
+
+        seconds = max(elapsed, 0.001)
+        self.log(self.INFO, 'loaded %d table(s): %d rows, %s in %.2f seconds (%d rows/s, %s/s)' %
+                 (len(loaders), totalRows, bytestr(totalBytes), elapsed,
+                  totalRows / seconds, bytestr(int(totalBytes / seconds))))
+
+    def start_stream_gpfdists(self, stream):
+        """
+        Start a gpfdist for every source, serving its batch directory
+        """
+        self.locations = []
+        self.ports = []
+        availablePorts = set(xrange(1,65535))
+
+        for index, (name, local_hostname) in enumerate(self.gpfdist_sources()):
+            popenList = ['gpfdist']
+            self.gpfdist_ssl(popenList)
+            self.gpfdist_port_options(name, availablePorts, popenList)
+            popenList.extend(['-d', stream.source_dir(index)])
+            self.gpfdist_timeout_options(popenList)
+            self.gpfdist_verbose_options(popenList)
+            self.gpfdist_max_line_length(popenList)
+            fragment = self.gpfdist_transform(popenList)
+
+            port = self.start_gpfdist(popenList)
+            if port in availablePorts:
+                availablePorts.remove(port)
+            self.ports.append(port)
+            self.locations.extend(self.gpfdist_locations(name, local_hostname, port, ['*'], fragment))
+
+    def run_stream(self):
+        """
+        Load new input files in batches until gpload is killed. The gpfdist
+        daemons, the connection and the external and staging tables are set
+        up once and used for every batch.
+        """
+        if self.loads:
+            self.control_file_error("--stream cannot be used with LOADS")
+        if windowsPlatform:
+            self.log(self.ERROR, "--stream is not supported on this platform")
+
+        self.read_table_metadata()
+        self.read_columns()
+        self.read_mapping()
+
+        sources = [self.gpfdist_files(name) for name, local_hostname in self.gpfdist_sources()]
+        stream = StreamState(self.options.stream, sources, lambda msg: self.log(self.WARN, msg))
+        stream.prepare()
+        self.start_stream_gpfdists(stream)
+        # the gpfdist counters cover every batch, so report per batch instead
+        self.reportProgress = False
+        self.log(self.INFO, 'streaming new input files, %d already loaded' % len(stream.loaded))
+
+        totalInserted = 0
+        totalUpdated = 0
+        try:
+            while 1:
+                batch = stream.next_batch(self.options.stream_batch)
+                if not batch:
+                    time.sleep(self.options.stream_interval)
+                    continue
+
+                start = time.time()
+                self.rowsInserted = 0
+                self.rowsUpdated = 0
+                stream.stage(batch)
+                self.do_method()
+                stream.commit(batch)
+                self.streamBatches += 1
+
+                seconds = max(time.time() - start, 0.001)
+                size = sum(f[3] - f[2] for f in batch)
+                rows = rowcount(self.rowsInserted) + rowcount(self.rowsUpdated)
+                totalInserted += rowcount(self.rowsInserted)
+                totalUpdated += rowcount(self.rowsUpdated)
+                self.log(self.INFO, 'batch %d: %d file(s), %d rows, %s in %.2f seconds (%d rows/s, %s/s)' %
+                         (self.streamBatches, len(batch), rows, bytestr(size), seconds,
+                          rows / seconds, bytestr(int(size / seconds))))
+        finally:
+            # what run() reports when gpload is stopped
+            self.rowsInserted = totalInserted
+            self.rowsUpdated = totalUpdated
+
     def run2(self):
         self.log(self.DEBUG, 'config ' + str(self.config))
         start = time.time()
         self.read_config()
         self.setup_connection()
-        self.read_table_metadata()
-        self.read_columns()
-        self.read_mapping()
-        self.start_gpfdists()
-        self.do_method()
+        if self.options.stream:
+            self.run_stream()
+        elif self.loads:
+            self.run_loads()
+        else:
+            self.read_table_metadata()
+            self.read_columns()
+            self.read_mapping()
+            self.start_gpfdists()
+            self.do_method()
         self.log(self.INFO, 'running time: %.2f seconds'%(time.time()-start))
 
+    def run_cleanup_sql(self, reconnect=True):
+        if self.cleanupSql:
+            self.log(self.LOG, 'removing temporary data')
+            if reconnect:
+                self.setup_connection()
+            for a in self.cleanupSql:
+                try:
+                    self.log(self.DEBUG, a)
+                    self.db.query(a.encode('utf-8'))
+                except (Exception, SystemExit):
+                    traceback.print_exc(file=self.logfile)
+                    self.logfile.flush()
+                    traceback.print_exc()
+
     def run(self):
         self.db = None
         self.rowsInserted = 0
@@ -2865,17 +3671,7 @@ class gpload:
         finally:
             self.stop_gpfdists()
 
-            if self.cleanupSql:
-                self.log(self.LOG, 'removing temporary data')
-                self.setup_connection()
-                for a in self.cleanupSql:
-                    try:
-                        self.log(self.DEBUG, a)
-                        self.db.query(a.encode('utf-8'))
-                    except (Exception, SystemExit):
-                        traceback.print_exc(file=self.logfile)
-                        self.logfile.flush()
-                        traceback.print_exc()
+            self.run_cleanup_sql()
 
             if self.db != None:
                 self.db.close()
@@ -16,13 +16,20 @@ for executing this set of commands.
 
 """
 
-from Queue import Queue, Empty
-from threading import Thread
-
+from Queue import PriorityQueue, Queue, Empty
+from threading import Condition, Lock, Thread
+
+import atexit
+import bisect
+import hashlib
+import heapq
+import itertools
 import os
+import shutil
 import signal
 import subprocess
 import sys
+import tempfile
 import time
 
 from gppylib import gplog
@@ -44,53 +51,205 @@ GPHOME = os.environ.get('GPHOME')
 SSH_MAX_RETRY = 10
 # Delay before retrying ssh connection, in seconds
 SSH_RETRY_DELAY = .5
+# Stderr of ssh when sshd refuses the connection.
+SSH_REFUSED_MESSAGES = ('ssh_exchange_identification:', 'kex_exchange_identification:',
+                        'Connection reset by peer')
+
+# Limit on the commands the utilities that fan out to every segment run on
+# one remote host at a time, the default number of unauthenticated connections sshd accepts
+# (MaxStartups) before it starts refusing some of them.
+MAX_COMMANDS_PER_HOST = 10
+# Upper bounds, in seconds, of the buckets of the latency histograms.
+LATENCY_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, float('inf'))
+# A command that takes this many times longer than the average of its kind
+# makes an adaptive WorkerPool run fewer commands at a time.
+SLOW_COMMAND_FACTOR = 3
+# Queued after all other work, so that haltWork() lets workers drain it.
+HALT_PRIORITY = float('inf')
+# Seconds a multiplexed ssh connection to a host stays open after its last
+# command; utilities close them all when they exit anyway.
+SSH_CONTROL_PERSIST = 300
+# Commands run over one multiplexed ssh connection at a time, the default
+# number of sessions sshd accepts on one connection (MaxSessions).  Commands
+# beyond it use an ssh connection of their own.
+SSH_MAX_SESSIONS = 10
 
 
 class WorkerPool(object):
-    """TODO:"""
+    """
+    A set of worker threads that run the commands put on its queue.
+
+    Commands are run in order of priority (lowest first), and in the order
+    they were added within a priority.  With maxPerHost, at most that many
+    commands run on the same remote host at a time, so that a fan out to
+    many segments of a host does not trip sshd's MaxStartups; a command for
+    a host that is busy waits while commands for other hosts go ahead.
+
+    An adaptive pool also limits the number of commands running at a time
+    to fewer than numWorkers while remote commands are being refused or
+    take much longer than usual, and gradually raises the limit back to
+    numWorkers as they recover.
+    """
 
     halt_command = 'halt command'
 
-    def __init__(self, numWorkers=16, items=None, daemonize=False, logger=gplog.get_default_logger()):
+    def __init__(self, numWorkers=16, items=None, daemonize=False, logger=gplog.get_default_logger(),
+                 maxPerHost=None, adaptive=False):
         if numWorkers <= 0:
             raise Exception("WorkerPool(): numWorkers should be greater than 0.")
         self.workers = []
         self.should_stop = False
-        self.work_queue = Queue()
+        self.work_queue = PriorityQueue()
         self.completed_queue = Queue()
         self.num_assigned = 0
         self.daemonize = daemonize
+        self.numWorkers = numWorkers
+        self.logger = logger
+
+        self.maxPerHost = maxPerHost
+        self.adaptive = adaptive
+        self.limit = numWorkers
+        self.sequence = itertools.count()
+        self.slots = Condition()
+        self.reserved = 0
+        self.in_flight = 0
+        self.running_by_host = {}
+        self.deferred = {}
+        self.metrics = WorkerPoolMetrics()
+
         if items is not None:
             for item in items:
-                self.work_queue.put(item)
+                self._put(item)
                 self.num_assigned += 1
 
         for i in range(0, numWorkers):
-            w = Worker("worker%d" % i, self)
+            w = self._new_worker("worker%d" % i)
             self.workers.append(w)
             w.start()
-        self.numWorkers = numWorkers
-        self.logger = logger
+
+    def _new_worker(self, name):
+        return Worker(name, self)
+
+    def _put(self, item, priority=0):
+        self.work_queue.put((priority, next(self.sequence), item))
 
     ###
     def getNumWorkers(self):
         return self.numWorkers
 
     def getNextWorkItem(self):
-        return self.work_queue.get(block=True)
-
-    def addFinishedWorkItem(self, command):
+        """
+        Return the next item once fewer than limit items are running.  A
+        command for a host that already runs maxPerHost commands is set
+        aside until one of them finishes, while commands for other hosts go
+        ahead.  No slot is held while waiting on the queue, so a lowered
+        limit never strands the set aside commands.
+        """
+        while True:
+            (priority, seq, item) = self.work_queue.get(block=True)
+            self.slots.acquire()
+            try:
+                host = _remote_host(item)
+                while True:
+                    if self._hostIsFull(host):
+                        heapq.heappush(self.deferred.setdefault(host, []), (priority, seq, item))
+                        break
+                    if self.reserved < self.limit or self.should_stop:
+                        self.reserved += 1
+                        return self._started(item, host)
+                    self.slots.wait()
+            finally:
+                self.slots.release()
+
+    def _hostIsFull(self, host):
+        return (host is not None and self.maxPerHost is not None
+                and self.running_by_host.get(host, 0) >= self.maxPerHost)
+
+    def _started(self, item, host):
+        if item is not None and item is not self.halt_command:
+            self.in_flight += 1
+        if host is not None:
+            self.running_by_host[host] = self.running_by_host.get(host, 0) + 1
+        return item
+
+    def _finished(self, item):
+        self.slots.acquire()
+        try:
+            self.reserved -= 1
+            if item is not None and item is not self.halt_command:
+                self.in_flight -= 1
+            host = _remote_host(item)
+            if host is not None:
+                self.running_by_host[host] -= 1
+                if self.deferred.get(host) and not self._hostIsFull(host):
+                    # put the next command for the host back on the queue; it
+                    # is still counted as unfinished from when it was added
+                    self.work_queue.put(heapq.heappop(self.deferred[host]))
+                    self.work_queue.task_done()
+            self.slots.notify_all()
+        finally:
+            self.slots.release()
+
+    def addFinishedWorkItem(self, command, elapsed=None):
+        if elapsed is not None:
+            if isinstance(command, Command):
+                command.elapsed = elapsed
+            self.metrics.record(command, elapsed)
+            if self.adaptive:
+                self._adapt(command, elapsed)
+        self._finished(command)
         self.completed_queue.put(command)
         self.work_queue.task_done()
 
-    def markTaskDone(self):
+    def markTaskDone(self, item=None):
+        self._finished(item)
         self.work_queue.task_done()
 
-    def addCommand(self, cmd):
+    def _adapt(self, command, elapsed):
+        """
+        Halve the limit when sshd refuses a command, lower it by one when a
+        command takes much longer than its kind usually does, and otherwise
+        raise it by one, up to numWorkers.
+        """
+        self.slots.acquire()
+        try:
+            limit = self.limit
+            if _ssh_throttled(command):
+                limit = max(1, limit / 2)
+            elif self.metrics.is_slow(command, elapsed):
+                limit = max(1, limit - 1)
+            else:
+                limit = min(self.numWorkers, limit + 1)
+            if limit != self.limit:
+                self.logger.debug("WorkerPool: running up to %d commands at a time" % limit)
+                self.limit = limit
+        finally:
+            self.slots.release()
+
+    def addCommand(self, cmd, priority=0):
         self.logger.debug("Adding cmd to work_queue: %s" % cmd.cmdStr)
-        self.work_queue.put(cmd)
+        self._put(cmd, priority)
         self.num_assigned += 1
 
+    def getMetrics(self):
+        """
+        return: a dict with the number of queued and running commands, the
+                current limit on running commands, the number completed and
+                failed, and {command name: {bucket: count}} histograms of
+                how many seconds the commands took
+        """
+        self.slots.acquire()
+        try:
+            queued = self.work_queue.qsize() + sum(len(entries) for entries in self.deferred.values())
+            return {'queued': queued,
+                    'in_flight': self.in_flight,
+                    'limit': self.limit,
+                    'completed': self.metrics.completed,
+                    'failed': self.metrics.failed,
+                    'latency': self.metrics.histograms()}
+        finally:
+            self.slots.release()
+
     def wait_and_printdots(self, command_count, quiet=True):
         while self.completed_queue.qsize() < command_count:
             time.sleep(1)
@@ -102,6 +261,22 @@ class WorkerPool(object):
             print " "
         self.join()
 
+    def getNextCompletedItem(self, quiet=True):
+        """
+        Wait for the next command to complete and return it, so that results
+        can be processed as they come in rather than once all commands are
+        done.  Prints a dot every second while waiting unless quiet.
+        """
+        while True:
+            try:
+                item = self.completed_queue.get(True, 1)
+                if item is not None:
+                    return item
+            except Empty:
+                if not quiet:
+                    sys.stdout.write(".")
+                    sys.stdout.flush()
+
     def print_progress(self, command_count):
         while True:
             num_completed = self.completed_queue.qsize()
@@ -179,9 +354,74 @@ class WorkerPool(object):
     def haltWork(self):
         self.logger.debug("WorkerPool haltWork()")
         self.should_stop = True
+        self.slots.acquire()
+        try:
+            self.slots.notify_all()
+        finally:
+            self.slots.release()
         for w in self.workers:
             w.haltWork()
-            self.work_queue.put(self.halt_command)
+            self._put(self.halt_command, HALT_PRIORITY)
+
+
+class WorkerPoolMetrics:
+    """
+    Latency histograms and success counts of the commands run by a
+    WorkerPool, by command name.
+    """
+
+    def __init__(self):
+        self.completed = 0
+        self.failed = 0
+        self.buckets = {}
+        self.average = {}
+
+    def record(self, command, elapsed):
+        self.completed += 1
+        if not _was_successful(command):
+            self.failed += 1
+
+        name = getattr(command, 'name', None) or str(command)
+        counts = self.buckets.setdefault(name, [0] * len(LATENCY_BUCKETS))
+        counts[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+
+        # exponentially weighted moving average, for is_slow()
+        average = self.average.get(name)
+        self.average[name] = elapsed if average is None else 0.8 * average + 0.2 * elapsed
+
+    def is_slow(self, command, elapsed):
+        """
+        Whether elapsed is well above the average of the commands of the
+        same name before it, which is a sign of an overloaded host.
+        """
+        name = getattr(command, 'name', None) or str(command)
+        counts = self.buckets.get(name)
+        if counts is None or sum(counts) < 2:
+            return False
+        return elapsed > SLOW_COMMAND_FACTOR * self.average[name] + 1
+
+    def histograms(self):
+        labels = ['<=%g' % b for b in LATENCY_BUCKETS[:-1]] + ['>%g' % LATENCY_BUCKETS[-2]]
+        return dict((name, dict(zip(labels, counts))) for name, counts in self.buckets.iteritems())
+
+
+def _remote_host(item):
+    if not isinstance(item, Command):
+        return None
+    return getattr(item, 'remoteHost', None)
+
+
+def _was_successful(command):
+    if isinstance(command, Command):
+        return command.was_successful()
+    return True
+
+
+def _ssh_throttled(command):
+    results = command.get_results() if isinstance(command, Command) else None
+    if results is None or not isinstance(results.stderr, basestring):
+        return False
+    return any(msg in results.stderr for msg in SSH_REFUSED_MESSAGES)
 
 
 class OperationWorkerPool(WorkerPool):
@@ -224,6 +464,7 @@ class Worker(Thread):
                 except TypeError:
                     # misleading exception raised during interpreter shutdown
                     return
+                start = time.time()
 
                 # we must have got a command to run here
                 if self.cmd is None:
@@ -231,25 +472,25 @@ class Worker(Thread):
                     self.pool.markTaskDone()
                 elif self.cmd is self.pool.halt_command:
                     self.logger.debug("[%s] got a halt cmd" % self.name)
-                    self.pool.markTaskDone()
+                    self.pool.markTaskDone(self.cmd)
                     self.cmd = None
                     return
                 elif self.pool.should_stop:
                     self.logger.debug("[%s] got cmd and pool is stopped: %s" % (self.name, self.cmd))
-                    self.pool.markTaskDone()
+                    self.pool.markTaskDone(self.cmd)
                     self.cmd = None
                 else:
                     self.logger.debug("[%s] got cmd: %s" % (self.name, self.cmd.cmdStr))
                     self.cmd.run()
                     self.logger.debug("[%s] finished cmd: %s" % (self.name, self.cmd))
-                    self.pool.addFinishedWorkItem(self.cmd)
+                    self.pool.addFinishedWorkItem(self.cmd, time.time() - start)
                     self.cmd = None
 
             except Exception, e:
                 self.logger.exception(e)
                 if self.cmd:
                     self.logger.debug("[%s] finished cmd with exception: %s" % (self.name, self.cmd))
-                    self.pool.addFinishedWorkItem(self.cmd)
+                    self.pool.addFinishedWorkItem(self.cmd, time.time() - start)
                     self.cmd = None
 
     def haltWork(self):
@@ -622,6 +863,149 @@ class NakedExecutionContext(LocalExecutionContext):
         cmd.set_results(CommandResult(1, "", "command on host " + self.targetHost + " canceled ", False, False))
 
 
+class SshConnectionManager:
+    """
+    Keeps one multiplexed ssh connection (an ssh ControlMaster) open to each
+    remote host for the life of the utility, so that the remote commands to
+    a host only pay for the ssh handshake once.  Hosts to which a control
+    connection cannot be set up, and the commands to a host that already
+    runs SSH_MAX_SESSIONS commands over it, use a plain ssh per command.
+
+    Setting GP_SSH_NO_MULTIPLEXING in the environment turns this off.
+    """
+
+    SSH_OPTIONS = "-o StrictHostKeyChecking=no -o ServerAliveInterval=60"
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.lock = Lock()
+        self.hostLocks = {}
+        self.controlDir = None
+        self.controlPaths = {}  # host => control socket, or None if the host is reached without one
+        self.lastUsed = {}
+        self.sessions = {}  # host => commands running over its control connection
+        self.handshakes = 0
+        self.handshakeSeconds = 0.0
+        self.reused = 0
+
+    def getSshOptions(self, host):
+        """
+        Returns the ssh options that run a command over the control
+        connection to host, setting the connection up if need be.  Pass
+        them to releaseSshOptions() once the command has finished.
+        """
+        if os.getenv('GP_SSH_NO_MULTIPLEXING'):
+            return self.SSH_OPTIONS
+
+        with self.__getHostLock(host):
+            if self.sessions.get(host, 0) >= SSH_MAX_SESSIONS:
+                return self.SSH_OPTIONS
+            path = self.controlPaths.get(host, False)
+            if path is False or (path is not None and
+                                 time.time() - self.lastUsed[host] > SSH_CONTROL_PERSIST / 2 and
+                                 not self.__check(host, path)):
+                path = self.__connect(host)
+            elif path is not None:
+                with self.lock:
+                    self.reused += 1
+            if path is not None:
+                self.lastUsed[host] = time.time()
+                self.sessions[host] = self.sessions.get(host, 0) + 1
+
+        if path is None:
+            return self.SSH_OPTIONS
+        return "%s -o ControlMaster=no -o ControlPath=%s" % (self.SSH_OPTIONS, path)
+
+    def releaseSshOptions(self, host, options):
+        """
+        Called when a command run with options from getSshOptions() has
+        finished.
+        """
+        if options == self.SSH_OPTIONS:
+            return
+        with self.__getHostLock(host):
+            self.sessions[host] -= 1
+
+    def getStats(self):
+        """
+        return: a dict with the number of ssh handshakes done to set up
+                control connections, the seconds they took, the number of
+                commands that reused a connection, and an estimate of the
+                seconds of handshakes that saved
+        """
+        with self.lock:
+            average = self.handshakeSeconds / self.handshakes if self.handshakes else 0.0
+            return {'handshakes': self.handshakes,
+                    'handshake_seconds': self.handshakeSeconds,
+                    'reused': self.reused,
+                    'saved_seconds': self.reused * average}
+
+    def closeAll(self):
+        """
+        Closes the control connections and removes their sockets.
+        """
+        if os.getpid() != self.pid:
+            # a forked child leaves them to the utility
+            return
+
+        with self.lock:
+            controlPaths = dict((host, path) for (host, path) in self.controlPaths.iteritems() if path)
+            self.controlPaths = {}
+            controlDir = self.controlDir
+            self.controlDir = None
+
+        for host, path in controlPaths.iteritems():
+            self.__run("ssh %s -o ControlPath=%s -O exit %s" % (self.SSH_OPTIONS, path, host))
+        if controlDir:
+            shutil.rmtree(controlDir, ignore_errors=True)
+
+        stats = self.getStats()
+        if stats['handshakes']:
+            logger.debug("ssh: %d control connections set up in %.1f seconds, reused %d times, "
+                         "saving about %.1f seconds" % (stats['handshakes'], stats['handshake_seconds'],
+                                                        stats['reused'], stats['saved_seconds']))
+
+    def __getHostLock(self, host):
+        with self.lock:
+            return self.hostLocks.setdefault(host, Lock())
+
+    def __getControlPath(self, host):
+        with self.lock:
+            if self.controlDir is None:
+                # unix socket paths are short, so keep the directory and the names short
+                self.controlDir = tempfile.mkdtemp(prefix='gpssh')
+                atexit.register(self.closeAll)
+            return os.path.join(self.controlDir, hashlib.md5(str(host)).hexdigest()[:16])
+
+    def __connect(self, host):
+        path = self.__getControlPath(host)
+        start = time.time()
+        # the master goes to the background and keeps our output open if
+        # it has any, so leave it none
+        rc = self.__run("ssh %s -o ControlMaster=yes -o ControlPath=%s -o ControlPersist=%d %s true" %
+                        (self.SSH_OPTIONS, path, SSH_CONTROL_PERSIST, host))
+        if rc != 0:
+            logger.debug("ssh: cannot set up a control connection to %s, not multiplexing" % host)
+            path = None
+        else:
+            with self.lock:
+                self.handshakes += 1
+                self.handshakeSeconds += time.time() - start
+        self.controlPaths[host] = path
+        return path
+
+    def __check(self, host, path):
+        return self.__run("ssh %s -o ControlPath=%s -O check %s" % (self.SSH_OPTIONS, path, host)) == 0
+
+    def __run(self, cmdStr):
+        with open(os.devnull, 'r+') as devnull:
+            return subprocess.call(cmdStr, shell=True, executable='/bin/bash',
+                                   stdin=devnull, stdout=devnull, stderr=devnull, close_fds=True)
+
+
+ssh_connections = SshConnectionManager()
+
+
 class RemoteExecutionContext(LocalExecutionContext):
     trail = set()
     """
@@ -648,14 +1032,18 @@ class RemoteExecutionContext(LocalExecutionContext):
 
         # Escape " for remote execution otherwise it interferes with ssh
         cmd.cmdStr = cmd.cmdStr.replace('"', '\\"')
-        cmd.cmdStr = "ssh -o StrictHostKeyChecking=no -o ServerAliveInterval=60 " \
-                     "{targethost} \"{gphome} {cmdstr}\"".format(targethost=self.targetHost,
-                                                                 gphome=". %s/greenplum_path.sh;" % self.gphome,
-                                                                 cmdstr=cmd.cmdStr)
-        LocalExecutionContext.execute(self, cmd)
-        if (cmd.get_results().stderr.startswith('ssh_exchange_identification: Connection closed by remote host')):
-            self.__retry(cmd)
-        pass
+        options = ssh_connections.getSshOptions(self.targetHost)
+        cmd.cmdStr = "ssh {options} {targethost} \"{gphome} {cmdstr}\"".format(
+            options=options,
+            targethost=self.targetHost,
+            gphome=". %s/greenplum_path.sh;" % self.gphome,
+            cmdstr=cmd.cmdStr)
+        try:
+            LocalExecutionContext.execute(self, cmd)
+            if (cmd.get_results().stderr.startswith('ssh_exchange_identification: Connection closed by remote host')):
+                self.__retry(cmd)
+        finally:
+            ssh_connections.releaseSshOptions(self.targetHost, options)
 
     def __retry(self, cmd, count=0):
         if count == SSH_MAX_RETRY:
@@ -682,6 +1070,7 @@ class Command(object):
     cmdStr = None
     results = None
     exec_context = None
+    elapsed = None  # seconds the command took when run by a WorkerPool
     propagate_env_map = {}  # specific environment variables for this command instance
 
     def __init__(self, name, cmdStr, ctxt=LOCAL, remoteHost=None, stdin=None, nakedExecutionInfo=None, gphome=None):
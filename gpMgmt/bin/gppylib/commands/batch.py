@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+#
+# Copyright (c) Greenplum Inc 2008. All Rights Reserved.
+#
+"""
+batch.py
+
+Runs many commands or operations on one host with a single ssh round trip.
+
+The items are pickled to $GPHOME/sbin/gpbatch.py, which runs them on the
+remote host, at most maxConcurrency at a time, and writes back one result
+line per item as it finishes.  Callers that add many small REMOTE commands
+to a WorkerPool can use addCommandsByHost() and getCompletedCommands() in
+place of addCommand() and getCompletedItems() to have the commands grouped
+by host without otherwise changing how they read the results.
+"""
+import base64
+import os
+import pickle
+import sys
+
+from gppylib import gplog
+from gppylib.commands.base import Command, CommandResult, RemoteExecutionContext, REMOTE
+
+logger = gplog.get_default_logger()
+
+BATCH_MAX_CONCURRENCY = 8  # items run at once on the remote host
+BATCH_RESULT_PREFIX = 'GPBATCH:'
+
+
+class RemoteBatch(Command):
+    """
+    Run a list of Commands and Operations on remoteHost in one invocation
+    of gpbatch.py.
+
+    Once the batch has run, every Command in items has its results set as
+    if it had been run by itself, and every Operation has its ret set to
+    its return value or the exception it raised.  Items the agent did not
+    report on (e.g. because ssh failed) are given a failed result.
+    """
+
+    def __init__(self, name, items, remoteHost, maxConcurrency=BATCH_MAX_CONCURRENCY, gphome=None):
+        self.items = items
+        execname = os.path.split(sys.argv[0])[-1]
+        stdin = pickle.dumps(execname) + pickle.dumps(maxConcurrency) + \
+                pickle.dumps([self.__pack(item) for item in items])
+        Command.__init__(self, name, '$GPHOME/sbin/gpbatch.py', ctxt=REMOTE, remoteHost=remoteHost,
+                         stdin=stdin, gphome=gphome)
+
+    def __str__(self):
+        return "%s of %d items on %s" % (self.name, len(self.items), self.remoteHost)
+
+    @staticmethod
+    def __pack(item):
+        if not isinstance(item, Command):
+            return ('operation', item)
+
+        # as RemoteExecutionContext would, prepend the command's environment
+        cmdStr = item.cmdStr
+        for k in sorted(item.propagate_env_map.keys(), reverse=True):
+            cmdStr = "%s=%s && %s" % (k, item.propagate_env_map[k], cmdStr)
+        return ('command', cmdStr, item.exec_context.stdin)
+
+    def run(self, validateAfter=False):
+        Command.run(self)
+        self.unpack_results()
+        if validateAfter:
+            self.validate()
+
+    def unpack_results(self):
+        results = self.get_results()
+        reported = set()
+        for line in results.stdout.splitlines():
+            if not line.startswith(BATCH_RESULT_PREFIX):
+                continue
+            try:
+                (index, elapsed, result) = pickle.loads(base64.b64decode(line[len(BATCH_RESULT_PREFIX):]))
+            except Exception, e:
+                logger.debug("%s: ignoring unreadable result line: %s" % (self.name, e))
+                continue
+            self.__set_result(self.items[index], elapsed, result)
+            reported.add(index)
+
+        for index, item in enumerate(self.items):
+            if index in reported:
+                continue
+            error = results.stderr or "no result from gpbatch.py on %s" % self.remoteHost
+            if isinstance(item, Command):
+                item.set_results(CommandResult(results.rc or 1, '', error, False, False))
+            else:
+                item.ret = Exception(error)
+
+    @staticmethod
+    def __set_result(item, elapsed, result):
+        if isinstance(item, Command):
+            (rc, stdout, stderr) = result
+            item.set_results(CommandResult(rc, stdout, stderr, True, False))
+            item.elapsed = elapsed
+        else:
+            item.ret = result
+
+
+def canRunInBatch(cmd):
+    """
+    Only plain REMOTE commands can be sent to gpbatch.py: a Command that
+    overrides run() does more than run its cmdStr.
+    """
+    return (isinstance(cmd, Command)
+            and isinstance(cmd.exec_context, RemoteExecutionContext)
+            and getattr(type(cmd).run, 'im_func', None) is Command.run.im_func)
+
+
+def groupCommandsByHost(cmds, maxConcurrency=BATCH_MAX_CONCURRENCY):
+    """
+    Returns the list of commands to run in place of cmds: the REMOTE
+    commands that share a host are replaced by one RemoteBatch for the host,
+    other commands are returned as they are.
+    """
+    grouped = []
+    byHost = {}
+    for cmd in cmds:
+        if canRunInBatch(cmd):
+            key = (cmd.remoteHost, cmd.exec_context.gphome)
+            if key not in byHost:
+                byHost[key] = []
+                grouped.append(key)
+            byHost[key].append(cmd)
+        else:
+            grouped.append(cmd)
+
+    result = []
+    for item in grouped:
+        if not isinstance(item, tuple):
+            result.append(item)
+            continue
+        batch = byHost[item]
+        if len(batch) == 1:
+            result.append(batch[0])
+        else:
+            (host, gphome) = item
+            result.append(RemoteBatch('batch of %s' % batch[0].name, batch, host,
+                                      maxConcurrency=maxConcurrency, gphome=gphome))
+    return result
+
+
+def addCommandsByHost(pool, cmds, maxConcurrency=BATCH_MAX_CONCURRENCY):
+    """
+    Add cmds to the WorkerPool pool, one RemoteBatch per host.  Returns the
+    number of items added, e.g. for pool.wait_and_printdots().
+    """
+    grouped = groupCommandsByHost(cmds, maxConcurrency)
+    for cmd in grouped:
+        pool.addCommand(cmd)
+    return len(grouped)
+
+
+def getCompletedCommands(pool):
+    """
+    pool.getCompletedItems(), with every RemoteBatch replaced by its items.
+    """
+    completed = []
+    for item in pool.getCompletedItems():
+        if isinstance(item, RemoteBatch):
+            completed.extend(item.items)
+        else:
+            completed.append(item)
+    return completed
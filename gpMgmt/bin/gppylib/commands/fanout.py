@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+#
+# Copyright (c) Greenplum Inc 2008. All Rights Reserved.
+#
+"""
+fanout.py
+
+Copies local files to the same path on many hosts without sending every
+copy from the local host.  The local host sends the files to the first
+few hosts; every host that has the files then passes them on to up to
+fanout other hosts at a time, so the number of hosts holding the files
+roughly multiplies with every round.
+
+Each hop is an rsync --partial run on the sending host, so a copy that
+is interrupted is resumed rather than restarted when it is retried, and
+can be limited to a given bandwidth.  With verify, the md5sum of every
+copied file is compared with the local one before a host passes the
+files on.
+"""
+import os
+import pipes
+
+from gppylib import gplog
+from gppylib.commands.base import Command, WorkerPool
+from gppylib.parseutils import canonicalize_address
+
+logger = gplog.get_default_logger()
+
+DEFAULT_FANOUT = 4
+MAX_WORKERS = 64
+
+LOCAL_SOURCE = None  # the server name of the local host
+
+SSH_OPTIONS = '-o BatchMode=yes -o StrictHostKeyChecking=no'
+
+
+class FanoutCopy:
+    """
+    Copy the local files in sources to dest on every host in hosts.
+
+    dest is taken to be a directory when it ends with '/' or there is more
+    than one source; otherwise the single source is copied to dest itself.
+    The hosts must be able to ssh to each other, as set up by gpssh-exkeys.
+    """
+
+    def __init__(self, sources, dest, hosts, fanout=DEFAULT_FANOUT, recursive=False, bwlimit=None,
+                 verify=False, retries=1):
+        self.sources = sources
+        self.dest = dest
+        self.hosts = hosts
+        self.fanout = fanout
+        self.recursive = recursive
+        self.bwlimit = bwlimit  # KB per second, for each copy
+        self.verify = verify
+        self.retries = retries
+        self.paths = self.getPaths()
+        self.copies = []  # (host, server) of every successful copy, in order
+
+    def getPaths(self):
+        """
+        Returns a list of (local path, remote path) for the sources.  A
+        directory copied to a path of its own ends with '/', so that rsync
+        copies its contents rather than the directory itself.
+        """
+        paths = []
+        destIsDir = self.dest.endswith('/') or len(self.sources) > 1
+        for source in self.sources:
+            if destIsDir:
+                source = source.rstrip('/')
+                paths.append((source, os.path.join(self.dest, os.path.basename(source))))
+            elif os.path.isdir(source):
+                paths.append((source.rstrip('/') + '/', self.dest.rstrip('/') + '/'))
+            else:
+                paths.append((source, self.dest))
+        return paths
+
+    def getRsyncCmdStr(self, srcPaths, host):
+        cmdStr = 'rsync --partial -t'
+        if self.recursive:
+            cmdStr += ' -r'
+        if self.bwlimit:
+            cmdStr += ' --bwlimit=%d' % self.bwlimit
+        return '%s -e "ssh %s" %s %s:%s' % (cmdStr, SSH_OPTIONS, ' '.join(srcPaths), canonicalize_address(host),
+                                          self.dest)
+
+    def getChecksumCmdStr(self, paths):
+        """
+        md5sums of the files at paths, listed the same way on every host.
+        """
+        cmds = []
+        for path in paths:
+            cmds.append("if [ -d {path} ]; then cd {path} && find . -type f -print0 | LC_ALL=C sort -z | "
+                        "xargs -0 md5sum; else md5sum < {path}; fi".format(path=path))
+        return ' && '.join('(%s)' % cmd for cmd in cmds)
+
+    def getCopyCmd(self, server, host):
+        """
+        Returns the Command that copies the files from server, a host that
+        already has them or LOCAL_SOURCE, to host.
+        """
+        if server is LOCAL_SOURCE:
+            cmdStr = self.getRsyncCmdStr([local for (local, remote) in self.paths], host)
+        else:
+            rsync = self.getRsyncCmdStr([remote for (local, remote) in self.paths], host)
+            cmdStr = 'ssh %s %s %s' % (SSH_OPTIONS, server, pipes.quote(rsync))
+        if self.verify:
+            checksum = self.getChecksumCmdStr([remote for (local, remote) in self.paths])
+            cmdStr += ' && ssh %s %s %s' % (SSH_OPTIONS, host, pipes.quote(checksum))
+
+        cmd = Command('copy files from %s to %s' % (server or 'local host', host), cmdStr)
+        cmd.server = server
+        cmd.host = host
+        return cmd
+
+    def getLocalChecksums(self):
+        cmd = Command('checksum local files', self.getChecksumCmdStr([local for (local, remote) in self.paths]))
+        cmd.run(validateAfter=True)
+        return cmd.get_stdout()
+
+    def checkCopy(self, cmd, expected):
+        """
+        Returns None if cmd copied the files, else the reason it did not.
+        """
+        results = cmd.get_results()
+        if results.rc != 0:
+            return 'exit %d: %s' % (results.rc, results.stderr.strip())
+        if expected is not None and cmd.get_stdout() != expected:
+            return 'checksum mismatch'
+        return None
+
+    def pickServer(self, busy, localCopies, retry):
+        """
+        Returns the host to copy the next files from, or False if every
+        possible server is busy.  Hosts that have the files are preferred;
+        the local host only sends the first fanout copies, retries, and
+        copies while no other host has the files.
+        """
+        localFree = busy[LOCAL_SOURCE] < self.fanout
+        if retry and localFree:
+            # the failure may have been the relay's
+            return LOCAL_SOURCE
+        relays = [server for server in busy if server is not LOCAL_SOURCE and busy[server] < self.fanout]
+        if relays:
+            return min(relays, key=lambda server: busy[server])
+        if localFree and (localCopies < self.fanout or len(busy) == 1):
+            return LOCAL_SOURCE
+        return False
+
+    def run(self):
+        """
+        Copy the files.  Returns a dict of host: error for the hosts that
+        could not be copied to.
+        """
+        expected = self.getLocalChecksums() if self.verify else None
+
+        pending = list(self.hosts)
+        attempts = dict((host, 0) for host in self.hosts)
+        busy = {LOCAL_SOURCE: 0}
+        localCopies = 0
+        running = 0
+        failed = {}
+
+        pool = WorkerPool(numWorkers=max(1, min(len(self.hosts), MAX_WORKERS)))
+        try:
+            while pending or running:
+                while pending:
+                    server = self.pickServer(busy, localCopies, attempts[pending[0]] > 0)
+                    if server is False:
+                        break
+                    host = pending.pop(0)
+                    if server is LOCAL_SOURCE:
+                        localCopies += 1
+                    busy[server] += 1
+                    running += 1
+                    logger.debug('copying to %s from %s' % (host, server or 'local host'))
+                    pool.addCommand(self.getCopyCmd(server, host))
+
+                if not running:
+                    break
+
+                cmd = pool.getNextCompletedItem()
+                running -= 1
+                busy[cmd.server] -= 1
+                error = self.checkCopy(cmd, expected)
+                if error is None:
+                    self.copies.append((cmd.host, cmd.server))
+                    busy[cmd.host] = 0
+                elif attempts[cmd.host] < self.retries:
+                    logger.debug('retrying copy to %s after %s' % (cmd.host, error))
+                    attempts[cmd.host] += 1
+                    pending.append(cmd.host)
+                else:
+                    failed[cmd.host] = error
+        finally:
+            pool.haltWork()
+            pool.joinWorkers()
+
+        for host in pending:
+            failed[host] = 'no host to copy from'
+        return failed
@@ -3,11 +3,38 @@
 # Copyright (c) Greenplum Inc 2012. All Rights Reserved.
 #
 
+import os
+import threading
+import time
 import unittest
-from gppylib.commands.base import Command, WorkerPool, RemoteExecutionContext, GPHOME, LocalExecutionContext
+from gppylib.commands.base import Command, CommandResult, WorkerPool, RemoteExecutionContext, GPHOME, \
+    LocalExecutionContext, SshConnectionManager, MAX_COMMANDS_PER_HOST, SSH_MAX_SESSIONS
 from mock import patch
 
 
+class TrackedCommand(Command):
+    """Records the order commands ran in and how many ran at a time on each host."""
+    lock = threading.Lock()
+
+    def __init__(self, name, host, tracker, delay=0.05, stderr=''):
+        Command.__init__(self, name, '', remoteHost=host)
+        self.tracker = tracker
+        self.delay = delay
+        self.stderr = stderr
+
+    def run(self, validateAfter=False):
+        with self.lock:
+            running = self.tracker['running']
+            running[self.remoteHost] = running.get(self.remoteHost, 0) + 1
+            self.tracker['max'][self.remoteHost] = max(self.tracker['max'].get(self.remoteHost, 0),
+                                                       running[self.remoteHost])
+            self.tracker['order'].append(self.name)
+        time.sleep(self.delay)
+        with self.lock:
+            self.tracker['running'][self.remoteHost] -= 1
+        self.set_results(CommandResult(1 if self.stderr else 0, '', self.stderr, True, False))
+
+
 class WorkerPoolTestCase(unittest.TestCase):
 
     def tearDown(self):
@@ -33,6 +60,103 @@ class WorkerPoolTestCase(unittest.TestCase):
         self.assertTrue(mock1.called_with('0.00% of jobs completed'))
         w.haltWork()
 
+    def _tracker(self):
+        return {'running': {}, 'max': {}, 'order': []}
+
+    def test_commands_per_host_are_capped(self):
+        tracker = self._tracker()
+        w = WorkerPool(numWorkers=8, maxPerHost=2)
+        for i in range(6):
+            w.addCommand(TrackedCommand('sdw1 %d' % i, 'sdw1', tracker))
+        w.addCommand(TrackedCommand('sdw2', 'sdw2', tracker))
+        w.join()
+        w.haltWork()
+
+        self.assertEqual(tracker['max'], {'sdw1': 2, 'sdw2': 1})
+        self.assertEqual(len(w.getCompletedItems()), 7)
+        # the command for the idle host is not held up behind the busy one
+        self.assertLess(tracker['order'].index('sdw2'), 3)
+
+    def test_commands_per_host_are_not_capped_by_default(self):
+        tracker = self._tracker()
+        w = WorkerPool(numWorkers=12)
+        for i in range(12):
+            w.addCommand(TrackedCommand('sdw1 %d' % i, 'sdw1', tracker, delay=0.2))
+        w.join()
+        w.haltWork()
+
+        self.assertEqual(tracker['max'], {'sdw1': 12})
+
+    def test_adaptive_pool_runs_set_aside_commands_after_lowering_its_limit(self):
+        tracker = self._tracker()
+        w = WorkerPool(numWorkers=16, adaptive=True, maxPerHost=MAX_COMMANDS_PER_HOST)
+        for i in range(30):
+            w.addCommand(TrackedCommand('refused %d' % i, 'sdw1', tracker, delay=0.01,
+                                        stderr='ssh_exchange_identification: Connection closed by remote host'))
+        joiner = threading.Thread(target=w.join)
+        joiner.daemon = True
+        joiner.start()
+        joiner.join(10)
+        w.haltWork()
+
+        self.assertFalse(joiner.is_alive())
+        self.assertEqual(len(w.getCompletedItems()), 30)
+        self.assertEqual(w.getMetrics()['limit'], 1)
+
+    def test_commands_run_in_priority_order(self):
+        tracker = self._tracker()
+        w = WorkerPool(numWorkers=1)
+        w.addCommand(TrackedCommand('block', 'sdw1', tracker, delay=0.2))
+        time.sleep(0.05)
+        w.addCommand(TrackedCommand('low', 'sdw1', tracker, delay=0), priority=5)
+        w.addCommand(TrackedCommand('high', 'sdw1', tracker, delay=0), priority=1)
+        w.addCommand(TrackedCommand('default', 'sdw1', tracker, delay=0))
+        w.join()
+        w.haltWork()
+
+        self.assertEqual(tracker['order'], ['block', 'default', 'high', 'low'])
+
+    def test_adaptive_pool_backs_off_when_ssh_is_refused(self):
+        tracker = self._tracker()
+        w = WorkerPool(numWorkers=8, adaptive=True)
+        w.addCommand(TrackedCommand('refused', 'sdw1', tracker, delay=0,
+                                    stderr='ssh_exchange_identification: Connection closed by remote host'))
+        w.join()
+        self.assertEqual(w.getMetrics()['limit'], 4)
+
+        w.addCommand(TrackedCommand('ok', 'sdw1', tracker, delay=0))
+        w.join()
+        w.haltWork()
+        self.assertEqual(w.getMetrics()['limit'], 5)
+
+    def test_getMetrics(self):
+        tracker = self._tracker()
+        w = WorkerPool(numWorkers=2)
+        w.addCommand(TrackedCommand('start', 'sdw1', tracker, delay=0))
+        w.addCommand(TrackedCommand('start', 'sdw2', tracker, delay=0, stderr='failed'))
+        w.join()
+        metrics = w.getMetrics()
+        w.haltWork()
+
+        self.assertEqual(metrics['queued'], 0)
+        self.assertEqual(metrics['in_flight'], 0)
+        self.assertEqual(metrics['completed'], 2)
+        self.assertEqual(metrics['failed'], 1)
+        self.assertEqual(metrics['latency']['start']['<=0.1'], 2)
+
+    def test_getNextCompletedItem_returns_commands_as_they_finish(self):
+        tracker = self._tracker()
+        w = WorkerPool(numWorkers=2)
+        w.addCommand(TrackedCommand('slow', 'sdw1', tracker, delay=0.3))
+        w.addCommand(TrackedCommand('fast', 'sdw2', tracker, delay=0))
+        first = w.getNextCompletedItem()
+        second = w.getNextCompletedItem()
+        w.join()
+        w.haltWork()
+
+        self.assertEqual([first.name, second.name], ['fast', 'slow'])
+        self.assertGreaterEqual(second.elapsed, 0.3)
+
     def test_RemoteExecutionContext_uses_default_gphome(self):
         self.subject = RemoteExecutionContext("myhost", "my_stdin")
         cmd = Command("dummy name", "echo 'foo'")
@@ -66,6 +190,7 @@ class WorkerPoolTestCase(unittest.TestCase):
         self.subject.execute(cmd)
         self.assertEquals("bar=1 && foo=1 && ls /tmp", cmd.cmdStr)
 
+    @patch.dict(os.environ, {'GP_SSH_NO_MULTIPLEXING': '1'})
     def test_RemoteExecutionContext_uses_ampersand_multiple(self):
         self.subject = RemoteExecutionContext('localhost', None, 'gphome')
         cmd = Command('test', cmdStr='ls /tmp')
@@ -75,6 +200,48 @@ class WorkerPoolTestCase(unittest.TestCase):
         self.assertEquals("bar=1 && foo=1 && ssh -o StrictHostKeyChecking=no -o ServerAliveInterval=60 localhost "
                           "\". gphome/greenplum_path.sh; bar=1 && foo=1 && ls /tmp\"", cmd.cmdStr)
 
+    @patch('gppylib.commands.base.SshConnectionManager._SshConnectionManager__run', return_value=0)
+    def test_SshConnectionManager_reuses_control_connection(self, mock_run):
+        subject = SshConnectionManager()
+
+        first = subject.getSshOptions('sdw1')
+        second = subject.getSshOptions('sdw1')
+        subject.closeAll()
+
+        self.assertEqual(first, second)
+        self.assertIn('-o ControlMaster=no -o ControlPath=', first)
+        self.assertEqual(mock_run.call_count, 2)
+        self.assertIn('-o ControlMaster=yes', mock_run.call_args_list[0][0][0])
+        self.assertIn('-O exit sdw1', mock_run.call_args_list[1][0][0])
+        self.assertEqual(subject.getStats()['handshakes'], 1)
+        self.assertEqual(subject.getStats()['reused'], 1)
+
+    @patch('gppylib.commands.base.SshConnectionManager._SshConnectionManager__run', return_value=0)
+    def test_SshConnectionManager_uses_plain_ssh_above_the_session_limit(self, mock_run):
+        subject = SshConnectionManager()
+
+        options = [subject.getSshOptions('sdw1') for i in range(SSH_MAX_SESSIONS + 1)]
+        self.assertEqual(options[-1], SshConnectionManager.SSH_OPTIONS)
+        self.assertIn('-o ControlPath=', options[-2])
+
+        subject.releaseSshOptions('sdw1', options[-1])
+        subject.releaseSshOptions('sdw1', options[0])
+        self.assertIn('-o ControlPath=', subject.getSshOptions('sdw1'))
+        self.assertEqual(subject.getSshOptions('sdw1'), SshConnectionManager.SSH_OPTIONS)
+        subject.closeAll()
+
+    @patch('gppylib.commands.base.SshConnectionManager._SshConnectionManager__run', return_value=255)
+    def test_SshConnectionManager_falls_back_to_plain_ssh(self, mock_run):
+        subject = SshConnectionManager()
+
+        options = [subject.getSshOptions('sdw1'), subject.getSshOptions('sdw1')]
+        subject.closeAll()
+
+        self.assertEqual(options, [SshConnectionManager.SSH_OPTIONS] * 2)
+        # the connection is only attempted once
+        self.assertEqual(mock_run.call_count, 1)
+        self.assertEqual(subject.getStats()['reused'], 0)
+
     def test_no_workders_in_WorkerPool(self):
         with self.assertRaises(Exception):
             WorkerPool(numWorkers=0)
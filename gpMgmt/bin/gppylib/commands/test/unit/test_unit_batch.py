@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+#
+# Copyright (c) Greenplum Inc 2012. All Rights Reserved.
+#
+
+import base64
+import pickle
+import unittest
+from StringIO import StringIO
+from gppylib.commands.base import Command, CommandResult, REMOTE
+from gppylib.commands.batch import RemoteBatch, groupCommandsByHost, getCompletedCommands, BATCH_RESULT_PREFIX
+from gppylib.operations import Operation
+from mock import Mock, patch
+
+
+class EchoOperation(Operation):
+    def execute(self):
+        return 'echo'
+
+
+class RunningCommand(Command):
+    def run(self, validateAfter=False):
+        pass
+
+
+def result_line(index, result):
+    return BATCH_RESULT_PREFIX + base64.b64encode(pickle.dumps((index, 0.5, result)))
+
+
+class BatchTestCase(unittest.TestCase):
+    def test_group_commands_by_host__batches_plain_remote_commands_that_share_a_host(self):
+        a1 = Command('a1', 'ls /a1', ctxt=REMOTE, remoteHost='sdw1')
+        b1 = Command('b1', 'ls /b1', ctxt=REMOTE, remoteHost='sdw2')
+        local = Command('local', 'ls /local')
+        a2 = Command('a2', 'ls /a2', ctxt=REMOTE, remoteHost='sdw1')
+        custom = RunningCommand('custom', 'ls /custom', ctxt=REMOTE, remoteHost='sdw1')
+
+        grouped = groupCommandsByHost([a1, b1, local, a2, custom])
+
+        self.assertEqual(len(grouped), 4)
+        self.assertTrue(isinstance(grouped[0], RemoteBatch))
+        self.assertEqual(grouped[0].remoteHost, 'sdw1')
+        self.assertEqual(grouped[0].items, [a1, a2])
+        self.assertEqual(grouped[1:], [b1, local, custom])
+
+    def test_remote_batch__sets_the_results_of_each_item(self):
+        cmd = Command('ls', 'ls /data', ctxt=REMOTE, remoteHost='sdw1')
+        cmd.propagate_env_map = {'LC_ALL': 'C'}
+        operation = EchoOperation()
+        missing = Command('ls', 'ls /missing', ctxt=REMOTE, remoteHost='sdw1')
+        missing.propagate_env_map = {}
+        subject = RemoteBatch('batch', [cmd, operation, missing], 'sdw1')
+
+        stdin = StringIO(subject.exec_context.stdin)
+        (execname, maxConcurrency, items) = [pickle.load(stdin) for i in range(3)]
+        self.assertEqual(maxConcurrency, 8)
+        self.assertEqual([items[0], items[2]], [('command', 'LC_ALL=C && ls /data', None),
+                                                ('command', 'ls /missing', None)])
+        self.assertEqual(items[1][0], 'operation')
+        self.assertTrue(isinstance(items[1][1], EchoOperation))
+
+        # results arrive in the order the items finish
+        stdout = "\n".join([result_line(1, 'echo'), 'noise', result_line(0, (0, 'base\n', ''))])
+        with patch.object(Command, 'run', autospec=True,
+                          side_effect=lambda self: self.set_results(CommandResult(255, stdout, 'lost connection',
+                                                                                  True, False))):
+            subject.run()
+
+        self.assertEqual(cmd.get_results().stdout, 'base\n')
+        self.assertTrue(cmd.was_successful())
+        self.assertEqual(cmd.elapsed, 0.5)
+        self.assertEqual(operation.ret, 'echo')
+        self.assertFalse(missing.was_successful())
+        self.assertEqual(missing.get_results().rc, 255)
+        self.assertEqual(missing.get_stderr(), 'lost connection')
+
+    def test_get_completed_commands__replaces_batches_by_their_items(self):
+        a1 = Command('a1', 'ls /a1', ctxt=REMOTE, remoteHost='sdw1')
+        a2 = Command('a2', 'ls /a2', ctxt=REMOTE, remoteHost='sdw1')
+        b1 = Command('b1', 'ls /b1', ctxt=REMOTE, remoteHost='sdw2')
+        pool = Mock()
+        pool.getCompletedItems.return_value = [b1, RemoteBatch('batch', [a1, a2], 'sdw1')]
+
+        self.assertEqual(getCompletedCommands(pool), [b1, a1, a2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+#
+# Copyright (c) Greenplum Inc 2012. All Rights Reserved.
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+from gppylib.commands.base import CommandResult
+from gppylib.commands.fanout import FanoutCopy, LOCAL_SOURCE
+from mock import patch
+
+
+class FanoutCopyTestCase(unittest.TestCase):
+    def setUp(self):
+        # the pool completes copies in the order they are dispatched
+        self.queued = []
+        self.failing = []
+        patcher = patch('gppylib.commands.fanout.WorkerPool')
+        self.addCleanup(patcher.stop)
+        pool = patcher.start().return_value
+        pool.addCommand.side_effect = self.queued.append
+        pool.getNextCompletedItem.side_effect = self._next_completed
+
+    def _next_completed(self, quiet=True):
+        cmd = self.queued.pop(0)
+        if (cmd.server, cmd.host) in self.failing:
+            self.failing.remove((cmd.server, cmd.host))
+            cmd.set_results(CommandResult(255, '', 'Connection refused', True, False))
+        else:
+            cmd.set_results(CommandResult(0, 'd41d8cd98f00b204e9800998ecf8427e  -\n', '', True, False))
+        return cmd
+
+    def test_run__hosts_that_have_the_files_pass_them_on(self):
+        hosts = ['sdw%d' % i for i in range(1, 8)]
+        subject = FanoutCopy(['/tmp/gp.tar'], '/data/', hosts, fanout=2)
+
+        failed = subject.run()
+
+        self.assertEqual(failed, {})
+        self.assertEqual(subject.copies, [('sdw1', LOCAL_SOURCE), ('sdw2', LOCAL_SOURCE),
+                                          ('sdw3', 'sdw1'), ('sdw4', 'sdw1'), ('sdw5', 'sdw2'),
+                                          ('sdw6', 'sdw2'), ('sdw7', 'sdw3')])
+
+    def test_run__failed_copy_is_retried_from_the_local_host(self):
+        self.failing = [('sdw1', 'sdw2'), (LOCAL_SOURCE, 'sdw2')]
+        subject = FanoutCopy(['/tmp/gp.tar'], '/data/', ['sdw1', 'sdw2', 'sdw3'], fanout=1)
+
+        failed = subject.run()
+
+        self.assertEqual(subject.copies, [('sdw1', LOCAL_SOURCE), ('sdw3', 'sdw1')])
+        self.assertEqual(failed, {'sdw2': 'exit 255: Connection refused'})
+        self.assertEqual(self.failing, [])
+
+    @patch('gppylib.commands.fanout.FanoutCopy.getLocalChecksums', return_value='0cc175b9c0f1b6a831c399e269772661  -')
+    def test_run__checksum_mismatch_fails_the_copy(self, mock_checksums):
+        subject = FanoutCopy(['/tmp/gp.tar'], '/data/gp.tar', ['sdw1'], verify=True, retries=0)
+
+        self.assertEqual(subject.run(), {'sdw1': 'checksum mismatch'})
+
+    def test_get_copy_cmd__relays_copy_with_rsync_on_the_host_that_has_the_files(self):
+        srcdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, srcdir)
+        subject = FanoutCopy([srcdir + '/'], '/data/pkg', ['sdw1', 'sdw2'], recursive=True, bwlimit=1000)
+
+        local = subject.getCopyCmd(LOCAL_SOURCE, 'sdw1').cmdStr
+        relay = subject.getCopyCmd('sdw1', 'sdw2').cmdStr
+
+        rsync = 'rsync --partial -t -r --bwlimit=1000 -e "ssh -o BatchMode=yes -o StrictHostKeyChecking=no"'
+        self.assertEqual(local, '%s %s/ sdw1:/data/pkg' % (rsync, srcdir))
+        self.assertEqual(relay, "ssh -o BatchMode=yes -o StrictHostKeyChecking=no sdw1 '%s /data/pkg/ sdw2:/data/pkg'"
+                         % rsync)
+
+    def test_get_paths__copies_into_a_directory_ending_with_a_slash(self):
+        subject = FanoutCopy(['/tmp/a.tar', 'b.tar'], '/data', ['sdw1'])
+
+        self.assertEqual(subject.paths, [('/tmp/a.tar', '/data/a.tar'), ('b.tar', '/data/b.tar')])
+        self.assertEqual(FanoutCopy(['/tmp/a.tar'], '/data/', ['sdw1']).paths, [('/tmp/a.tar', '/data/a.tar')])
+        self.assertEqual(FanoutCopy(['/tmp/a.tar'], '/data/c.tar', ['sdw1']).paths, [('/tmp/a.tar', '/data/c.tar')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,6 +8,8 @@ TODO: module docs
 import sys
 import os
 import stat
+import threading
+import time
 
 try:
     from pygresql import pgdb
@@ -152,16 +154,39 @@ class DbURL:
 
 
 def connect(dburl, utility=False, verbose=False,
-            encoding=None, allowSystemTableMods=False, logConn=True):
+            encoding=None, allowSystemTableMods=False, logConn=True, pooled=True):
+    """
+    Open a connection to dburl.  Once enablePooling() has been called the
+    connection comes from the shared pool, and closing it returns it there,
+    unless pooled is False.
+    """
+    if pool is not None and pooled:
+        return pool.connect(dburl, utility, verbose, encoding, allowSystemTableMods, logConn)
+    return _connect(dburl, utility, verbose, encoding, allowSystemTableMods, logConn)
 
+
+def _startup_options(utility, verbose, encoding, allowSystemTableMods):
+    options = []
     if utility:
-        options = '-c gp_session_role=utility'
-    else:
-        options = ''
+        options.append('-c gp_session_role=utility')
 
     # MPP-13779, et al
     if allowSystemTableMods:
-        options += ' -c allow_system_table_mods=true'
+        options.append('-c allow_system_table_mods=true')
+
+    # by default, libpq will print WARNINGS to stdout; setting these in the
+    # startup packet saves a round trip each compared to a SET afterwards
+    if not verbose:
+        options.append('-c client_min_messages=error')
+
+    if encoding:
+        options.append('-c client_encoding=%s' % encoding)
+
+    return ' '.join(options)
+
+
+def _connect(dburl, utility=False, verbose=False,
+             encoding=None, allowSystemTableMods=False, logConn=True):
 
     # bypass pgdb.connect() and instead call pgdb._connect_
     # to avoid silly issues with : in ipv6 address names and the url string
@@ -169,7 +194,7 @@ def connect(dburl, utility=False, verbose=False,
     dbbase   = dburl.pgdb
     dbhost   = dburl.pghost
     dbport   = int(dburl.pgport)
-    dbopt    = options
+    dbopt    = _startup_options(utility, verbose, encoding, allowSystemTableMods)
     dbtty    = "1"
     dbuser   = dburl.pguser
     dbpasswd = dburl.pgpass
@@ -214,20 +239,6 @@ def connect(dburl, utility=False, verbose=False,
 
     conn = pgdb.pgdbCnx(cnx)
 
-    #by default, libpq will print WARNINGS to stdout
-    if not verbose:
-        cursor=conn.cursor()
-        cursor.execute("SET CLIENT_MIN_MESSAGES='ERROR'")
-        conn.commit()
-        cursor.close()
-
-    # set client encoding if needed
-    if encoding:
-        cursor=conn.cursor()
-        cursor.execute("SET CLIENT_ENCODING='%s'" % encoding)
-        conn.commit()
-        cursor.close()
-
     def __enter__(self):
         return self
     def __exit__(self, type, value, traceback):
@@ -236,6 +247,196 @@ def connect(dburl, utility=False, verbose=False,
     return conn
 
 
+class PooledConnection(object):
+    """
+    A connection handed out by a ConnectionPool.  It behaves like the pgdb
+    connection it wraps, except that close() gives it back to the pool.
+    """
+
+    def __init__(self, pool, key, conn):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self.lastUsed = time.time()
+        self.closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        if self.closed:
+            raise pgdb.OperationalError("connection has been closed")
+        self.closed = True
+        self._pool.release(self)
+
+
+class ConnectionPool:
+    """
+    A thread safe pool of open connections, keyed by the database URL and
+    the connection options.
+
+    At most max_size connections are open at a time; when the pool is full
+    the least recently used idle connection, for whatever key, is closed to
+    make room, and if none is idle connect() waits for one to be released.
+    Idle connections are closed after idle_timeout seconds, and one that
+    has been idle for more than check_interval seconds is checked with a
+    trivial query before it is handed out again.
+    """
+
+    def __init__(self, max_size=16, idle_timeout=300, check_interval=30):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.idle = {}
+        self.nopen = 0
+        self.cond = threading.Condition()
+
+    @staticmethod
+    def key(dburl, utility, verbose, encoding, allowSystemTableMods):
+        return (dburl.pghost, int(dburl.pgport), dburl.pgdb, dburl.pguser,
+                bool(utility), bool(verbose), encoding, bool(allowSystemTableMods))
+
+    def connect(self, dburl, utility=False, verbose=False,
+                encoding=None, allowSystemTableMods=False, logConn=True):
+        key = self.key(dburl, utility, verbose, encoding, allowSystemTableMods)
+        while True:
+            pooled = self._checkout(key)
+            if pooled is None:
+                break
+            if self._healthy(pooled):
+                pooled.closed = False
+                return pooled
+            self._discard(pooled)
+
+        try:
+            conn = _connect(dburl, utility, verbose, encoding, allowSystemTableMods, logConn)
+        except:
+            self._discard(None)
+            raise
+        return PooledConnection(self, key, conn)
+
+    def _checkout(self, key):
+        """
+        Return an idle connection for key, or None after reserving room for
+        a new one.
+        """
+        self.cond.acquire()
+        try:
+            while True:
+                self._evictIdle(time.time() - self.idle_timeout)
+                if self.idle.get(key):
+                    return self.idle[key].pop()
+                if self.nopen < self.max_size:
+                    self.nopen += 1
+                    return None
+                if not self._evictLeastRecentlyUsed():
+                    self.cond.wait()
+        finally:
+            self.cond.release()
+
+    def _healthy(self, pooled):
+        if time.time() - pooled.lastUsed <= self.check_interval:
+            return True
+        try:
+            pooled._conn._cnx.query('SELECT 1')
+            return True
+        except Exception, e:
+            logger.debug('Discarding pooled connection: %s' % str(e))
+            return False
+
+    def release(self, pooled):
+        """
+        Make pooled available for reuse, after undoing any open transaction
+        and session settings; a connection that cannot be reset is closed.
+        """
+        conn = pooled._conn
+        try:
+            if conn._tnx:
+                conn._tnx = False
+                conn._cnx.query('ROLLBACK; RESET ALL')
+            else:
+                conn._cnx.query('RESET ALL')
+        except Exception, e:
+            logger.debug('Discarding pooled connection: %s' % str(e))
+            self._discard(pooled)
+            return
+
+        pooled.lastUsed = time.time()
+        self.cond.acquire()
+        try:
+            self.idle.setdefault(pooled._key, []).append(pooled)
+            self.cond.notify()
+        finally:
+            self.cond.release()
+
+    def _discard(self, pooled):
+        if pooled is not None:
+            _close(pooled._conn)
+        self.cond.acquire()
+        try:
+            self.nopen -= 1
+            self.cond.notify()
+        finally:
+            self.cond.release()
+
+    def _evictIdle(self, before):
+        for key, conns in self.idle.items():
+            for pooled in [c for c in conns if c.lastUsed < before]:
+                conns.remove(pooled)
+                _close(pooled._conn)
+                self.nopen -= 1
+
+    def _evictLeastRecentlyUsed(self):
+        idle = [c for conns in self.idle.values() for c in conns]
+        if not idle:
+            return False
+        pooled = min(idle, key=lambda c: c.lastUsed)
+        self.idle[pooled._key].remove(pooled)
+        _close(pooled._conn)
+        self.nopen -= 1
+        return True
+
+    def closeAll(self):
+        """Close all idle connections."""
+        self.cond.acquire()
+        try:
+            self._evictIdle(float('inf'))
+        finally:
+            self.cond.release()
+
+
+def _close(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+# the shared pool that connect() uses, once enabled
+pool = None
+
+def enablePooling(max_size=16, idle_timeout=300, check_interval=30):
+    """
+    Make connect() hand out connections from a shared pool from now on.
+    """
+    global pool
+    if pool is None:
+        pool = ConnectionPool(max_size, idle_timeout, check_interval)
+    return pool
+
+def disablePooling():
+    global pool
+    if pool is not None:
+        pool.closeAll()
+        pool = None
+
+
 def execSQL(conn,sql):
     """
     If necessary, user must invoke conn.commit().
@@ -7,7 +7,10 @@
 """
 import unittest
 
+from mock import Mock, patch
+
 from gppylib.db.dbconn import *
+from gppylib.db.dbconn import _startup_options
  
 class TestDbURL(unittest.TestCase):
     """UnitTest class for DbURL class"""
@@ -122,6 +125,114 @@ class TestDbURL(unittest.TestCase):
             os.environ['PGPASSWORD'] = old_pass
 
 
+class TestStartupOptions(unittest.TestCase):
+
+    def testSessionSettingsAreStartupOptions(self):
+        self.assertEqual(_startup_options(False, False, 'UTF8', False),
+                         '-c client_min_messages=error -c client_encoding=UTF8')
+        self.assertEqual(_startup_options(True, True, None, True),
+                         '-c gp_session_role=utility -c allow_system_table_mods=true')
+
+
+def mock_connection(dburl, *args):
+    conn = Mock()
+    conn._tnx = False
+    conn.dburl = dburl
+    return conn
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.dburl = DbURL(hostname='sdw1', port=5432, dbname='db', username='gpadmin', password='')
+        self.connect = patch('gppylib.db.dbconn._connect', side_effect=mock_connection).start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def testCloseReturnsConnectionForReuse(self):
+        pool = ConnectionPool(max_size=2)
+
+        conn = pool.connect(self.dburl)
+        raw = conn._conn
+        conn.close()
+        conn = pool.connect(self.dburl)
+
+        self.assertIs(conn._conn, raw)
+        self.assertEqual(self.connect.call_count, 1)
+        raw._cnx.query.assert_called_once_with('RESET ALL')
+
+    def testReleaseRollsBackOpenTransaction(self):
+        pool = ConnectionPool()
+        conn = pool.connect(self.dburl)
+        conn._conn._tnx = True
+
+        conn.close()
+
+        conn._conn._cnx.query.assert_called_once_with('ROLLBACK; RESET ALL')
+        self.assertFalse(conn._conn._tnx)
+
+    def testOptionsArePartOfTheKey(self):
+        pool = ConnectionPool()
+
+        pool.connect(self.dburl).close()
+        conn = pool.connect(self.dburl, utility=True)
+
+        self.assertEqual(self.connect.call_count, 2)
+        self.assertTrue(conn._key[4])
+
+    def testFullPoolEvictsLeastRecentlyUsedIdleConnection(self):
+        pool = ConnectionPool(max_size=1)
+        conn = pool.connect(self.dburl)
+        conn.close()
+
+        pool.connect(self.dburl, encoding='UTF8')
+
+        conn._conn.close.assert_called_once_with()
+        self.assertEqual(pool.nopen, 1)
+
+    def testIdleConnectionsAreEvicted(self):
+        pool = ConnectionPool(idle_timeout=60)
+        conn = pool.connect(self.dburl)
+        conn.close()
+        conn.lastUsed -= 120
+
+        pool.connect(self.dburl)
+
+        conn._conn.close.assert_called_once_with()
+        self.assertEqual(self.connect.call_count, 2)
+        self.assertEqual(pool.nopen, 1)
+
+    def testBrokenConnectionIsReplacedOnCheckout(self):
+        pool = ConnectionPool(check_interval=10)
+        conn = pool.connect(self.dburl)
+        conn.close()
+        conn.lastUsed -= 20
+        conn._conn._cnx.query.side_effect = pgdb.InternalError('server closed the connection')
+
+        new_conn = pool.connect(self.dburl)
+
+        self.assertIsNot(new_conn._conn, conn._conn)
+        self.assertEqual(pool.nopen, 1)
+
+    def testFailedConnectFreesItsSlot(self):
+        pool = ConnectionPool(max_size=1)
+        self.connect.side_effect = ConnectionError('Failed to connect to db')
+
+        self.assertRaises(ConnectionError, pool.connect, self.dburl)
+        self.assertEqual(pool.nopen, 0)
+
+    def testUnpooledConnectBypassesEnabledPool(self):
+        pool = enablePooling(max_size=1)
+        try:
+            conn = connect(self.dburl, pooled=False)
+        finally:
+            disablePooling()
+
+        self.assertNotIsInstance(conn, PooledConnection)
+        self.assertEqual(pool.nopen, 0)
+
+
 #----------------------- Main ----------------------
 if __name__ == '__main__':
     unittest.main()
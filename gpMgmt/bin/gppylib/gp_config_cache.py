@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# Line too long - pylint: disable=C0301
+# Invalid name  - pylint: disable=C0103
+
+"""
+  gp_config_cache.py, based on gp_era.py
+
+  The segment configuration of the cluster as of the last clean gpstop, so
+  that gpstart does not have to start the master in utility mode just to
+  read gp_segment_configuration.  The cache is only trusted while the master
+  data directory is exactly as gpstop left it: same catalog version, a clean
+  shutdown and the same latest checkpoint.  The WAL insert location at the
+  time the configuration was read must also be that of the shutdown
+  checkpoint, so that the configuration cannot have changed (e.g. by FTS
+  failing over a segment while gpstop waited for sessions to end) between
+  the read and the shutdown.
+"""
+
+import sys, os, stat, re
+import hashlib
+
+from gppylib.gparray import GpArray, Segment, MODE_SYNCHRONIZED, STATUS_UP
+
+ENTRY_RE = re.compile(r"(\w+)\s*=\s*(.*)$")
+
+CLEAN_SHUTDOWN_STATE = 'shut down'
+
+def INFO(msg):
+    self = sys._getframe(1).f_locals['self']
+    if self.logger: self.logger.info(msg)
+
+def DEBUG(msg):
+    self = sys._getframe(1).f_locals['self']
+    if self.logger: self.logger.debug(msg)
+
+class GpConfigCacheFile:
+    """
+    Manage the gp_config_cache file.
+    """
+
+    def __init__(self, datadir, logger=None):
+        """
+        Initialize path to gp_config_cache file and reset values.
+        Log subsequent activity using specified logger.
+        """
+        self.datadir      = datadir
+        self.filepath     = os.path.join(self.datadir, 'gp_config_cache')
+        self.catversion   = None
+        self.checkpoint   = None
+        self.snapshot     = None
+        self.segments     = []
+        self.logger       = logger
+
+
+    def read(self):
+        """
+        Open the gp_config_cache file and parse its contents.
+        """
+        DEBUG('%s - read' % self.filepath)
+
+        with open(self.filepath) as f:
+            self.parse(f)
+
+
+    def parse(self, f):
+        """
+        Parse f, verifying the checksum that ends the file.
+        Raises an exception if the file is incomplete or has been changed.
+        """
+        self.catversion = None
+        self.checkpoint = None
+        self.snapshot = None
+        self.segments = []
+
+        m = hashlib.sha256()
+        checksum = None
+        for line in f:
+            match = re.match(ENTRY_RE, line.strip())
+            if match and match.group(1) == 'checksum':
+                checksum = match.group(2)
+                break
+            m.update(line)
+            if not match:
+                continue
+
+            (key, value) = match.groups()
+            DEBUG('parse: %s = %s' % (key, value))
+            if key == 'catversion':
+                self.catversion = value
+            elif key == 'checkpoint':
+                self.checkpoint = value
+            elif key == 'snapshot':
+                self.snapshot = value
+            elif key == 'segment':
+                self.segments.append(Segment.initFromString(value))
+
+        if checksum != m.hexdigest():
+            raise Exception('checksum mismatch in %s' % self.filepath)
+        if self.catversion is None or self.checkpoint is None or self.snapshot is None or not self.segments:
+            raise Exception('incomplete segment configuration in %s' % self.filepath)
+
+
+    def format(self, f):
+        """
+        Generate gp_config_cache contents based on current values
+        """
+        lines = ["# Greenplum Database segment configuration as of the last clean shutdown.\n",
+                 "# Do not change the contents of this file.\n",
+                 'catversion = %s\n' % self.catversion,
+                 'checkpoint = %s\n' % self.checkpoint,
+                 'snapshot = %s\n' % self.snapshot]
+        lines.extend(['segment = %s\n' % repr(seg) for seg in self.segments])
+
+        m = hashlib.sha256()
+        for line in lines:
+            f.write(line)
+            m.update(line)
+        f.write('checksum = %s\n' % m.hexdigest())
+        INFO('wrote configuration of %d segments at checkpoint %s' % (len(self.segments), self.checkpoint))
+
+
+    def write(self, gparray, controldata, snapshot):
+        """
+        Create or replace the gp_config_cache file with the configuration
+        in gparray and the master state in controldata, an already run
+        PgControlData command for the stopped master.  snapshot is the WAL
+        insert location read just before gparray was read.
+        """
+        DEBUG('%s - write' % self.filepath)
+
+        state = controldata.get_value('Database cluster state')
+        if state != CLEAN_SHUTDOWN_STATE:
+            raise Exception('master was not shut down cleanly (%s)' % state)
+
+        self.catversion = controldata.get_value('Catalog version number')
+        self.checkpoint = controldata.get_value('Latest checkpoint location')
+        self.snapshot = snapshot
+        self.segments = gparray.getDbList()
+        self.check_snapshot()
+
+        self.remove()
+
+        # write the file under a temporary name, so that a partially written
+        # file is never mistaken for a cache
+        tmppath = self.filepath + '.tmp'
+        with open(tmppath, 'w') as f:
+            self.format(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmppath, stat.S_IRUSR)  # user read permissions (0400)
+        os.rename(tmppath, self.filepath)
+
+
+    def validate(self, controldata):
+        """
+        Raises an exception unless the cached configuration still describes
+        the cluster, given the PgControlData of the stopped master.
+        """
+        catversion = controldata.get_value('Catalog version number')
+        if catversion != self.catversion:
+            raise Exception('catalog version %s does not match cached version %s' % (catversion, self.catversion))
+
+        state = controldata.get_value('Database cluster state')
+        if state != CLEAN_SHUTDOWN_STATE:
+            raise Exception('master was not shut down cleanly (%s)' % state)
+
+        checkpoint = controldata.get_value('Latest checkpoint location')
+        if checkpoint != self.checkpoint:
+            raise Exception('master has run since the configuration was cached')
+
+        self.check_snapshot()
+
+
+    def check_snapshot(self):
+        """
+        Raises an exception if WAL was written between reading the
+        configuration and the shutdown checkpoint.
+        """
+        if self.snapshot != self.checkpoint:
+            raise Exception('configuration was read at %s, before the shutdown checkpoint at %s'
+                            % (self.snapshot, self.checkpoint))
+
+
+    def get_gparray(self):
+        """
+        Returns a GpArray of the cached configuration, set up the way
+        GpArray.initFromCatalog() sets it up.
+        """
+        array = GpArray([seg.copy() for seg in self.segments], self.segments)
+
+        # same rule as GpArray.initFromCatalog()
+        array.recoveredSegmentDbids = [seg.getSegmentDbId() for seg in self.segments
+                                       if seg.getSegmentContentId() >= 0
+                                       and seg.getSegmentPreferredRole() != seg.getSegmentRole()
+                                       and seg.getSegmentMode() == MODE_SYNCHRONIZED
+                                       and seg.getSegmentStatus() == STATUS_UP]
+        return array
+
+
+    def remove(self):
+        """
+        Remove the gp_config_cache file.
+        """
+        DEBUG('%s - remove' % self.filepath)
+
+        if os.path.exists(self.filepath):
+            DEBUG('found existing file')
+
+            os.remove(self.filepath)
+            DEBUG('removed existing file')
@@ -1,5 +1,6 @@
 
 from gppylib.commands.base import REMOTE, WorkerPool
+from gppylib.commands.batch import addCommandsByHost, getCompletedCommands
 from gppylib.commands.pg import PgControlData
 
 
@@ -101,18 +102,21 @@ class HeapChecksum:
     # private methods #######################################
     def _get_pgcontrol_data_from_segments(self, gpdb_list):
         pool = WorkerPool(numWorkers=self.workers)
+        cmds = []
         try:
             for gpdb in gpdb_list:  # iterate for all segments
                 cmd = PgControlData(name='run pg_controldata', datadir=gpdb.getSegmentDataDirectory(),
                                     ctxt=REMOTE, remoteHost=gpdb.getSegmentHostName())
                 cmd.gparray_gpdb = gpdb
-                pool.addCommand(cmd)
+                cmds.append(cmd)
+            # one ssh per host rather than one per segment
+            addCommandsByHost(pool, cmds)
             pool.join()
         finally:
             # Make sure that we halt the workers or else we'll hang
             pool.haltWork()
             pool.joinWorkers()
-        return pool.getCompletedItems()
+        return getCompletedCommands(pool)
 
     def _logger_warn(self, message):
         """
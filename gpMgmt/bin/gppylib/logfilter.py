@@ -37,15 +37,25 @@ Module contents:
     ---- Miscellaneous filters
     NotNull() - drop items which are equivalent to False
 
+    ---- Reading log files in timestamp order
+    BisectByTimestamp() - find where to start reading a plain log file
+    GzipLogIndex - sparse timestamp index of a gzip-compressed log file
+    SkipBytes() - skip the given number of bytes of an input file
+    StopAtTimestamp() - end a stream of lines at a timestamp
+    MergeByTimestamp() - merge streams of lines in timestamp order
+
     ---- Utilities for setting up filter parameters
     filterize() - wrap a filter for use in FilterLogEntries filter list
     spiffInterval() - get begin/end datetime given any subset of begin/end/duration
 """
 
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
+import heapq
+import os
 import re
 import sys
 import time
+import zlib
 
 timestampPattern = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d(\.\d*)?')
 # This pattern matches the date and time stamp at the beginning of a line
@@ -909,6 +919,316 @@ def NotNull(iterable):
     return (item for item in iterable if item)
 
 
+#----------------- Reading log files in timestamp order -----------------
+
+# GPDB writes log entries in timestamp order, give or take the entries that
+# backends write concurrently.  When a log file is read from an offset found
+# by timestamp, the timestamp searched for is this much earlier, and reading
+# stops this much later than the end of the requested range.
+seekSlack = timedelta(minutes=1)
+
+# Bytes of uncompressed data between the entries of a GzipLogIndex
+indexInterval = 1 << 20
+
+
+def BisectByTimestamp(fileIn, stamp, minBytes=1 << 16):
+    """
+    Find the offset from which to read a plain GPDB log file to get all the
+    log entries with a timestamp at or after the given one, assuming that
+    the entries are in timestamp order.  Returns the offset of the start of
+    a line having a timestamp lower than stamp, or 0.  The returned offset
+    is less than minBytes before the first such line found by bisection.
+
+    BisectByTimestamp(fileIn, stamp, minBytes) -> offset
+        fileIn -- a file open for reading, which supports seek() and tell()
+        stamp -- a timestamp string in YYYY-MM-DD HH:MM:SS format
+        minBytes -- bisection stops when the range is smaller than this
+
+    Example:
+        # Print the log entries of the last hour of a big log file
+        f = open(filename, 'rU')
+        begin = datetime.now() - timedelta(hours=1)
+        f.seek(BisectByTimestamp(f, begin.strftime('%Y-%m-%d %H:%M:%S')))
+        for s in TimestampInBounds(f, begin, None):
+            print s,
+    """
+    def nextTimestampedLine(lo, hi):
+        # offset and timestamp of the first timestamped line starting in [lo, hi)
+        fileIn.seek(lo)
+        if lo > 0:
+            fileIn.readline()                # skip the rest of a partial line
+        while True:
+            offset = fileIn.tell()
+            if offset >= hi:
+                return None, None
+            s = fileIn.readline()
+            if not s:
+                return None, None
+            tsmatch = timestampPattern.match(s)
+            if tsmatch:
+                return offset, tsmatch.group(0)
+
+    fileIn.seek(0, 2)
+    lo, hi = 0, fileIn.tell()
+    while hi - lo > minBytes:
+        mid = (lo + hi) // 2
+        offset, timestamp = nextTimestampedLine(mid, hi)
+        if offset is None or timestamp >= stamp:
+            hi = mid
+        else:
+            lo = offset
+    return lo
+
+
+class GzipLogIndex(object):
+    """
+    A sparse index of the timestamps in a gzip-compressed GPDB log file,
+    so that reading the entries from a given time on need not filter the
+    lines before them.  The index is kept in a hidden file next to the log
+    file, and rebuilt when the log file changes.
+
+    Every indexInterval bytes of uncompressed data, the index notes the
+    timestamp of the next timestamped line, the offset in the compressed
+    file of the gzip member the line is in, and the offset of the line in
+    the uncompressed data of that member.  Decompression can only start at
+    the beginning of a gzip member, so within a member the data before the
+    line is still decompressed, but then skipped by SkipBytes().
+
+    GzipLogIndex(filename) -> index
+        filename -- name of a gzip-compressed log file
+
+    Example:
+        # Print the log entries of a compressed log file from a given time on
+        block, offset = GzipLogIndex(filename).lookup('2016-05-01 12:00:00')
+        f = open(filename, 'rb')
+        f.seek(block)
+        gz = gzip.GzipFile(fileobj=f)
+        SkipBytes(gz, offset)
+        for s in TimestampInBounds(gz, datetime(2016, 5, 1, 12), None):
+            print s,
+    """
+    header = 'gplogfilter gzip index'
+
+    def __init__(self, filename, interval=None):
+        self.filename = filename
+        self.indexname = indexFileName(filename)
+        self.interval = interval or indexInterval
+        self.entries = []                    # [(timestamp, block, offset), ...]
+
+    def lookup(self, stamp):
+        """
+        Returns (block, offset): the offset of the gzip member, and the
+        offset within its uncompressed data, of the last indexed log entry
+        having a timestamp lower than stamp; or (0, 0).  The index is loaded
+        from its file, or built and saved if that is missing or out of date.
+        """
+        if not self.load():
+            self.build()
+            self.save()
+        position = (0, 0)
+        for (timestamp, block, offset) in self.entries:
+            if timestamp >= stamp:
+                break
+            position = (block, offset)
+        return position
+
+    def signature(self):
+        st = os.stat(self.filename)
+        return '%s|%d|%d' % (self.header, st.st_size, int(st.st_mtime))
+
+    def load(self):
+        """
+        Loads the index from its file.  Returns False if there is no index
+        file for the current version of the log file.
+        """
+        try:
+            f = open(self.indexname, 'r')
+        except IOError:
+            return False
+        try:
+            if f.readline().rstrip('\n') != self.signature():
+                return False
+            entries = []
+            for line in f:
+                (timestamp, block, offset) = line.rstrip('\n').split('|')
+                entries.append((timestamp, int(block), int(offset)))
+        except ValueError:
+            return False
+        finally:
+            f.close()
+        self.entries = entries
+        return True
+
+    def save(self):
+        """
+        Writes the index to its file.  The index is only an optimization, so
+        failing to write it (e.g. to a read-only directory) is not an error.
+        """
+        tmpname = self.indexname + '.%d' % os.getpid()
+        try:
+            f = open(tmpname, 'w')
+            try:
+                f.write(self.signature() + '\n')
+                for entry in self.entries:
+                    f.write('%s|%d|%d\n' % entry)
+            finally:
+                f.close()
+            os.rename(tmpname, self.indexname)
+        except (IOError, OSError):
+            try:
+                os.remove(tmpname)
+            except OSError:
+                pass
+
+    def build(self, chunksize=1 << 16):
+        """
+        Reads the whole log file to build the index.
+        """
+        self.entries = []
+        f = open(self.filename, 'rb')
+        try:
+            block = 0                        # offset of the current member
+            consumed = 0                     # compressed bytes read
+            member = _GzipMemberScanner(self, block)
+            while True:
+                chunk = f.read(chunksize)
+                if not chunk:
+                    break
+                consumed += len(chunk)
+                while chunk:
+                    chunk = member.feed(chunk)
+                    # Leftover data is the start of the next member, if it
+                    # isn't just padding.
+                    if chunk and chunk.strip('\0'):
+                        member.finish()
+                        block = consumed - len(chunk)
+                        member = _GzipMemberScanner(self, block)
+                    else:
+                        chunk = ''
+            member.finish()
+        finally:
+            f.close()
+
+
+class _GzipMemberScanner(object):
+    """
+    Decompresses one gzip member for GzipLogIndex.build(), adding an index
+    entry for the first timestamped line after every index interval.
+    """
+    def __init__(self, index, block):
+        self.index = index
+        self.block = block
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.buf = ''                        # uncompressed data from base on
+        self.base = 0                        # offset of buf in the member
+        self.mark = 0                        # next line at or after this is indexed
+
+    def feed(self, chunk):
+        """
+        Decompresses chunk; returns any data following the end of the member.
+        """
+        self.buf += self.decompressor.decompress(chunk)
+        self.scan(False)
+        if self.decompressor.unused_data:
+            return self.decompressor.unused_data
+        return ''
+
+    def finish(self):
+        self.scan(True)
+
+    def scan(self, final):
+        while True:
+            i = self.mark - self.base
+            if i == 0 and self.base == 0:
+                start = 0                    # first line of the member
+            else:
+                j = self.buf.find('\n', max(i - 1, 0))
+                if j < 0:
+                    break
+                start = j + 1
+            # a timestamp is at most a few dozen characters long
+            if not final and len(self.buf) - start < 64:
+                break
+            if start >= len(self.buf):
+                break
+            tsmatch = timestampPattern.match(self.buf, start)
+            if tsmatch:
+                self.index.entries.append((tsmatch.group(0), self.block, self.base + start))
+                self.mark = self.base + start + self.index.interval
+            else:
+                self.mark = self.base + start + 1
+        # keep only what is needed to find the next line start after mark
+        drop = min(max(self.mark - self.base - 1, 0), len(self.buf))
+        self.buf = self.buf[drop:]
+        self.base += drop
+
+
+def indexFileName(filename):
+    """
+    Name of the file holding the GzipLogIndex of a log file
+    """
+    dirname, basename = os.path.split(filename)
+    return os.path.join(dirname, '.%s.gplogfilter_index' % basename)
+
+
+def SkipBytes(fileIn, n, chunksize=1 << 20):
+    """
+    Read and discard the next n bytes of an input file, in large chunks.
+    GzipFile.seek() reads 1KB at a time.
+    """
+    while n > 0:
+        data = fileIn.read(min(n, chunksize))
+        if not data:
+            break
+        n -= len(data)
+
+
+def StopAtTimestamp(iterable, stamp):
+    """
+    Generator yielding the lines of a GPDB log up to the first line having
+    a timestamp at or after the given one.  Useful with log files in
+    timestamp order, to stop reading them past the end of a time range.
+
+    StopAtTimestamp(iterable, stamp) -> iterator
+        iterable -- a sequence, iterator, file, or other object which
+            supports iteration.  Each item returned by its next() method
+            must be a string.
+        stamp -- a timestamp string in YYYY-MM-DD HH:MM:SS format
+    """
+    for s in iterable:
+        if s >= stamp and timestampPattern.match(s):
+            return
+        yield s
+
+
+def MergeByTimestamp(iterables):
+    """
+    Generator to merge several streams of GPDB log lines, each in timestamp
+    order, into one stream in timestamp order.  The lines of each log entry
+    stay together.  Lines found before the first timestamped line of a
+    stream come first.
+
+    MergeByTimestamp(iterables) -> iterator
+        iterables -- a sequence of iterables, each yielding strings.
+
+    Example:
+        # Print the entries of two segment logs in timestamp order
+        for s in MergeByTimestamp([open(seg0log), open(seg1log)]):
+            print s,
+    """
+    def keyedGroups(i, iterable):
+        n = 0
+        for lines in GroupByTimestamp(iterable):
+            tsmatch = lines and timestampPattern.match(lines[0])
+            yield (tsmatch and tsmatch.group(0) or '', i, n, lines)
+            n += 1
+
+    streams = [keyedGroups(i, iterable) for (i, iterable) in enumerate(iterables)]
+    for (timestamp, i, n, lines) in heapq.merge(*streams):
+        for s in lines:
+            yield s
+
+
 #-------------------------- Utility Functions --------------------------
 
 def filterize(Filter, *args, **kwargs):
@@ -10,6 +10,7 @@ from gppylib import gparray, gplog
 from gppylib.commands import unix
 from gppylib.commands import gp
 from gppylib.commands import base
+from gppylib.commands.batch import addCommandsByHost
 from gppylib.gparray import GpArray
 from gppylib.testold.testUtils import *
 from gppylib.operations import startSegments
@@ -435,22 +436,34 @@ class GpMirrorListToBuild:
         #
         # copy dump files from old segment to new segment
         #
+        checks = []
         for srcSeg in srcSegments:
+            checks.append([])
             for destSeg in destSegments:
                 if srcSeg.content == destSeg.content:
                     src_dump_dir = os.path.join(srcSeg.getSegmentDataDirectory(), 'db_dumps')
                     cmd = base.Command('check existence of db_dumps directory', 'ls %s' % (src_dump_dir),
                                        ctxt=base.REMOTE, remoteHost=destSeg.getSegmentAddress())
-                    cmd.run()
-                    if cmd.results.rc == 0:  # Only try to copy directory if it exists
-                        cmd = Scp('copy db_dumps from old segment to new segment',
-                                  os.path.join(srcSeg.getSegmentDataDirectory(), 'db_dumps*', '*'),
-                                  os.path.join(destSeg.getSegmentDataDirectory(), 'db_dumps'),
-                                  srcSeg.getSegmentAddress(),
-                                  destSeg.getSegmentAddress(),
-                                  recursive=True)
-                        cmd.run(validateAfter=True)
-                        break
+                    cmd.destSeg = destSeg
+                    checks[-1].append(cmd)
+
+        # the existence checks are small, run them with one ssh per host
+        numItems = addCommandsByHost(self.__pool, [cmd for srcChecks in checks for cmd in srcChecks])
+        self.__pool.wait_and_printdots(numItems, self.__quiet)
+        self.__pool.empty_completed_items()
+
+        for srcSeg, srcChecks in zip(srcSegments, checks):
+            for check in srcChecks:
+                if check.results.rc == 0:  # Only try to copy directory if it exists
+                    destSeg = check.destSeg
+                    cmd = Scp('copy db_dumps from old segment to new segment',
+                              os.path.join(srcSeg.getSegmentDataDirectory(), 'db_dumps*', '*'),
+                              os.path.join(destSeg.getSegmentDataDirectory(), 'db_dumps'),
+                              srcSeg.getSegmentAddress(),
+                              destSeg.getSegmentAddress(),
+                              recursive=True)
+                    cmd.run(validateAfter=True)
+                    break
 
     def _get_running_postgres_segments(self, segments):
         running_segments = []
@@ -42,7 +42,7 @@ class StartSegmentsResult:
     def __init__(self):
         self.__successfulSegments = []
         self.__failedSegments = []
-        pass
+        self.__hostTimings = {}
 
     def getSuccessfulSegments(self):
         return self.__successfulSegments[:]
@@ -62,6 +62,15 @@ class StartSegmentsResult:
     def clearSuccessfulSegments(self):
         self.__successfulSegments = []
 
+    def addHostTiming(self, hostName, seconds):
+        self.__hostTimings[hostName] = self.__hostTimings.get(hostName, 0) + seconds
+
+    def getHostTimings(self):
+        """
+        Return {host name: seconds spent starting its segments}
+        """
+        return dict(self.__hostTimings)
+
 class StartSegmentsOperation:
     """
        This operation, to be run from the master, will start the segments up
@@ -126,23 +135,23 @@ class StartSegmentsOperation:
         if numWorkers >= numNodes:
             # We are in a situation where we can start the entire cluster at once.
             assert startMethod == START_AS_PRIMARY_OR_MIRROR or startMethod == START_AS_MIRRORLESS
-            self.__runStartCommand(segments, startMethod, numContentsInCluster, result, gpArray, era)
+            self.__runStartCommand(segments, [], startMethod, numContentsInCluster, result, gpArray, era)
         else:
             # We don't have enough workers to guarantee that a given primary and mirror are started at the same time.
             # Note, we could try to be really clever here and attempt to only start a set of segments on numWorkers
             # nodes that contain both a primary and mirror for a given pair, but that could be quite complex.
-            # It would also be difficult to QA. The method here is simpler but possibly slower.
+            # It would also be difficult to QA. The method here is simpler but possibly slower: the mirrors are
+            # started first, and the primaries of a host as soon as the mirrors of all of them have started.
             if startMethod == START_AS_PRIMARY_OR_MIRROR:
 
                 mirrorDbs = [seg for seg in segments if seg.isSegmentMirror(True)]
                 primaryDbs = [seg for seg in segments if seg.isSegmentPrimary(True)]
 
-                self.__runStartCommand(mirrorDbs, startMethod, numContentsInCluster, result, gpArray, era)
-                self.__runStartCommand(primaryDbs, startMethod, numContentsInCluster, result, gpArray, era)
+                self.__runStartCommand(mirrorDbs, primaryDbs, startMethod, numContentsInCluster, result, gpArray, era)
 
             elif startMethod == START_AS_MIRRORLESS:
                 # bring them up in mirrorless mode
-                self.__runStartCommand(segments, startMethod, numContentsInCluster, result, gpArray, era)
+                self.__runStartCommand(segments, [], startMethod, numContentsInCluster, result, gpArray, era)
             else:
                 raise Exception("Invalid startMethod %s" % startMethod)
 
@@ -150,12 +159,15 @@ class StartSegmentsOperation:
         assert totalToAttempt == len(result.getFailedSegmentObjs()) + len(result.getSuccessfulSegments())
         return result
 
-    def __runStartCommand(self, segments, startMethod, numContentsInCluster, resultOut, gpArray, era):
+    def __runStartCommand(self, segments, peerSegments, startMethod, numContentsInCluster, resultOut, gpArray, era):
         """
         Putt results into the resultOut object
+
+        peerSegments are started per host once all of their peers in segments
+        have been started, while the results for the other hosts come in
         """
 
-        if len(segments) == 0:
+        if len(segments) == 0 and len(peerSegments) == 0:
             return
 
         if startMethod == START_AS_PRIMARY_OR_MIRROR:
@@ -166,92 +178,123 @@ class StartSegmentsOperation:
 
         dbIdToPeerMap = gpArray.getDbIdToPeerMap()
 
-        mirroringModePreTransition = MIRROR_MODE_MIRRORLESS if startMethod == START_AS_MIRRORLESS else MIRROR_MODE_QUIESCENT
-
         # launch the start
-        for hostName, segments in GpArray.getSegmentsByHostName(segments).iteritems():
-            logger.debug("Dispatching command to start segments on host: %s, " \
-                            "with %s contents in cluster" % (hostName, numContentsInCluster))
-
-            pickledTransitionData = None
-            if startMethod == START_AS_PRIMARY_OR_MIRROR:
-                mirroringModePerSegment = []
-                for seg in segments:
-                    modeThisSegment = MIRROR_MODE_PRIMARY if seg.isSegmentPrimary(True) else MIRROR_MODE_MIRROR
-                    mirroringModePerSegment.append(modeThisSegment)
-                pickledTransitionData = self.__createPickledTransitionParameters(segments, mirroringModePerSegment, None, dbIdToPeerMap)
-
-            #
-            # This will call sbin/gpsegstart.py
-            #
-            cmd = gp.GpSegStartCmd("remote segment starts on host '%s'" % hostName,
-                                   self.__gpHome, segments,
-                                   self.__gpVersion,
-                                   mirroringModePreTransition,
-                                   numContentsInCluster,
-                                   era,
-                                   self.master_checksum_value,
-                                   self.__timeout,
-                                   verbose=logging_is_verbose(),
-                                   ctxt=base.REMOTE,
-                                   remoteHost=segments[0].getSegmentAddress(),
-                                   pickledTransitionData=pickledTransitionData,
-                                   specialMode=self.__specialMode,
-                                   wrapper=self.__wrapper,
-                                   wrapper_args=self.__wrapper_args,
-                                   logfileDirectory=self.logfileDirectory)
-            self.__workerPool.addCommand(cmd)
+        for hostName, segmentsOnHost in GpArray.getSegmentsByHostName(segments).iteritems():
+            self.__dispatchStartCommand(hostName, segmentsOnHost, startMethod, numContentsInCluster, dbIdToPeerMap, era)
             dispatchCount+=1
 
-        self.__workerPool.wait_and_printdots(dispatchCount, self.__quiet)
-
-        # process results
-        self.__processStartOrConvertCommands(resultOut)
-        self.__workerPool.empty_completed_items()
-
-    def __processStartOrConvertCommands(self, resultOut):
-        logger.info("Process results...")
-        for cmd in self.__workerPool.getCompletedItems():
-            if cmd.get_results().rc == 0 or cmd.get_results().rc == 1:
-            # error code 0 mean all good, 1 means it ran but at least one thing failed
-                cmdout = cmd.get_results().stdout
-                lines=cmdout.split('\n')
-                for line in lines:
-                    if line.startswith("STATUS"):
-                        fields=line.split('--')
-
-                        index = 1
-                        dir = fields[index].split(':')[1]
-                        index += 1
+        # the dbids whose start each host of peerSegments still waits for
+        startingDbIds = set([seg.getSegmentDbId() for seg in segments])
+        peerSegmentsByHost = GpArray.getSegmentsByHostName(peerSegments)
+        waitingForDbIds = {}
+        for hostName, segmentsOnHost in peerSegmentsByHost.iteritems():
+            waitingForDbIds[hostName] = set([dbIdToPeerMap[seg.getSegmentDbId()].getSegmentDbId()
+                                             for seg in segmentsOnHost
+                                             if seg.getSegmentDbId() in dbIdToPeerMap]) & startingDbIds
+
+        # process results as each host finishes
+        completedCount = 0
+        while True:
+            for hostName in sorted(waitingForDbIds.keys()):
+                if not waitingForDbIds[hostName]:
+                    del waitingForDbIds[hostName]
+                    self.__dispatchStartCommand(hostName, peerSegmentsByHost[hostName], startMethod,
+                                                numContentsInCluster, dbIdToPeerMap, era)
+                    dispatchCount+=1
+
+            if completedCount == dispatchCount:
+                break
+
+            cmd = self.__workerPool.getNextCompletedItem(self.__quiet)
+            completedCount+=1
+            self.__processStartOrConvertCommand(cmd, resultOut)
+            if cmd.elapsed is not None:
+                resultOut.addHostTiming(cmd.dblist[0].getSegmentHostName(), cmd.elapsed)
+
+            finishedDbIds = set([seg.getSegmentDbId() for seg in cmd.dblist])
+            for dbIds in waitingForDbIds.itervalues():
+                dbIds -= finishedDbIds
+
+        if not self.__quiet:
+            print " "
+        self.__workerPool.join()
+
+    def __dispatchStartCommand(self, hostName, segments, startMethod, numContentsInCluster, dbIdToPeerMap, era):
+        logger.debug("Dispatching command to start segments on host: %s, " \
+                        "with %s contents in cluster" % (hostName, numContentsInCluster))
+
+        mirroringModePreTransition = MIRROR_MODE_MIRRORLESS if startMethod == START_AS_MIRRORLESS else MIRROR_MODE_QUIESCENT
 
-                        started = fields[index].split(':')[1]
+        pickledTransitionData = None
+        if startMethod == START_AS_PRIMARY_OR_MIRROR:
+            mirroringModePerSegment = []
+            for seg in segments:
+                modeThisSegment = MIRROR_MODE_PRIMARY if seg.isSegmentPrimary(True) else MIRROR_MODE_MIRROR
+                mirroringModePerSegment.append(modeThisSegment)
+            pickledTransitionData = self.__createPickledTransitionParameters(segments, mirroringModePerSegment, None, dbIdToPeerMap)
+
+        #
+        # This will call sbin/gpsegstart.py
+        #
+        cmd = gp.GpSegStartCmd("remote segment starts on host '%s'" % hostName,
+                               self.__gpHome, segments,
+                               self.__gpVersion,
+                               mirroringModePreTransition,
+                               numContentsInCluster,
+                               era,
+                               self.master_checksum_value,
+                               self.__timeout,
+                               verbose=logging_is_verbose(),
+                               ctxt=base.REMOTE,
+                               remoteHost=segments[0].getSegmentAddress(),
+                               pickledTransitionData=pickledTransitionData,
+                               specialMode=self.__specialMode,
+                               wrapper=self.__wrapper,
+                               wrapper_args=self.__wrapper_args,
+                               logfileDirectory=self.logfileDirectory)
+        self.__workerPool.addCommand(cmd)
+
+    def __processStartOrConvertCommand(self, cmd, resultOut):
+        if cmd.get_results().rc == 0 or cmd.get_results().rc == 1:
+        # error code 0 mean all good, 1 means it ran but at least one thing failed
+            cmdout = cmd.get_results().stdout
+            lines=cmdout.split('\n')
+            for line in lines:
+                if line.startswith("STATUS"):
+                    fields=line.split('--')
+
+                    index = 1
+                    dir = fields[index].split(':')[1]
+                    index += 1
+
+                    started = fields[index].split(':')[1]
+                    index += 1
+
+                    reasonCode = gp.SEGSTART_ERROR_UNKNOWN_ERROR
+                    if fields[index].startswith("REASONCODE:"):
+                        reasonCode = int(fields[index].split(":")[1])
                         index += 1
 
-                        reasonCode = gp.SEGSTART_ERROR_UNKNOWN_ERROR
-                        if fields[index].startswith("REASONCODE:"):
-                            reasonCode = int(fields[index].split(":")[1])
-                            index += 1
-
-                        # The funny join and splits are because Reason could have colons or -- in the text itself
-                        reasonStr = "--".join(fields[index:])
-                        reasonArr = reasonStr.split(':')
-                        reasonArr = reasonArr[1:]
-                        reasonStr = ":".join(reasonArr)
-
-                        if started.lower() == 'false':
-                            success=False
-                        else:
-                            success=True
-
-                        for segment in cmd.dblist:
-                            if segment.getSegmentDataDirectory() == dir:
-                                if success:
-                                    resultOut.addSuccess(segment)
-                                else:
-                                    resultOut.addFailure(segment, reasonStr, reasonCode)
-            else:
-                for segment in cmd.dblist:
-                    resultOut.addFailure(segment, cmd.get_results(), gp.SEGSTART_ERROR_UNKNOWN_ERROR)
+                    # The funny join and splits are because Reason could have colons or -- in the text itself
+                    reasonStr = "--".join(fields[index:])
+                    reasonArr = reasonStr.split(':')
+                    reasonArr = reasonArr[1:]
+                    reasonStr = ":".join(reasonArr)
+
+                    if started.lower() == 'false':
+                        success=False
+                    else:
+                        success=True
+
+                    for segment in cmd.dblist:
+                        if segment.getSegmentDataDirectory() == dir:
+                            if success:
+                                resultOut.addSuccess(segment)
+                            else:
+                                resultOut.addFailure(segment, reasonStr, reasonCode)
+        else:
+            for segment in cmd.dblist:
+                resultOut.addFailure(segment, cmd.get_results(), gp.SEGSTART_ERROR_UNKNOWN_ERROR)
 
     def __createPickledTransitionParameters(self, segmentsOnHost, targetModePerSegment, convertUsingFullResync, dbIdToPeerMap):
         dbIdToFullResync = {}
@@ -0,0 +1,58 @@
+from gppylib.gparray import Segment, GpArray
+from gppylib.test.unit.gp_unittest import *
+from gppylib.commands.base import CommandResult
+from mock import patch, Mock
+from gppylib.operations.startSegments import StartSegmentsOperation, START_AS_PRIMARY_OR_MIRROR
+
+
+class StartSegmentsTestCase(GpTestCase):
+    def setUp(self):
+        self.apply_patches([
+            patch('gppylib.operations.startSegments.gphostcache.GpHostCache'),
+            patch('gppylib.operations.startSegments.gp.GpSegStartCmd', side_effect=self._start_cmd),
+        ])
+        self.get_mock_from_apply_patch('GpHostCache').return_value.ping_hosts.return_value = []
+
+        self.gparray = GpArray([Segment.initFromString("1|-1|p|p|s|u|mdw|mdw|5432|/data/master"),
+                                Segment.initFromString("2|0|p|p|s|u|sdw1|sdw1|40000|/data/primary0"),
+                                Segment.initFromString("3|1|p|p|s|u|sdw2|sdw2|40001|/data/primary1"),
+                                Segment.initFromString("4|0|m|m|s|u|sdw2|sdw2|50000|/data/mirror0"),
+                                Segment.initFromString("5|1|m|m|s|u|sdw1|sdw1|50001|/data/mirror1")])
+
+        # the pool completes starts in the order they are dispatched
+        self.queued = []
+        self.dispatched = []
+        self.pool = Mock()
+        self.pool.getNumWorkers.return_value = 1
+        self.pool.addCommand.side_effect = lambda cmd: (self.queued.append(cmd),
+                                                        self.dispatched.append(cmd.dblist))
+        self.pool.getNextCompletedItem.side_effect = self._next_completed
+        self.dispatched_before_completion = []
+
+    def _start_cmd(self, name, gpHome, segments, *args, **kwargs):
+        results = CommandResult(0, "\n".join(["STATUS--DIR:%s--STARTED:True--REASON:OK" % seg.getSegmentDataDirectory()
+                                              for seg in segments]), '', True, False)
+        elapsed = 3.0 if segments[0].getSegmentHostName() == 'sdw1' else 1.0
+        return Mock(dblist=segments, elapsed=elapsed, get_results=Mock(return_value=results))
+
+    def _next_completed(self, quiet=True):
+        self.dispatched_before_completion.append(len(self.dispatched))
+        return self.queued.pop(0)
+
+    def test_start_segments__primaries_of_a_host_start_once_their_mirrors_have_started(self):
+        subject = StartSegmentsOperation(self.pool, True, 'version', '/gphome', '/data/master')
+
+        result = subject.startSegments(self.gparray, self.gparray.getSegDbList(), START_AS_PRIMARY_OR_MIRROR, 'era')
+
+        dbids = [[seg.getSegmentDbId() for seg in segs] for segs in self.dispatched]
+        self.assertEqual(sorted(dbids[:2]), [[4], [5]])
+        # the primary whose mirror started first is dispatched before the other mirror finishes
+        first_mirror = dbids[0][0]
+        self.assertEqual(dbids[2], [self.gparray.getDbIdToPeerMap()[first_mirror].getSegmentDbId()])
+        self.assertEqual(self.dispatched_before_completion, [2, 3, 4, 4])
+        self.assertEqual(sorted(seg.getSegmentDbId() for seg in result.getSuccessfulSegments()), [2, 3, 4, 5])
+        self.assertEqual(result.getHostTimings(), {'sdw1': 6.0, 'sdw2': 2.0})
+
+
+if __name__ == '__main__':
+    run_tests()
@@ -0,0 +1,185 @@
+import imp
+import os
+import shutil
+import tempfile
+
+from mock import *
+from gp_unittest import *
+
+
+class AnalyzeDbTestCase(GpTestCase):
+    def setUp(self):
+        # because analyzedb does not have a .py extension,
+        # we have to use imp to import it
+        analyzedb_file = os.path.abspath(os.path.dirname(__file__) + "/../../../analyzedb")
+        self.subject = imp.load_source('analyzedb', analyzedb_file)
+        self.subject.logger = Mock(spec=['log', 'warn', 'info', 'debug', 'error', 'warning', 'exception'])
+
+        self.analyzedb = self.subject.AnalyzeDb.__new__(self.subject.AnalyzeDb)
+        self.analyzedb.batch_size = 1
+        self.analyzedb.master_datadir, self.analyzedb.analyze_dir, self.analyzedb.dbname = '/data/master', 'db_analyze', 'db'
+        self.analyzedb.conn = Mock()
+
+        self.worker = Mock(spec=['execute', 'logger', 'name'])
+
+    def test_get_analyze_statements__batches_longest_first_and_roots_separately(self):
+        self.analyzedb.batch_size, self.analyzedb.parallel_level = 2, 2
+        input_col_dict = {('public', 'p_1'): set(['-1']), ('public', 'p_2'): set(['-1']),
+                          ('public', 'p_3'): set(['-1']), ('public', 't'): set(['a'])}
+        root_partition_col_dict = {('public', 'p'): set(['-1'])}
+        ordered = [('public', 'p_1'), ('public', 'p_2'), ('public', 'p_3'), ('public', 'p'), ('public', 't')]
+        predicted_times = {('public', 'p_1'): (100, 1.0), ('public', 'p_2'): (300, 3.0),
+                           ('public', 'p_3'): (200, 2.0), ('public', 'p'): (600, 6.0),
+                           ('public', 't'): (1000, 10.0)}
+
+        items, root_items = self.analyzedb._get_analyze_statements(ordered, input_col_dict.keys(), input_col_dict,
+                                                                   root_partition_col_dict, predicted_times)
+
+        self.assertEqual([(item.name, item.predicted) for item in items],
+                         [('analyze public.t(a)', 10.0),
+                          ('analyze public.p_2; analyze public.p_3', 5.0),
+                          ('analyze public.p_1', 1.0)])
+        self.assertEqual(root_items.keys(), [('public', 'p')])
+        self.assertEqual(root_items[('public', 'p')].name, 'analyze rootpartition public.p')
+        self.assertEqual(root_items[('public', 'p')].predicted, 6.0)
+
+    def test_get_analyze_statements__packs_small_tables_up_to_the_time_of_a_large_one(self):
+        self.analyzedb.batch_size, self.analyzedb.parallel_level = 10, 2
+        input_col_dict = dict((('public', 'big_%d' % i), set(['-1'])) for i in range(3))
+        input_col_dict.update((('public', 'small_%d' % i), set(['-1'])) for i in range(12))
+        predicted_times = dict((can, (0, 8.0 if can[1].startswith('big') else 2.0)) for can in input_col_dict)
+
+        items, _ = self.analyzedb._get_analyze_statements(sorted(input_col_dict), input_col_dict.keys(),
+                                                          input_col_dict, {}, predicted_times)
+
+        # the large tables are analyzed by different workers
+        self.assertEqual([item.predicted for item in items], [8.0, 8.0, 8.0, 8.0, 8.0, 8.0])
+        self.assertEqual([len(item.targets) for item in items], [1, 1, 1, 4, 4, 4])
+
+    @patch('analyzedb.run_sql', return_value=[('public', 'p_1', 1000, 3), ('public', 'p_2', 0, 3),
+                                              ('public', 't', 50, 10)])
+    @patch('analyzedb.get_prev_analyze_times', return_value={('public', 'p_1'): (200, 4.0),
+                                                             ('public', 'x'): (600, 2.0)})
+    @patch('analyzedb.get_lastest_analyze_timestamp')
+    def test_predict_analyze_times__uses_times_of_last_run(self, mock_timestamp, mock_prev_times, mock_run_sql):
+        self.analyzedb.leaf_root_dict = {('public', 'p_1'): ('public', 'p'), ('public', 'p_2'): ('public', 'p')}
+        input_col_dict = {('public', 'p_1'): set(['-1']), ('public', 'p_2'): set(['-1']),
+                          ('public', 't'): set(['a', 'b'])}
+
+        predicted = self.analyzedb._predict_analyze_times(input_col_dict.keys(), input_col_dict,
+                                                          {('public', 'p'): set(['-1'])})
+
+        # p_1 took 4 seconds for a cost of 200 last time; the others are
+        # estimated at the 6 seconds per 800 cost of the whole last run
+        self.assertEqual(predicted, {('public', 'p_1'): (1300, 26.0),
+                                     ('public', 'p_2'): (300, 2.25),
+                                     ('public', 't'): (250, 1.875),
+                                     ('public', 'p'): (1600, 12.0)})
+
+    @patch('analyzedb.AnalyzeWorkerPool')
+    def test_run_analyze__queues_root_partition_after_its_leaves(self, mock_pool_class):
+        self.analyzedb.dbname, self.analyzedb.pg_port, self.analyzedb.parallel_level = 'db', 5432, 2
+        self.analyzedb.success_list, self.analyzedb.analyze_times = [], {}
+        self.analyzedb.leaf_root_dict = {('public', 'p_1'): ('public', 'p'), ('public', 'p_2'): ('public', 'p')}
+        input_col_dict = {('public', 'p_1'): set(['-1']), ('public', 'p_2'): set(['-1'])}
+        self.analyzedb._predict_analyze_times = Mock(return_value={('public', 'p_1'): (100, 1.0),
+                                                                   ('public', 'p_2'): (200, 2.0),
+                                                                   ('public', 'p'): (300, 3.0)})
+        pool = mock_pool_class.return_value
+        queued = []
+
+        def complete():
+            item = queued.pop(0)
+            item.succeeded = [(schema, table) for (schema, table, _) in item.targets]
+            item.elapsed = 2 * item.predicted
+            return item
+
+        pool.addCommand.side_effect = lambda item, priority: queued.append(item)
+        pool.completed_queue.get.side_effect = complete
+
+        self.analyzedb.run_analyze(self.subject.logger, [('public', 'p_2'), ('public', 'p_1'), ('public', 'p')],
+                                   input_col_dict.keys(), input_col_dict, {('public', 'p'): set(['-1'])})
+
+        self.assertEqual([(c[0][0].name, c[1]['priority']) for c in pool.addCommand.call_args_list],
+                         [('analyze public.p_2', -2.0), ('analyze public.p_1', -1.0),
+                          ('analyze rootpartition public.p', -3.0)])
+        self.assertEqual(self.analyzedb.success_list, [('public', 'p_2'), ('public', 'p_1'), ('public', 'p')])
+        self.assertEqual(self.analyzedb.analyze_times[('public', 'p')], (300, 3.0, 6.0))
+
+    def test_get_prev_analyze_times__reads_times_from_report(self):
+        report_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, report_dir)
+        os.makedirs(os.path.join(report_dir, 'db_analyze', 'db', '20170101000000'))
+        report_file = self.subject.generate_statefile_name('report', report_dir, 'db_analyze', 'db', '20170101000000')
+        with open(report_file, 'w') as f:
+            f.write("Tables or partitions successfully analyzed:\n---\npublic.t\npublic.u\n\n\n"
+                    "%s\n---\npublic,t,1000,1.00,2.50\npublic,u,100,0.10,0.05\n\n"
+                    "2 out of 2 tables are analyzed.\n" % self.subject.ANALYZE_TIMES_HEADER)
+
+        times = self.subject.get_prev_analyze_times('20170101000000', report_dir, 'db_analyze', 'db')
+
+        self.assertEqual(times, {('public', 't'): (1000, 2.5), ('public', 'u'): (100, 0.05)})
+
+    @patch('analyzedb.dbconn.execSQL')
+    @patch('analyzedb.dbconn.connect')
+    def test_get_partition_state_tuples__reads_modcounts_in_batches(self, mock_connect, mock_execSQL):
+        conn = mock_connect.return_value.__enter__.return_value
+        mock_execSQL.return_value.fetchall.side_effect = [[(0, '  3'), (1, '  0')], [(0, ' 12')]]
+        partition_info = [(1, 'public', 'a', 'pg_aoseg_1'), (2, 'public', 'b', 'pg_aocsseg_2'),
+                          (3, 'public', 'c', 'pg_aoseg_3')]
+
+        with patch.object(self.subject, 'MODCOUNT_BATCH_SIZE', 2):
+            state = self.subject.get_partition_state_tuples(5432, 'db', 'pg_aoseg', partition_info)
+
+        self.assertEqual(state, [('public', 'a', '3'), ('public', 'b', '0'), ('public', 'c', '12')])
+        self.assertEqual(mock_execSQL.call_count, 2)
+        self.assertIn('from pg_aoseg.pg_aoseg_1 UNION ALL select 1,', mock_execSQL.call_args_list[0][0][1])
+        self.assertIn('from pg_aoseg.pg_aoseg_3', mock_execSQL.call_args_list[1][0][1])
+        self.assertEqual(conn.commit.call_count, 2)
+
+    def test_analyze_statements__failed_batch_is_retried_one_by_one(self):
+        self.worker.execute.side_effect = [Exception('batch failed'), None, Exception('no such table')]
+        item = self.subject.AnalyzeStatements([('public', 'a', 'analyze public.a'),
+                                               ('public', 'b', 'analyze public.b')])
+
+        item.run(self.worker)
+
+        self.assertEqual(item.succeeded, [('public', 'a')])
+        self.assertEqual(item.errors, ['no such table'])
+        self.assertFalse(item.was_successful())
+        self.assertEqual(self.worker.execute.call_args_list,
+                         [call('analyze public.a; analyze public.b'), call('analyze public.a'),
+                          call('analyze public.b')])
+
+    @patch('analyzedb.dbconn.execSQL')
+    @patch('analyzedb.dbconn.connect')
+    def test_worker_execute__reconnects_when_connection_is_broken(self, mock_connect, mock_execSQL):
+        broken, fresh = Mock(), Mock()
+        broken.rollback.side_effect = Exception('server closed the connection unexpectedly')
+        mock_connect.side_effect = [broken, fresh]
+        mock_execSQL.side_effect = [Exception('server closed the connection unexpectedly'), Mock()]
+        worker = self.subject.AnalyzeWorker('worker0', Mock(port=5432, dbname='db'))
+
+        worker.execute('analyze public.a')
+
+        self.assertEqual(worker.conn, fresh)
+        broken.close.assert_called_once_with()
+        fresh.commit.assert_called_once_with()
+
+    @patch('analyzedb.dbconn.execSQL', side_effect=Exception('relation "public.a" does not exist'))
+    @patch('analyzedb.dbconn.connect')
+    def test_worker_execute__keeps_connection_on_sql_error(self, mock_connect, mock_execSQL):
+        conn = Mock()
+        mock_connect.return_value = conn
+        worker = self.subject.AnalyzeWorker('worker0', Mock(port=5432, dbname='db'))
+
+        with self.assertRaisesRegexp(Exception, 'does not exist'):
+            worker.execute('analyze public.a')
+
+        self.assertEqual(worker.conn, conn)
+        self.assertEqual(mock_connect.call_count, 1)
+        conn.rollback.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    run_tests()
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+
+from mock import *
+
+from gp_unittest import *
+from gpcheckcat_modules.catalog_fingerprint import CatalogFingerprints
+
+
+class CatalogFingerprintsTestCase(GpTestCase):
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.subject = CatalogFingerprints(os.path.join(self.state_dir, 'state'), 'db1')
+        self.catalog_table_obj = Mock(spec=['getTableName', 'getTableColumns'])
+        self.catalog_table_obj.getTableName.return_value = 'pg_class'
+        self.catalog_table_obj.getTableColumns.return_value = ['oid', 'relname']
+
+    def tearDown(self):
+        shutil.rmtree(self.state_dir)
+        super(CatalogFingerprintsTestCase, self).tearDown()
+
+    def test_get_fingerprint_query__hashes_columns_on_master_and_segments(self):
+        qry = CatalogFingerprints.get_fingerprint_query(self.catalog_table_obj)
+
+        self.assertIn('md5(ROW(oid, relname)::text)', qry)
+        self.assertIn("gp_dist_random('pg_class')", qry)
+
+    def test_get_fingerprint_query__leaves_out_vacuum_and_analyze_statistics(self):
+        CatalogFingerprints.get_fingerprint_query(self.catalog_table_obj)
+
+        excluding = self.catalog_table_obj.getTableColumns.call_args[1]['excluding']
+        self.assertIn('relpages', excluding)
+        self.assertIn('reltuples', excluding)
+        self.assertNotIn('relname', excluding)
+
+    def test_collect__fills_in_segments_without_rows(self):
+        db = Mock()
+        db.query.return_value.getresult.return_value = [(-1, 3L, '123'), (0, 3L, '123')]
+
+        result = self.subject.collect(db, self.catalog_table_obj, [-1, 0, 1])
+
+        self.assertEqual(result, {-1: (3, '123'), 0: (3, '123'), 1: (0, '0')})
+
+    def test_load__without_state_file__returns_nothing(self):
+        self.assertEqual(self.subject.load(), {})
+
+    def test_save__then_load__returns_same_fingerprints(self):
+        fingerprints = {'pg_class': {-1: (3, '123'), 0: (3, '-45')},
+                        'pg_type': {-1: (0, '0'), 0: (0, '0')}}
+
+        self.subject.save(fingerprints)
+
+        self.assertEqual(self.subject.load(), fingerprints)
+        self.assertEqual(CatalogFingerprints(os.path.join(self.state_dir, 'state'), 'db2').load(), {})
+
+    def test_get_unchanged_tables__requires_match_on_every_segment(self):
+        previous = {'pg_class': {-1: (3, '123'), 0: (3, '123')},
+                    'pg_type': {-1: (3, '123'), 0: (3, '123')},
+                    'pg_proc': {-1: (3, '123'), 0: (3, '123')}}
+        current = {'pg_class': {-1: (3, '123'), 0: (3, '123')},
+                   'pg_type': {-1: (3, '123'), 0: (3, '999')},
+                   'pg_attribute': {-1: (3, '123'), 0: (3, '123')}}
+
+        self.assertEqual(CatalogFingerprints.get_unchanged_tables(current, previous), set(['pg_class']))
+
+
+if __name__ == '__main__':
+    run_tests()
@@ -0,0 +1,163 @@
+import threading
+import time
+
+from mock import *
+
+from gp_unittest import *
+from gpcheckcat_modules.check_scheduler import CheckScheduler
+
+
+class CheckSchedulerTestCase(GpTestCase):
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.events = []
+
+    def _record(self, name, delay=0):
+        def fn():
+            with self.lock:
+                self.events.append(('start', name))
+            time.sleep(delay)
+            with self.lock:
+                self.events.append(('end', name))
+            return name
+        return fn
+
+    def test_run__with_one_lane__runs_tasks_serially_in_order(self):
+        subject = CheckScheduler(1)
+
+        results = subject.run([('a', self._record('a'), []),
+                               ('b', self._record('b'), []),
+                               ('c', self._record('c'), [])])
+
+        self.assertEqual(results, ['a', 'b', 'c'])
+        self.assertEqual(self.events, [('start', 'a'), ('end', 'a'),
+                                       ('start', 'b'), ('end', 'b'),
+                                       ('start', 'c'), ('end', 'c')])
+        self.assertEqual(subject.workers, [])
+
+    def test_run__with_several_lanes__runs_independent_tasks_concurrently(self):
+        subject = CheckScheduler(3)
+
+        results = subject.run([('a', self._record('a', 0.2), []),
+                               ('b', self._record('b', 0.2), []),
+                               ('c', self._record('c', 0.2), [])])
+
+        self.assertEqual(results, ['a', 'b', 'c'])
+        self.assertEqual([e[0] for e in self.events[:3]], ['start', 'start', 'start'])
+
+    def test_run__does_not_start_a_task_before_its_dependencies_finish(self):
+        subject = CheckScheduler(3)
+
+        subject.run([('a', self._record('a', 0.2), []),
+                     ('b', self._record('b'), ['a']),
+                     ('c', self._record('c'), [])])
+
+        self.assertTrue(self.events.index(('end', 'a')) < self.events.index(('start', 'b')))
+
+    def test_run__ignores_dependencies_that_are_not_being_run(self):
+        subject = CheckScheduler(2)
+
+        results = subject.run([('b', self._record('b'), ['a'])])
+
+        self.assertEqual(results, ['b'])
+
+    def test_run__with_circular_dependencies__raises(self):
+        subject = CheckScheduler(2)
+
+        with self.assertRaisesRegexp(Exception, 'circular dependency'):
+            subject.run([('a', self._record('a'), ['b']),
+                         ('b', self._record('b'), ['a'])])
+
+    def test_run__when_a_task_raises__runs_the_rest_and_reraises(self):
+        subject = CheckScheduler(2)
+
+        def fail():
+            raise LookupError('boom')
+
+        with self.assertRaises(LookupError):
+            subject.run([('a', fail, []),
+                         ('b', self._record('b'), [])])
+
+        self.assertIn(('end', 'b'), self.events)
+
+    def test_run__caps_concurrent_tasks_at_number_of_lanes(self):
+        subject = CheckScheduler(2)
+        running = [0, 0]
+
+        def task():
+            with self.lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.05)
+            with self.lock:
+                running[0] -= 1
+
+        subject.run([(i, task, []) for i in range(6)])
+
+        self.assertEqual(running[1], 2)
+
+    def test_map__nested_inside_run__completes_and_shares_context(self):
+        subject = CheckScheduler(2)
+
+        def check(name):
+            subject.context['status'] = name
+            return subject.map(lambda item: (item, subject.context['status']), [1, 2, 3])
+
+        results = subject.run([('a', lambda: check('a'), []),
+                               ('b', lambda: check('b'), [])])
+
+        self.assertEqual(results, [[(1, 'a'), (2, 'a'), (3, 'a')],
+                                   [(1, 'b'), (2, 'b'), (3, 'b')]])
+
+    def test_run__gives_each_task_its_own_context(self):
+        subject = CheckScheduler(1)
+        subject.context['status'] = 'caller'
+
+        results = subject.run([('a', lambda: subject.context.get('status'), [])])
+
+        self.assertEqual(results, [None])
+        self.assertEqual(subject.context['status'], 'caller')
+
+    def test_emit__with_several_lanes__writes_output_of_each_task_together_in_task_order(self):
+        subject = CheckScheduler(3)
+        lines = []
+
+        def check(name, delay):
+            def fn():
+                subject.emit(lines.append, '%s start' % name)
+                time.sleep(delay)
+                subject.map(lambda i: subject.emit(lines.append, '%s item %d' % (name, i)), [1])
+                subject.emit(lines.append, '%s end' % name)
+            return fn
+
+        subject.run([('a', check('a', 0.2), []),
+                      ('b', check('b', 0), []),
+                      ('c', check('c', 0.1), [])])
+        subject.emit(lines.append, 'after')
+
+        self.assertEqual(lines, ['a start', 'a item 1', 'a end',
+                                 'b start', 'b item 1', 'b end',
+                                 'c start', 'c item 1', 'c end',
+                                 'after'])
+
+    def test_emit__with_one_lane__writes_at_once(self):
+        subject = CheckScheduler(1)
+        lines = []
+
+        def fn():
+            subject.emit(lines.append, 'a')
+            return list(lines)
+
+        self.assertEqual(subject.run([('a', fn, [])]), [['a']])
+
+    def test_current_lane__is_zero_for_the_caller_and_distinct_for_workers(self):
+        subject = CheckScheduler(3)
+
+        lanes = subject.map(lambda i: (time.sleep(0.1), subject.current_lane())[1], range(3))
+
+        self.assertEqual(subject.current_lane(), 0)
+        self.assertEqual(sorted(lanes), [0, 1, 2])
+
+
+if __name__ == '__main__':
+    run_tests()
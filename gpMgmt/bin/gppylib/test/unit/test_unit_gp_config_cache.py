@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+
+from gp_unittest import *
+from mock import *
+
+from gppylib.gp_config_cache import GpConfigCacheFile
+from gppylib.gparray import GpArray, Segment
+
+
+def control_data(state='shut down', catversion='301607301', checkpoint='0/1E3A2B8'):
+    controldata = Mock()
+    controldata.get_value.side_effect = {'Database cluster state': state,
+                                         'Catalog version number': catversion,
+                                         'Latest checkpoint location': checkpoint}.get
+    return controldata
+
+
+class GpConfigCacheTestCase(GpTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.gparray = GpArray([Segment.initFromString("1|-1|p|p|s|u|mdw|mdw|5432|/data/master"),
+                                Segment.initFromString("2|0|p|p|s|u|sdw1|sdw1|40000|/data/primary0"),
+                                Segment.initFromString("3|0|m|m|s|u|sdw2|sdw2|50000|/data/mirror0")])
+        self.subject = GpConfigCacheFile(self.tmpdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(GpConfigCacheTestCase, self).tearDown()
+
+    def test_write_and_read_back_configuration(self):
+        self.subject.write(self.gparray, control_data(), '0/1E3A2B8')
+
+        cache = GpConfigCacheFile(self.tmpdir)
+        cache.read()
+        cache.validate(control_data())
+        gparray = cache.get_gparray()
+
+        self.assertEqual([repr(seg) for seg in gparray.getDbList()],
+                         [repr(seg) for seg in self.gparray.getDbList()])
+        self.assertTrue(gparray.hasMirrors)
+        self.assertEqual(gparray.recoveredSegmentDbids, [])
+        self.assertFalse(os.path.exists(self.subject.filepath + '.tmp'))
+
+    def test_write_fails_after_unclean_shutdown(self):
+        with self.assertRaisesRegexp(Exception, 'not shut down cleanly'):
+            self.subject.write(self.gparray, control_data(state='in production'), '0/1E3A2B8')
+        self.assertFalse(os.path.exists(self.subject.filepath))
+
+    def test_read_fails_when_file_was_changed(self):
+        self.subject.write(self.gparray, control_data(), '0/1E3A2B8')
+        os.chmod(self.subject.filepath, 0600)
+        with open(self.subject.filepath) as f:
+            contents = f.read()
+        with open(self.subject.filepath, 'w') as f:
+            f.write(contents.replace('sdw2', 'sdw3'))
+
+        with self.assertRaisesRegexp(Exception, 'checksum mismatch'):
+            GpConfigCacheFile(self.tmpdir).read()
+
+    def test_write_fails_when_configuration_was_read_before_later_wal(self):
+        with self.assertRaisesRegexp(Exception, 'before the shutdown checkpoint'):
+            self.subject.write(self.gparray, control_data(), '0/1E3A1C0')
+        self.assertFalse(os.path.exists(self.subject.filepath))
+
+        self.subject.write(self.gparray, control_data(), '0/1E3A2B8')
+        self.subject.read()
+        self.subject.snapshot = '0/1E3A1C0'
+        with self.assertRaisesRegexp(Exception, 'before the shutdown checkpoint'):
+            self.subject.validate(control_data())
+
+    def test_validate_fails_when_master_has_run_since(self):
+        self.subject.write(self.gparray, control_data(), '0/1E3A2B8')
+        self.subject.read()
+
+        with self.assertRaisesRegexp(Exception, 'master has run since'):
+            self.subject.validate(control_data(checkpoint='0/1E3A3F0'))
+        with self.assertRaisesRegexp(Exception, 'catalog version'):
+            self.subject.validate(control_data(catversion='301607302'))
+
+    def test_get_gparray_finds_recovered_segments(self):
+        self.subject.segments = [Segment.initFromString("1|-1|p|p|s|u|mdw|mdw|5432|/data/master"),
+                                 Segment.initFromString("2|0|m|p|s|u|sdw1|sdw1|40000|/data/primary0"),
+                                 Segment.initFromString("3|0|p|m|s|u|sdw2|sdw2|50000|/data/mirror0")]
+
+        self.assertEqual(self.subject.get_gparray().recoveredSegmentDbids, [2, 3])
+
+
+if __name__ == '__main__':
+    run_tests()
@@ -2,11 +2,13 @@ import imp
 import logging
 import os
 import sys
+from threading import Thread
 
 from mock import *
 
 from gp_unittest import *
 from gppylib.gpcatalog import GPCatalogTable
+from gpcheckcat_modules.catalog_fingerprint import CatalogFingerprints
 
 class GpCheckCatTestCase(GpTestCase):
     def setUp(self):
@@ -294,6 +296,159 @@ class GpCheckCatTestCase(GpTestCase):
         report_cfg = self.subject.getReportConfiguration()
         self.assertEqual("content -1", report_cfg[-1]['segname'])
 
+    def test_connect2run__reuses_one_connection_per_segment(self):
+        self.subject.GV.opt['-B'] = 2
+        self.db_connection.query.return_value.listfields.return_value = ['relname']
+        self.db_connection.query.return_value.dictresult.return_value = [dict(relname='foo')]
+
+        self.subject.connect2run('select 1')
+        err = self.subject.connect2run('select 2')
+
+        self.assertEqual(self.subject.pg.connect.call_count, 2)
+        self.assertEqual(len(err), 2)
+        self.assertEqual(err[0], [self.subject.GV.cfg[0], ['relname'], dict(relname='foo')])
+
+    def test_connect2__shares_connection_with_connect2run(self):
+        self.db_connection.query.return_value.dictresult.return_value = []
+        self.subject.connect2run('select 1')
+
+        db = self.subject.connect2(self.subject.GV.cfg[1])
+
+        self.assertEqual(db, self.db_connection)
+        self.assertEqual(self.subject.pg.connect.call_count, 2)
+
+    def test_connect2__reuses_connections_with_other_credentials(self):
+        self.subject.GV.dbname = 'db1'
+        self.subject.GV.opt['-U'] = 'gpadmin'
+        cfg = self.subject.GV.cfg[1]
+
+        db = self.subject.connect2(cfg, user='u1', password='secret')
+        self.assertIs(self.subject.connect2(cfg, user='u1', password='secret', database='db1'), db)
+        self.assertEqual(self.subject.pg.connect.call_count, 1)
+        self.assertEqual(self.subject.pg.connect.call_args[1]['user'], 'u1')
+
+        # the default credentials, spelled out, share the default connection
+        self.subject.connect2(cfg, user='gpadmin')
+        self.subject.connect2(cfg)
+        self.assertEqual(self.subject.pg.connect.call_count, 2)
+
+    def test_closeDbs__closes_pooled_connections(self):
+        self.db_connection.query.return_value.dictresult.return_value = []
+        self.subject.connect2run('select 1')
+
+        self.subject.closeDbs()
+
+        self.assertEqual(self.db_connection.close.call_count, 2)
+
+    def test_runAllChecks__schedules_checks_in_order_with_dependencies(self):
+        self.subject.GV.version = 'main'
+        self.subject.GV.scheduler = Mock(spec=['run'])
+
+        self.subject.runAllChecks()
+
+        tasks = self.subject.GV.scheduler.run.call_args[0][0]
+        names = [name for (name, fn, depends) in tasks]
+        self.assertEqual(names, sorted(self.subject.all_checks, key=lambda x: self.subject.all_checks[x]["order"]))
+        self.assertEqual(dict((name, depends) for (name, fn, depends) in tasks)['part_constraint'], ['foreign_key'])
+
+    def test_runOneCheck__with_concurrent_checks__records_each_failure_separately(self):
+        self.subject.GV.scheduler = self.subject.CheckScheduler(2)
+        self.subject.all_checks = {
+            'fails': dict(fn=lambda: setattr(self.subject.GV, 'checkStatus', False), online=True),
+            'passes': dict(fn=lambda: None, online=True),
+        }
+
+        self.subject.GV.scheduler.run([(name, lambda name=name: self.subject.runOneCheck(name), [])
+                                       for name in ['fails', 'passes']])
+
+        self.assertEqual(self.subject.GV.failedChecks, ['fails'])
+        self.assertEqual(self.subject.GV.totalCheckRun, 2)
+
+    def test_repair_statements__are_added_under_the_global_lock(self):
+        self.subject.GV.reset_stmt_queues()
+        adders = [lambda: self.subject.addRemove(1, 'DELETE FROM pg_class WHERE oid = 1;'),
+                  lambda: self.subject.fixupowners('public', 't', 'old', 'new')]
+
+        with self.subject.GV.lock:
+            threads = [Thread(target=add) for add in adders]
+            for thread in threads:
+                thread.start()
+                thread.join(0.1)
+                self.assertTrue(thread.is_alive())
+            self.assertEqual(self.subject.GV.Remove, {})
+            self.assertEqual(self.subject.GV.Owners, [])
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.subject.GV.Remove, {1: ['DELETE FROM pg_class WHERE oid = 1;']})
+        self.assertEqual(len(self.subject.GV.Owners), 3)
+
+    @patch('gpcheckcat.processMissingDuplicateEntryResult')
+    def test_checkTableMissingEntry__with_streaming__compares_segment_streams(self, process_mock):
+        self.subject.GV.opt['-m'] = True
+        self.subject.GV.dbname = 'db1'
+        cursors = {'host0': Mock(), 'host1': Mock()}
+        cursors['host0'].query.return_value.getresult.side_effect = [[(1,), (2,)], []]
+        cursors['host1'].query.return_value.getresult.side_effect = [[(1,)], []]
+        self.subject.pg.connect.side_effect = lambda host, **kwargs: cursors['host0' if kwargs['opt'] is None else 'host1']
+        aTable = Mock(spec=GPCatalogTable)
+        aTable.getTableName.return_value = 'pg_class'
+        aTable.getPrimaryKey.return_value = ['oid']
+        aTable.isMasterOnly.return_value = False
+        aTable.getTableColtypes.return_value = {'oid': 'oid'}
+        aTable.tableHasConsistentOids.return_value = True
+
+        results = self.subject.checkTableMissingEntry(aTable)
+
+        self.assertEqual(results, [(2, '{-1}')])
+        process_mock.assert_called_once_with('pg_class', ['oid', 'segids'], [(2, '{-1}')], 'missing')
+        self.assertFalse(self.subject.GV.missingEntryStatus)
+
+    def test_checkTableMissingEntry__when_table_unchanged_since_clean_run__skips(self):
+        self.subject.GV.unchangedTables = set(['pg_class'])
+        aTable = Mock(spec=GPCatalogTable)
+        aTable.getTableName.return_value = 'pg_class'
+        aTable.getPrimaryKey.return_value = ['oid']
+        aTable.isMasterOnly.return_value = False
+
+        self.assertIsNone(self.subject.checkTableMissingEntry(aTable))
+        self.assertFalse(self.db_connection.query.called)
+
+    @patch('gpcheckcat.CatalogFingerprints')
+    def test_saveFingerprints__when_issues_found__does_not_save(self, fingerprints_mock):
+        self.subject.GV.opt['-I'] = '/tmp/state'
+        self.subject.GV.fingerprints = {'pg_class': {-1: (1, '1')}}
+        self.subject.GV.failedChecks = ['missing_extraneous']
+
+        self.subject.saveFingerprints()
+
+        self.assertFalse(fingerprints_mock.return_value.save.called)
+
+    @patch('gpcheckcat.fingerprintTables')
+    @patch('gpcheckcat.CatalogFingerprints')
+    def test_saveFingerprints__when_clean__saves_tables_unchanged_during_the_run(self, fingerprints_mock,
+                                                                                fingerprint_tables_mock):
+        self.subject.GV.opt['-I'] = '/tmp/state'
+        self.subject.GV.dbname = 'db2'
+        self.subject.GV.fingerprints = {'pg_class': {-1: (1, '1')}, 'pg_type': {-1: (1, '1')}}
+        self.subject.GV.failedChecks = []
+        # an earlier database of the same run had issues
+        self.subject.GV.retcode = self.subject.ERROR_NOREPAIR
+        self.subject.GV.dbRetcode = self.subject.SUCCESS
+        fingerprints_mock.return_value.get_unchanged_tables.side_effect = CatalogFingerprints.get_unchanged_tables
+        fingerprint_tables_mock.return_value = {'pg_class': {-1: (1, '1')}, 'pg_type': {-1: (2, '7')}}
+        tables = [Mock(), Mock(), Mock()]
+        for table, name in zip(tables, ['pg_class', 'pg_type', 'pg_proc']):
+            table.getTableName.return_value = name
+        self.subject.GV.catalog = Mock()
+        self.subject.GV.catalog.getCatalogTables.return_value = tables
+
+        self.subject.saveFingerprints()
+
+        fingerprints_mock.assert_called_once_with('/tmp/state', 'db2')
+        fingerprint_tables_mock.assert_called_once_with(fingerprints_mock.return_value, tables[:2])
+        fingerprints_mock.return_value.save.assert_called_once_with({'pg_class': {-1: (1, '1')}})
+
     ####################### PRIVATE METHODS #######################
 
     def _run_batch_size_experiment(self, num_primaries):
@@ -9,6 +9,7 @@ from gppylib.db import catalog
 from gppylib.gplog import *
 from gppylib.system.configurationInterface import GpConfigurationProvider
 from gppylib.system.environment import GpMasterEnvironment
+import datetime
 import io
 import sys
 
@@ -132,6 +133,114 @@ class GpExpand(GpTestCase):
     # end tests for interview_setup()
     #
 
+    def test_form_dist_policy_name_uses_attributes_looked_up_for_all_tables(self):
+        with patch('gpexpand.WorkerPool'):
+            expand = self.subject.gpexpand(self.subject.logger, self.gparray, Mock(pgdb='db'), self.options)
+        conn = Mock()
+        with patch('gpexpand.dbconn.execSQL', return_value=[(1001, 1, 'a'), (1001, 2, 'b'), (1002, 1, 'a')]):
+            attributes = expand.get_attributes(conn, [1001, 1002])
+
+        with patch('gpexpand.dbconn.execSQL') as execSQL:
+            self.assertEqual(expand.form_dist_policy_name(conn, '{2,1}', 1001, attributes), ('b , a', '1001 , 1001'))
+            self.assertEqual(expand.form_dist_policy_name(conn, '{1}', 1002, attributes), ('a', '1002'))
+            self.assertFalse(execSQL.called)
+
+    def test_expand_command_closes_connections_when_status_update_fails(self):
+        table = self.subject.ExpandTable(options=self.options)
+        table.dbname = 'db'
+        table.fq_name = 'public.leaf_1'
+        table.expand = Mock(return_value=True)
+        table.mark_finished = Mock(side_effect=Exception('connection lost'))
+        status_conn, table_conn = Mock(), Mock()
+        cmd = self.subject.ExpandCommand('name', Mock(), table, self.options)
+
+        with patch('gpexpand.dbconn.connect', side_effect=[status_conn, table_conn]):
+            with self.assertRaises(Exception):
+                cmd.run()
+
+        status_conn.close.assert_called_once_with()
+        table_conn.close.assert_called_once_with()
+        self.assertEqual(cmd.cancel_conn, None)
+
+    def test_perform_expansion_disables_pooling_when_it_fails(self):
+        with patch('gpexpand.WorkerPool'):
+            expand = self.subject.gpexpand(self.subject.logger, self.gparray, Mock(pgdb='db'), self.options)
+
+        with patch('gpexpand.WorkerPool'), \
+                patch('gpexpand.dbconn.enablePooling') as enablePooling, \
+                patch('gpexpand.dbconn.disablePooling') as disablePooling, \
+                patch('gpexpand.dbconn.execSQL', side_effect=Exception('connection lost')):
+            with self.assertRaisesRegexp(Exception, 'connection lost'):
+                expand.perform_expansion()
+
+        self.assertTrue(enablePooling.called)
+        disablePooling.assert_called_once_with()
+
+    def test_queue_new_relfile_bytes_queries_every_primary_without_waiting(self):
+        with patch('gpexpand.WorkerPool'):
+            expand = self.subject.gpexpand(self.subject.logger, self.gparray, Mock(pgdb='db'), self.options)
+        queued = []
+        expand.pool = Mock()
+        expand.pool.addCommand.side_effect = queued.append
+        started = datetime.datetime(2018, 1, 1, 10, 0, 0)
+        in_progress = {'db1': {1001: (100, started + datetime.timedelta(minutes=5)), 1002: (200, started)},
+                       'db2': {2001: (300, started)}}
+
+        cmds = expand.queue_new_relfile_bytes(in_progress)
+
+        self.assertEqual(cmds, queued)
+        self.assertEqual(sorted(cmd.dbname for cmd in queued), ['db1', 'db1', 'db2', 'db2'])
+        self.assertEqual([cmd.since for cmd in queued], [started] * 4)
+        self.assertFalse(expand.pool.join.called)
+
+        cursor = Mock()
+        cursor.fetchone.return_value = (1024,)
+        conn = MagicMock()
+        conn.__enter__.return_value.cursor.return_value = cursor
+        with patch('gpexpand.dbconn.connect', return_value=conn) as connect:
+            for cmd in queued:
+                cmd.run()
+
+        self.assertEqual(expand.new_relfile_bytes(in_progress, queued), {'db1': 2048, 'db2': 2048})
+        self.assertFalse(connect.call_args[1]['pooled'])
+        self.assertIn('modification >= %(since)s', cursor.execute.call_args[0][0])
+        self.assertEqual(cursor.execute.call_args[0][1], {'since': '2018-01-01 10:00:00'})
+
+    def test_new_relfile_bytes_fails_when_a_primary_cannot_be_sampled(self):
+        with patch('gpexpand.WorkerPool'):
+            expand = self.subject.gpexpand(self.subject.logger, self.gparray, Mock(pgdb='db'), self.options)
+        cmd = self.subject.NewRelfileBytesCommand('name', 'sdw1:40000', 'db1', datetime.datetime.now())
+
+        with patch('gpexpand.dbconn.connect', side_effect=Exception('connection refused')):
+            cmd.run()
+
+        with self.assertRaisesRegexp(Exception, 'connection refused'):
+            expand.new_relfile_bytes({'db1': {1001: (100, datetime.datetime.now())}}, [cmd])
+
+    def test_publish_progress_sample_waits_for_every_segment(self):
+        with patch('gpexpand.WorkerPool'):
+            expand = self.subject.gpexpand(self.subject.logger, self.gparray, Mock(pgdb='db'), self.options)
+        expand.conn = Mock()
+        expand.pool = Mock()
+        expand.source_rows = Mock(return_value={1001: 10.0})
+        started = datetime.datetime(2018, 1, 1, 10, 0, 0)
+        in_progress = {'db1': {1001: (100, started)}}
+        cmds = [Mock(dbname='db1', bytes=20, error=None), Mock(dbname='db1', bytes=30, error=None)]
+        expand.progress_sample = (started + datetime.timedelta(seconds=10), in_progress, cmds, [])
+
+        expand.pool.getCompletedItems.return_value = cmds[:1]
+        with patch('gpexpand.dbconn.execSQL') as execSQL:
+            expand.publish_progress_sample()
+        self.assertFalse(execSQL.called)
+        self.assertIsNotNone(expand.progress_sample)
+
+        expand.pool.getCompletedItems.return_value = cmds[1:]
+        with patch('gpexpand.dbconn.execSQL') as execSQL:
+            expand.publish_progress_sample()
+        self.assertIsNone(expand.progress_sample)
+        self.assertIn("'db1', 1001, '2018-01-01 10:00:10', 50, 50.0", execSQL.call_args[0][1])
+        expand.conn.commit.assert_called_once_with()
+
     def createGpArrayWith2Primary2Mirrors(self):
         self.master = Segment.initFromString(
             "1|-1|p|p|s|u|mdw|mdw|5432|/data/master")
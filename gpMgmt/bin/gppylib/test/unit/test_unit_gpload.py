@@ -7,9 +7,11 @@ Unit testing for gpload module
 """
 import unittest
 import os
+import shutil
+import tempfile
 
 from gpload import *
-from mock import Mock
+from mock import Mock, patch
 
 class GpLoadTestCase(unittest.TestCase):
     """
@@ -100,6 +102,258 @@ class GpLoadTestCase(unittest.TestCase):
         self.assertEqual(False, gploader.getconfig('gpload:input:log_errors', bool, False))
         self.assertEqual(True, gploader.getconfig('gpload:input:fully_qualified_domain_name', bool))
 
+    def test_case_loads_table_loader(self):
+        gploader = gpload(['-f', os.path.join(os.path.dirname(__file__), 'gpload_multi.yml')])
+        gploader.read_config()
+        self.assertEqual(3, len(gploader.loads))
+
+        loaders = [gploader.table_loader(i + 1) for i in range(3)]
+        self.assertEqual([u'"public"', None, None], [l.schema for l in loaders])
+        self.assertEqual([u'"orders"', u'"customers"', u'"items"'], [l.table for l in loaders])
+        self.assertEqual(u'merge', loaders[1].getconfig('gpload:output:mode', unicode))
+        self.assertNotEqual(loaders[0].extTableName, loaders[1].extTableName)
+        self.assertEqual(u'mdw', loaders[2].options.h)
+
+    def test_case_loads_share_gpfdist(self):
+        gploader = gpload(['-f', os.path.join(os.path.dirname(__file__), 'gpload_multi.yml')])
+        gploader.read_config()
+        loaders = [gploader.table_loader(i + 1) for i in range(3)]
+        gploader.start_gpfdist = Mock(side_effect=[1981, 1990])
+
+        gploader.start_shared_gpfdists(loaders)
+
+        self.assertEqual(2, gploader.start_gpfdist.call_count)
+        popenList = gploader.start_gpfdist.call_args_list[0][0][0]
+        self.assertEqual(['-d', '/data/load'], popenList[-2:])
+        self.assertFalse('-f' in popenList)
+        self.assertEqual(['gpfdist://etl1:1981/orders/*.csv'], loaders[0].locations)
+        self.assertEqual(['gpfdist://etl1:1981/customers/part%201.csv'], loaders[1].locations)
+        self.assertEqual(['gpfdist://etl2:1990//staging/items.txt'], loaders[2].locations)
+
+    def test_case_loads_without_gpfdist_directory_serve_files_with_f(self):
+        gploader = gpload(['-f', os.path.join(os.path.dirname(__file__), 'gpload_multi.yml')])
+        gploader.read_config()
+        del gploader.config['gpfdist_directory']
+        del gploader.configOriginal['GPFDIST_DIRECTORY']
+        loaders = [gploader.table_loader(i + 1) for i in range(3)]
+        gploader.start_gpfdist = Mock(side_effect=[1981, 1982, 1990])
+
+        gploader.start_shared_gpfdists(loaders)
+
+        self.assertEqual(3, gploader.start_gpfdist.call_count)
+        for args in gploader.start_gpfdist.call_args_list:
+            self.assertFalse('-d' in args[0][0])
+        self.assertEqual(['-f', '"/data/load/orders/*.csv"'], gploader.start_gpfdist.call_args_list[0][0][0][-2:])
+        self.assertEqual(['gpfdist://etl1:1981//data/load/orders/*.csv'], loaders[0].locations)
+        self.assertEqual(['gpfdist://etl1:1982//data/load/customers/part 1.csv'], loaders[1].locations)
+        self.assertEqual(['gpfdist://etl2:1990//staging/items.txt'], loaders[2].locations)
+
+    def test_case_loads_failure_does_not_stop_other_tables(self):
+        gploader = gpload(['-q', '-q', '--max_connections', '2', '-f', os.path.join(os.path.dirname(__file__), 'gpload_multi.yml')])
+        gploader.read_config()
+        gploader.db = Mock()
+        gploader.start_shared_gpfdists = Mock()
+        loaded = []
+
+        def do_method(loader):
+            if loader.table == u'"customers"':
+                loader.log(loader.ERROR, 'merge failed')
+            loaded.append(loader.table)
+            loader.rowsInserted = '10'
+
+        with patch.object(gpload, 'setup_connection', autospec=True, side_effect=lambda loader: setattr(loader, 'db', Mock())), \
+             patch.object(gpload, 'read_table_metadata'), \
+             patch.object(gpload, 'read_columns'), \
+             patch.object(gpload, 'read_mapping'), \
+             patch.object(gpload, 'do_method', autospec=True, side_effect=do_method):
+            gploader.run_loads()
+
+        self.assertEqual(set([u'"orders"', u'"items"']), set(loaded))
+        self.assertEqual(20, gploader.rowsInserted)
+        self.assertEqual(2, gploader.exitValue)
+
+    def help_merge_loader(self, distkey):
+        gploader = gpload(['-q', '-q', '-f', os.path.join(os.path.dirname(__file__), 'gpload_merge.yml')])
+        gploader.read_config()
+        gploader.schema = 'public'
+        gploader.into_columns = [['"id"', 'int4', 'id', False], ['"msg"', 'text', 'msg', False]]
+        gploader.into_columns_dict = dict((c[0], c) for c in gploader.into_columns)
+        gploader.get_table_dist_key = Mock(return_value=distkey)
+        gploader.table_supports_update()
+        return gploader
+
+    def test_case_staging_distributed_like_target(self):
+        gploader = self.help_merge_loader(['id'])
+        self.assertEqual(['"id"'], gploader.get_staging_distribution())
+
+    def test_case_staging_distributed_on_match_columns(self):
+        gploader = self.help_merge_loader([])
+        self.assertEqual(['id'], gploader.get_staging_distribution())
+        gploader = self.help_merge_loader(['other'])
+        self.assertEqual(['id'], gploader.get_staging_distribution())
+
+    def test_case_merge_insert_numbers_only_new_rows(self):
+        gploader = self.help_merge_loader(['id'])
+        gploader.db = Mock()
+        gploader.db.query.return_value = '3'
+
+        gploader.do_merge_insert()
+
+        sql = gploader.db.query.call_args[0][0]
+        self.assertTrue('row_number() OVER (PARTITION BY from_table."id")' in sql)
+        self.assertTrue('LEFT OUTER JOIN public."test" into_table ON into_table."id"=from_table."id" WHERE into_table."id" IS NULL) AS from_table' in sql)
+        self.assertEqual('3', gploader.rowsInserted)
+
+    def test_case_merge_reports_phases(self):
+        gploader = self.help_merge_loader(['id'])
+        gploader.create_staging_table = Mock()
+        gploader.create_external_table = Mock()
+        gploader.do_insert = Mock()
+        gploader.do_update = Mock()
+        gploader.do_merge_insert = Mock()
+
+        gploader.do_method_merge()
+
+        self.assertEqual(['load staging', 'update', 'insert'], [phase for phase, seconds in gploader.phaseTimes])
+
+    def test_case_progress_polls_every_gpfdist(self):
+        gploader = gpload(['-q', '-q', '-f', os.path.join(os.path.dirname(__file__), 'gpload_merge.yml')])
+        progress = Progress(gploader, [8000, 8001], row_size=10.0, expected_bytes=4000)
+
+        def get(port):
+            if port == 8001:
+                raise socket.error('connection refused')
+            return 1000, 2000, 1
+        progress.get = Mock(side_effect=get)
+
+        progress.poll()
+        summary = progress.summary()
+
+        self.assertEqual(2, progress.get.call_count)
+        self.assertEqual(1000, summary['read_bytes'])
+        self.assertEqual(4000, summary['total_bytes'])
+        self.assertEqual(100, summary['estimated_rows'])
+        self.assertEqual([8000, 8001], [g['port'] for g in summary['gpfdist']])
+        self.assertEqual([0, 1], [g['failed_polls'] for g in summary['gpfdist']])
+        self.assertEqual(summary, json.loads(json.dumps(summary)))
+
+    def test_case_progress_stop_without_start(self):
+        gploader = gpload(['-q', '-q', '-f', os.path.join(os.path.dirname(__file__), 'gpload_merge.yml')])
+        gploader.log = Mock()
+        progress = Progress(gploader, [8000])
+        progress.get = Mock(return_value=(10, 10, 1))
+        progress.start()
+
+        progress.stop()
+
+        self.assertFalse(progress.isAlive())
+        self.assertTrue(gploader.log.call_args[0][1].startswith('transfer summary: {'))
+
+    def test_case_average_row_size(self):
+        self.assertEqual(None, average_row_size(['/nonexistent/*.csv']))
+        self.assertTrue(average_row_size([os.path.join(os.path.dirname(__file__), 'gpload_merge.yml')]) > 1)
+
+    def help_stream_files(self, names):
+        landing = os.path.join(self.tempdir, 'landing')
+        if not os.path.isdir(landing):
+            os.makedirs(landing)
+        for name in names:
+            f = open(os.path.join(landing, name), 'w')
+            f.write('1|a\n')
+            f.close()
+        return os.path.join(landing, '*.txt')
+
+    def test_case_stream_loads_files_once_they_are_stable(self):
+        self.tempdir = tempfile.mkdtemp()
+        try:
+            pattern = self.help_stream_files(['a.txt', 'b.txt', 'c.txt'])
+            stream = StreamState(os.path.join(self.tempdir, 'state'), [[pattern]])
+            stream.prepare()
+
+            self.assertEqual([], stream.next_batch(2))
+            batch = stream.next_batch(2)
+            self.assertEqual(['a.txt', 'b.txt'], [os.path.basename(f[1]) for f in batch])
+
+            stream.stage(batch)
+            self.assertEqual(['000000_a.txt', '000001_b.txt', 'gpload_empty'], sorted(os.listdir(stream.source_dir(0))))
+            stream.commit(batch)
+            self.assertEqual(['gpload_empty'], os.listdir(stream.source_dir(0)))
+
+            self.assertEqual(['c.txt'], [os.path.basename(f[1]) for f in stream.next_batch(2)])
+
+            # after a restart only files that were not committed are loaded
+            restarted = StreamState(os.path.join(self.tempdir, 'state'), [[pattern]])
+            restarted.scan()
+            self.assertEqual(['c.txt'], [os.path.basename(f[1]) for f in restarted.next_batch(2)])
+        finally:
+            shutil.rmtree(self.tempdir)
+
+    def test_case_stream_loads_only_appended_bytes(self):
+        self.tempdir = tempfile.mkdtemp()
+        try:
+            pattern = self.help_stream_files(['a.txt', 'b.txt'])
+            warnings = []
+            stream = StreamState(os.path.join(self.tempdir, 'state'), [[pattern]], warnings.append)
+            stream.prepare()
+            stream.scan()
+            stream.commit(stream.next_batch(2))
+
+            landing = os.path.dirname(pattern)
+            f = open(os.path.join(landing, 'a.txt'), 'a')
+            f.write('2|b\n')
+            f.close()
+            f = open(os.path.join(landing, 'b.txt'), 'w')
+            f.write('3|c\n')
+            f.close()
+            os.utime(os.path.join(landing, 'b.txt'), (0, 0))
+            stream.scan()
+
+            # after a restart too
+            restarted = StreamState(os.path.join(self.tempdir, 'state'), [[pattern]], warnings.append)
+            for s in [stream, restarted]:
+                s.scan()
+                batch = s.next_batch(2)
+                self.assertEqual([(0, os.path.join(landing, 'a.txt'), 4, 8)], [f[:4] for f in batch])
+                s.stage(batch)
+                staged = open(os.path.join(s.source_dir(0), '000000_a.txt'))
+                self.assertEqual('2|b\n', staged.read())
+                staged.close()
+                s.unstage()
+
+            self.assertEqual(2, len(warnings))
+            self.assertIn('b.txt has been rewritten', warnings[0])
+        finally:
+            shutil.rmtree(self.tempdir)
+
+    def test_case_stream_batches_reuse_tables(self):
+        gploader = self.help_merge_loader(['id'])
+        gploader.db = Mock()
+        gploader.create_staging_table = Mock()
+        gploader.create_external_table = Mock()
+        gploader.do_insert = Mock()
+        gploader.do_update = Mock()
+        gploader.do_merge_insert = Mock()
+
+        gploader.do_method()
+        gploader.streamBatches += 1
+        gploader.do_method()
+
+        self.assertEqual(1, gploader.create_staging_table.call_count)
+        self.assertEqual(1, gploader.create_external_table.call_count)
+        self.assertEqual(2, gploader.do_merge_insert.call_count)
+
+    def test_case_gpfdist_directory(self):
+        # files are only shared under a configured directory, even when they are all in one
+        self.assertEqual(None, gpfdist_directory(['/data/a/x.csv', '/data/a/*.csv']))
+        self.assertEqual(None, gpfdist_directory(['/data/a/x.csv', '/data/ab/y.csv']))
+        self.assertEqual('/data/a', gpfdist_directory(['/data/a/x.csv', '/data/a/*.csv'], '/data'))
+        self.assertEqual(None, gpfdist_directory(['/data/*/x.csv']))
+        self.assertEqual(None, gpfdist_directory(['/x.csv', '/data/y.csv']))
+        self.assertEqual('/data', gpfdist_directory(['/data/a/x.csv', '/data/ab/y.csv'], '/data'))
+        self.assertEqual('/data/a', gpfdist_directory(['/data/a/x.csv', '/data/a/b/y.csv'], '/data/'))
+        self.assertEqual(None, gpfdist_directory(['/x.csv', '/data/y.csv'], '/data'))
+        self.assertEqual(None, gpfdist_directory(['/data2/x.csv', '/data2/a/y.csv'], '/data'))
+
 
 #------------------------------- Mainline --------------------------------
 if __name__ == '__main__':
@@ -45,6 +45,7 @@ class GpStart(GpTestCase):
                   side_effect=[{2: self.primary0, 3: self.primary1}, [], []]),
             patch('gpstart.GpDbidFile'),
             patch('gpstart.GpEraFile'),
+            patch('gpstart.GpConfigCacheFile'),
             patch('gpstart.userinput'),
             patch('gpstart.HeapChecksum'),
             patch('gpstart.log_to_file_only'),
@@ -58,6 +59,7 @@ class GpStart(GpTestCase):
 
         self.mock_start_result = self.get_mock_from_apply_patch('StartSegmentsOperation')
         self.mock_start_result.return_value.startSegments.return_value.getSuccessfulSegments.return_value = start_result.getSuccessfulSegments()
+        self.mock_start_result.return_value.startSegments.return_value.getHostTimings.return_value = {}
 
         self.mock_os_path_exists = self.get_mock_from_apply_patch('exists')
         self.mock_gp = self.get_mock_from_apply_patch('gp')
@@ -70,6 +72,9 @@ class GpStart(GpTestCase):
         self.mock_pgconf.readfile.return_value = Mock()
         self.mock_gplog_log_to_file_only = self.get_mock_from_apply_patch("log_to_file_only")
 
+        self.mock_config_cache = self.get_mock_from_apply_patch('GpConfigCacheFile')
+        self.mock_config_cache.return_value.filepath = 'masterdatadir/gp_config_cache'
+
         self.mock_gp.get_masterdatadir.return_value = 'masterdatadir'
         self.mock_gp.GpCatVersion.local.return_value = 1
         self.mock_gp.GpCatVersionDirectory.local.return_value = 1
@@ -169,6 +174,41 @@ class GpStart(GpTestCase):
         messages = [msg[0][0] for msg in self.subject.logger.info.call_args_list]
         self.assertIn("DBID:5  FAILED  host:'sdw1' datadir:'/data/mirror1' with reason:'fictitious reason'", messages)
 
+    def test_start_uses_cached_configuration_without_starting_master_in_utility_mode(self):
+        sys.argv = ["gpstart", "-a"]
+        self.mock_os_path_exists.side_effect = lambda path: path.endswith('gp_config_cache')
+        self.mock_config_cache.return_value.get_gparray.return_value = self.gparray
+        parser = self.subject.GpStart.createParser()
+        options, args = parser.parse_args()
+        gpstart = self.subject.GpStart.createProgram(options, args)
+
+        return_code = gpstart.run()
+
+        self.assertEqual(return_code, 0)
+        self.mock_config_cache.return_value.validate.assert_called_once_with(
+            self.get_mock_from_apply_patch('PgControlData').return_value)
+        self.mock_config_cache.return_value.remove.assert_called_once_with()
+        self.assertFalse(self.mock_gp.MasterStart.called)
+        self.assertFalse(self.mock_gp.GpStop.called)
+        self.assertEqual(self.mock_gp.MasterStart.local.call_count, 1)
+        self.subject.logger.info.assert_any_call('Using the segment configuration cached by the last clean shutdown')
+
+    def test_start_falls_back_to_catalog_when_cached_configuration_is_stale(self):
+        sys.argv = ["gpstart", "-a"]
+        self.mock_os_path_exists.side_effect = lambda path: path.endswith('gp_config_cache')
+        self.mock_config_cache.return_value.validate.side_effect = Exception('master has run since')
+        parser = self.subject.GpStart.createParser()
+        options, args = parser.parse_args()
+        gpstart = self.subject.GpStart.createProgram(options, args)
+
+        return_code = gpstart.run()
+
+        self.assertEqual(return_code, 0)
+        self.subject.logger.info.assert_any_call('Not using the cached segment configuration: master has run since')
+        self.subject.logger.info.assert_any_call('Starting Master instance in admin mode')
+        self.assertTrue(self.mock_gp.GpStop.called)
+        self.mock_config_cache.return_value.remove.assert_called_once_with()
+
     def test_standby_startup_skipped(self):
         sys.argv = ["gpstart", "-a", "-y"]
 
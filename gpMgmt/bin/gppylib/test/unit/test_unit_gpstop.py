@@ -5,6 +5,7 @@ import sys
 from gparray import Segment, GpArray, SegmentPair
 from mock import Mock, patch
 from gppylib.test.unit.gp_unittest import GpTestCase, run_tests
+from gppylib.commands.base import CommandResult
 from gppylib.commands.gp import GpSegStopCmd
 from gppylib.mainUtils import ProgramArgumentValidationException
 
@@ -36,9 +37,12 @@ class GpStop(GpTestCase):
             patch('gpstop.pgconf', return_value=self.mock_pgconf),
             patch('gpstop.os', return_value=self.mock_os),
             patch('gpstop.dbconn.connect', return_value=self.mock_conn),
+            patch('gpstop.dbconn.execSQLForSingleton', return_value='0/1E3A2B8'),
             patch('gpstop.catalog', return_value=self.mock_catalog),
             patch('gpstop.unix', return_value=self.mock_unix),
             patch('gpstop.GpEraFile', return_value=self.mock_gperafile),
+            patch('gpstop.GpConfigCacheFile'),
+            patch('gpstop.pg.PgControlData'),
             patch('gpstop.GpArray.initFromCatalog'),
             patch('gpstop.gphostcache.unix.Ping'),
             patch('gpstop.RemoteOperation'),
@@ -54,6 +58,12 @@ class GpStop(GpTestCase):
         self.mock_gparray = self.get_mock_from_apply_patch('initFromCatalog')
         self.mock_gparray.return_value = self.gparray
         self.mock_socket = self.get_mock_from_apply_patch('gethostname')
+        self.mock_config_cache = self.get_mock_from_apply_patch('GpConfigCacheFile')
+
+        # the pool completes segment stops in the order they are dispatched
+        self.stop_cmds = []
+        self.mock_workerpool.return_value.addCommand.side_effect = self._add_command
+        self.mock_workerpool.return_value.getNextCompletedItem.side_effect = lambda quiet=True: self.stop_cmds.pop(0)
 
     def tearDown(self):
         super(GpStop, self).tearDown()
@@ -81,6 +91,16 @@ class GpStop(GpTestCase):
             "9|3|m|m|s|u|sdw1|sdw1|50003|/data/mirror3")
         return GpArray([self.master, self.primary0, self.primary1, self.primary2, self.primary3, self.mirror0, self.mirror1, self.mirror2, self.mirror3])
 
+    def _add_command(self, cmd, priority=0):
+        if not isinstance(cmd, GpSegStopCmd):
+            return
+        dbs = self.mock_GpSegStopCmdInit.call_args[1]['dbs']
+        cmd.dblist = dbs
+        cmd.elapsed = 2.0 if dbs[0].getSegmentHostName() == 'sdw1' else 1.0
+        cmd.results = CommandResult(0, "\n".join(["STATUS--DIR:%s--STOPPED:True--REASON:None" % db.datadir
+                                                  for db in dbs]), '', True, False)
+        self.stop_cmds.append(cmd)
+
     def get_info_messages(self):
         return [args[0][0] for args in self.subject.logger.info.call_args_list]
 
@@ -127,6 +147,53 @@ class GpStop(GpTestCase):
                                                                    self.mirror3.getSegmentDbId()], log_messages)
         self.assertIn("Successfully shutdown 4 of 8 segment instances ", log_messages)
 
+    def test_full_stop_caches_configuration_for_gpstart(self):
+        sys.argv = ["gpstop", "-a"]
+        parser = self.subject.GpStop.createParser()
+        options, args = parser.parse_args()
+
+        gpstop = self.subject.GpStop.createProgram(options, args)
+        gpstop.run()
+
+        self.mock_config_cache.return_value.write.assert_called_once_with(
+            self.gparray, self.get_mock_from_apply_patch('PgControlData').return_value, '0/1E3A2B8')
+        self.assertIn("Cached the segment configuration for the next gpstart", self.get_info_messages())
+
+    def test_hostonly_stop_does_not_cache_configuration(self):
+        sys.argv = ["gpstop", "-a", "--host", "sdw1"]
+        parser = self.subject.GpStop.createParser()
+        options, args = parser.parse_args()
+
+        gpstop = self.subject.GpStop.createProgram(options, args)
+        gpstop.run()
+
+        self.assertFalse(self.mock_config_cache.return_value.write.called)
+
+    def test_mirrors_of_a_host_are_stopped_once_their_primaries_have_stopped(self):
+        sys.argv = ["gpstop", "-a"]
+        parser = self.subject.GpStop.createParser()
+        options, args = parser.parse_args()
+        dispatched_before_completion = []
+
+        def next_completed(quiet=True):
+            dispatched_before_completion.append(self.mock_GpSegStopCmdInit.call_count)
+            return self.stop_cmds.pop(0)
+        self.mock_workerpool.return_value.getNextCompletedItem.side_effect = next_completed
+
+        gpstop = self.subject.GpStop.createProgram(options, args)
+        gpstop.run()
+
+        dispatched = [call[1]['dbs'] for call in self.mock_GpSegStopCmdInit.call_args_list]
+        first_primaries = dispatched[0]
+        self.assertEqual(sorted(dispatched[2]), sorted(self.gparray.getDbIdToPeerMap()[db.getSegmentDbId()]
+                                                       for db in first_primaries))
+        self.assertTrue(all(db.isSegmentMirror() for db in dispatched[2] + dispatched[3]))
+        # the mirrors of the first primaries are already stopping when the second primaries finish
+        self.assertEqual(dispatched_before_completion, [2, 3, 4, 4])
+        self.assertIn("Successfully shutdown 8 of 8 segment instances ", self.get_info_messages())
+        self.assertIn("Segment shutdown took 2.0 to 4.0 seconds per host (median 4.0) on 2 hosts",
+                      self.get_info_messages())
+
     def test_host_missing_from_config(self):
         sys.argv = ["gpstop", "-a", "--host", "nothere"]
         host_names = self.gparray.getSegmentsByHostName(self.gparray.getDbList()).keys()
@@ -134,6 +134,7 @@ class GpTransfer(GpTestCase):
             partition_transfer_non_pt_target=False,
             quiet=None,
             quote='\x01',
+            resume=False,
             schema_only=False,
             skip_existing=False,
             source_host='127.0.0.1',
@@ -149,7 +150,7 @@ class GpTransfer(GpTestCase):
             gpfdist_verbose=False,
             gpfdist_very_verbose=False,
             wait_time=3,
-            work_base_dir='/home/gpadmin/',
+            work_base_dir=self.TEMP_DIR,
         )
 
     def tearDown(self):
@@ -213,6 +214,77 @@ class GpTransfer(GpTestCase):
                          '> pid_file && bash -c "(sleep 1 && kill -0 \\`cat pid_file 2> /dev/null\\` && cat log_file) ' \
                          '|| (cat log_file >&2 && exit 1)"', cmd.cmdStr)
 
+    def test__GpfdistEndpoints_serve_pipes_of_every_table_from_the_work_dir(self):
+        started = []
+
+        def add_command(cmd):
+            cmd.set_results(self.subject.CommandResult(0, 'Serving HTTP on port %d' % (8000 + len(started)),
+                                                       '', True, False))
+            started.append(cmd)
+
+        pool = Mock()
+        pool.addCommand.side_effect = add_command
+        pool.getCompletedItems.side_effect = lambda: list(started)
+        endpoints = self.subject.GpfdistEndpoints('/work', {'sdw1': ['10.0.0.1']}, None, False, 2,
+                                                  8000, 9000, 1024, 300, '', pool)
+        endpoints.start()
+
+        self.assertEqual(len(started), 4)
+        self.assertTrue(all(' -d /work ' in cmd.cmdStr for cmd in started))
+        self.assertEqual(endpoints.get_write_urls('/work/db.s.t1/db.s.t1.pipe'),
+                         ['gpfdist://10.0.0.1:8000/db.s.t1/db.s.t1.pipe.0',
+                          'gpfdist://10.0.0.1:8002/db.s.t1/db.s.t1.pipe.1'])
+        self.assertEqual(endpoints.get_read_urls('/work/db.s.t2/db.s.t2.pipe'),
+                         ['gpfdist://10.0.0.1:8001/db.s.t2/db.s.t2.pipe.0',
+                          'gpfdist://10.0.0.1:8003/db.s.t2/db.s.t2.pipe.1'])
+
+    def test__GpValidateCommand_commits_transfer_only_when_valid(self):
+        for (valid, rc) in [(True, 0), (False, 1)]:
+            src_conn, dest_conn = Mock(), Mock()
+            validator_class = Mock()
+            validator_class.return_value.validate.return_value = valid
+
+            cmd = self.subject.GpValidateCommand('validate', Mock(), '/work', validator_class, src_conn, dest_conn)
+            cmd.run()
+
+            self.assertEqual(cmd.get_results().rc, rc)
+            for conn in (src_conn, dest_conn):
+                self.assertEqual(conn.commit.called, valid)
+                self.assertEqual(conn.rollback.called, not valid)
+                conn.close.assert_called_once_with()
+
+    @patch('gppylib.commands.unix.findCmdInPath', return_value='rsync')
+    @patch('gptransfer.GpCloseNamedPipe.run')
+    @patch('gptransfer.DB')
+    def test__GpValidateCommand_with_md5_validator_creates_its_own_pipe_directory(self, mock_db, mock_close, mock_find):
+        # the transfer has already removed the directory of the table's data pipes
+        commands = []
+
+        def run_commands():
+            for cmd in commands:
+                stdout = 'd41d8cd98f00b204e9800998ecf8427e\n' if 'md5sum' in cmd.cmdStr else ''
+                cmd.set_results(self.subject.CommandResult(0, stdout, '', True, False))
+        self.workerpool.addCommand.side_effect = commands.append
+        self.workerpool.join.side_effect = run_commands
+        mock_db.return_value.host = 'mdw'
+        table_pair = self.subject.GpTransferTablePair(self.subject.GpTransferTable('db', 's', 't', False),
+                                                      self.subject.GpTransferTable('db', 's', 't', False))
+        src_conn, dest_conn = Mock(), Mock()
+
+        cmd = self.subject.GpValidateCommand('validate', table_pair, '/work', self.subject.MD5MergeTableValidator,
+                                             src_conn, dest_conn)
+        cmd.run()
+
+        self.assertEqual(cmd.get_results().rc, 0)
+        src_conn.commit.assert_called_once_with()
+        cmd_strs = [c.cmdStr for c in commands]
+        self.assertEqual(cmd_strs[0], 'mkdir -p /work/db.s.t.validation && mkfifo /work/db.s.t.validation/src_md5_validation')
+        self.assertEqual(cmd_strs[1], 'mkdir -p /work/db.s.t.validation && mkfifo /work/db.s.t.validation/dest_md5_validation')
+        self.assertIn("COPY (SELECT md5(textin(record_out(t.*))) hash\n                 FROM s.t t ORDER BY hash) "
+                      "TO '/work/db.s.t.validation/src_md5_validation'", [c[0][1] for c in self.cursor.call_args_list])
+        self.assertIn('/work/db.s.t.validation/', cmd_strs[-1])
+        self.assertTrue(cmd_strs[-1].startswith('if [ -d /work/db.s.t.validation ]'))
+
     @patch('os._exit')
     def test__cleanup_with_gpfdist_no_verbose_or_very_verbose_does_not_show_gpfdist_warning(self, mock1):
         options = self.setup_normal_to_normal_validation()
@@ -846,6 +918,19 @@ class GpTransfer(GpTestCase):
                                                 "must share the same parent"):
             self.subject.GpTransfer(Mock(**options), []).run()
 
+    def test__resume_skips_tables_the_journal_records_as_transferred(self):
+        options = self.setup_normal_to_normal_validation()
+        options.update(resume=True)
+        with open(os.path.join(self.TEMP_DIR, 'gptransfer_127.0.0.1_45432_127.0.0.1_15432.journal'), 'w') as f:
+            f.write('gptransfer journal|127.0.0.1:45432 127.0.0.1:15432\n'
+                    'started|my_first_database.public.my_normal_table|my_first_database.public.my_normal_table|1|-1|\n'
+                    'done|my_first_database.public.my_normal_table|my_first_database.public.my_normal_table|1|20|\n')
+
+        with self.assertRaises(SystemExit):
+            self.subject.GpTransfer(Mock(**options), [])
+        self.subject.logger.info.assert_any_call('Resuming transfer: %d tables already transferred, %d remaining', 1, 0)
+        self.subject.logger.info.assert_any_call('Found no tables to transfer.')
+
     def test__validating_transfer_with_empty_source_map_file_raises_proper_exception(self):
         options = self.setup_partition_to_normal_validation()
 
@@ -874,6 +959,27 @@ class GpTransfer(GpTestCase):
         self.assertEqual(escaped_query, validator._src_sql)
         self.assertEqual(escaped_query, validator._dest_sql)
 
+    def test__md5agg_validation_aggregates_row_hashes_without_sorting(self):
+        table_mock = Mock(spec=['schema', 'table'])
+        table_mock.schema = 'escapedSchema'
+        table_mock.table = 'escapedTable'
+        table_pair = Mock(spec=['source', 'dest'])
+        table_pair.source = table_mock
+        table_pair.dest = table_mock
+
+        validator = self.subject.validator_factory.get_validator('md5agg')('some_work_dir', table_pair,
+                                                                         'fake_db_connection', 'fake_db_connection')
+        self.assertIn('FROM "escapedSchema"."escapedTable" t', validator._src_sql)
+        self.assertIn('sum(', validator._src_sql)
+        self.assertNotIn('ORDER BY', validator._src_sql)
+        self.assertNotIn('COPY', validator._src_sql)
+
+        self.db_singleton.side_effect = [(3L, '123', '-45'), (3L, '123', '-45')]
+        self.assertTrue(validator.validate())
+
+        self.db_singleton.side_effect = [(3L, '123', '-45'), (3L, '123', '46')]
+        self.assertFalse(validator.validate())
+
     def test__validate_good_range_partition_from_4_to_X(self):
         options = self.setup_partition_validation()
 
@@ -1096,7 +1202,7 @@ class GpTransfer(GpTestCase):
             source_map_file=source_map_filename.name,
             base_port=15432,
             max_line_length=32768,
-            work_base_dir="/tmp",
+            work_base_dir=self.TEMP_DIR,
             source_port=45432,
             dest_port=15432,
         )
@@ -1123,7 +1229,7 @@ class GpTransfer(GpTestCase):
             source_map_file=source_map_filename.name,
             base_port=15432,
             max_line_length=32768,
-            work_base_dir="/tmp",
+            work_base_dir=self.TEMP_DIR,
             source_port=45432,
             dest_port=15432,
         )
@@ -1151,7 +1257,7 @@ class GpTransfer(GpTestCase):
             source_map_file=source_map_filename.name,
             base_port=15432,
             max_line_length=32768,
-            work_base_dir="/tmp",
+            work_base_dir=self.TEMP_DIR,
             source_port=45432,
             dest_port=15432,
         )
@@ -0,0 +1,86 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+from mock import *
+
+from gp_unittest import *
+from gppylib.logfilter import BisectByTimestamp, GzipLogIndex, MergeByTimestamp, SkipBytes, StopAtTimestamp
+
+
+def log_lines(seg, minutes):
+    lines = []
+    for minute in range(minutes):
+        lines.append('2016-05-01 10:%02d:00.000%d PST,seg%d,"LOG:  minute %d"\n' % (minute, seg, seg, minute))
+        lines.append('DETAIL:  seg%d minute %d\n' % (seg, minute))
+    return lines
+
+
+class LogFilterTestCase(GpTestCase):
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.log_dir)
+        super(LogFilterTestCase, self).tearDown()
+
+    def test_bisect_by_timestamp__starts_at_an_entry_before_the_timestamp(self):
+        lines = log_lines(0, 60)
+        filename = os.path.join(self.log_dir, 'seg0.log')
+        with open(filename, 'w') as f:
+            f.writelines(lines)
+
+        with open(filename, 'rU') as f:
+            offset = BisectByTimestamp(f, '2016-05-01 10:45:00', minBytes=100)
+            f.seek(offset)
+            tail = f.readlines()
+
+        self.assertGreater(offset, 0)
+        self.assertTrue(tail[0] < '2016-05-01 10:45:00')
+        self.assertEqual(tail[-30:], lines[-30:])
+        self.assertLess(len(tail), 40)
+
+    def test_gzip_log_index__finds_entries_in_later_members_and_is_reused(self):
+        lines = log_lines(0, 60)
+        filename = os.path.join(self.log_dir, 'seg0.log.gz')
+        # log rotation may append gzip members to a file
+        for part in (lines[:60], lines[60:]):
+            member = gzip.GzipFile(filename, 'ab')
+            member.writelines(part)
+            member.close()
+
+        block, offset = GzipLogIndex(filename, interval=200).lookup('2016-05-01 10:45:00')
+        with open(filename, 'rb') as f:
+            f.seek(block)
+            tail = gzip.GzipFile(fileobj=f)
+            SkipBytes(tail, offset)
+            tail = tail.readlines()
+
+        self.assertGreater(block, 0)
+        self.assertTrue(tail[0] < '2016-05-01 10:45:00')
+        self.assertEqual(tail[-30:], lines[-30:])
+        self.assertLess(len(tail), 40)
+
+        index = GzipLogIndex(filename, interval=200)
+        with patch.object(index, 'build') as mock_build:
+            self.assertEqual(index.lookup('2016-05-01 10:45:00'), (block, offset))
+        self.assertFalse(mock_build.called)
+
+    def test_stop_at_timestamp__stops_at_the_first_later_entry(self):
+        lines = log_lines(0, 10)
+
+        self.assertEqual(list(StopAtTimestamp(lines, '2016-05-01 10:03:00')), lines[:6])
+
+    def test_merge_by_timestamp__keeps_the_lines_of_an_entry_together(self):
+        seg0 = ['header\n'] + log_lines(0, 3)
+        seg1 = log_lines(1, 3)
+
+        merged = list(MergeByTimestamp([seg0, seg1]))
+
+        self.assertEqual(merged, ['header\n'] + seg0[1:3] + seg1[0:2] + seg0[3:5] + seg1[2:4] +
+                         seg0[5:7] + seg1[4:6])
+
+
+if __name__ == '__main__':
+    run_tests()
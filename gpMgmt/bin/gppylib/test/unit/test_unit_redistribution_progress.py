@@ -0,0 +1,45 @@
+from gp_unittest import *
+from gpexpand_modules.redistribution_progress import apportion, table_progress, render_status, format_seconds
+
+
+class RedistributionProgressTestCase(GpTestCase):
+    def test_apportion__in_proportion_to_source_bytes(self):
+        self.assertEqual(apportion(300, {'a': 100, 'b': 200}), {'a': 100, 'b': 200})
+        self.assertEqual(apportion(30, {'a': 0, 'b': 0}), {'a': 15, 'b': 15})
+
+    def test_table_progress(self):
+        (percent, bytes_per_second, rows_per_second, eta) = table_progress(1000.0, 100, 250, 10)
+
+        self.assertEqual(percent, 25.0)
+        self.assertEqual(bytes_per_second, 25.0)
+        self.assertEqual(rows_per_second, 2.5)
+        self.assertEqual(eta, 30.0)
+
+    def test_table_progress__not_complete_until_committed(self):
+        (percent, _, _, eta) = table_progress(1000.0, 100, 1500, 10)
+
+        self.assertEqual(percent, 99.9)
+        self.assertEqual(eta, 0)
+
+    def test_table_progress__before_anything_is_written(self):
+        self.assertEqual(table_progress(1000.0, 100, 0, 0), (0.0, 0.0, 0.0, None))
+
+    def test_render_status__adds_up_throughput_of_tables_in_progress(self):
+        summary = [('Tables Left', '3'), ('Tables Expanded', '2')]
+        tables = [('db1', 'public.t1', 50, 1024 * 1024, 1000, 3725, None),
+                  ('db1', 'public.t2', 10, 1024 * 1024, 500, None, None)]
+
+        lines = render_status(summary, tables)
+
+        self.assertIn('  Current throughput:            2.0 MB/s, 1500 rows/s', lines)
+        self.assertEqual(len([l for l in lines if 'db1.public.t' in l]), 2)
+        self.assertIn('1:02:05', lines[-2])
+        self.assertIn('unknown', lines[-1])
+
+    def test_format_seconds(self):
+        self.assertEqual(format_seconds(59), '0:00:59')
+        self.assertEqual(format_seconds(None), 'unknown')
+
+
+if __name__ == '__main__':
+    run_tests()
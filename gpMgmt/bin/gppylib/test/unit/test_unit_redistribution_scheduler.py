@@ -0,0 +1,112 @@
+import datetime
+
+from gp_unittest import *
+from gpexpand_modules.redistribution_scheduler import RedistributionScheduler
+
+MB = 1024 * 1024
+
+
+class FakeClock:
+    def __init__(self):
+        self.time = datetime.datetime(2017, 1, 1)
+
+    def __call__(self):
+        return self.time
+
+    def advance(self, seconds):
+        self.time += datetime.timedelta(seconds=seconds)
+
+
+class RedistributionSchedulerTestCase(GpTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def _scheduler(self, num_workers, io_budget=None, end_time=None, tables=()):
+        scheduler = RedistributionScheduler(num_workers, io_budget, end_time, now=self.clock)
+        for (name, rank, nbytes) in tables:
+            scheduler.add(name, rank, nbytes)
+        return scheduler
+
+    def _learn_rate(self, scheduler, mb_per_second):
+        """ redistributes a table to give the scheduler a rate """
+        scheduler.add('sample', 0, 10 * MB)
+        self.assertEqual(scheduler.next_table(), 'sample')
+        self.clock.advance(10.0 / mb_per_second)
+        scheduler.finished('sample')
+
+    def test_next_table__largest_first_within_rank(self):
+        scheduler = self._scheduler(3, tables=[('small', 2, 1 * MB), ('big', 2, 100 * MB),
+                                               ('unique_index', 1, 2 * MB)])
+
+        self.assertEqual([scheduler.next_table() for _ in range(4)], ['unique_index', 'big', 'small', None])
+
+    def test_next_table__respects_io_budget(self):
+        scheduler = self._scheduler(4, io_budget=100 * MB, tables=[('a', 2, 60 * MB), ('b', 2, 50 * MB)])
+
+        self.assertEqual(scheduler.next_table(), 'a')
+        self.assertEqual(scheduler.next_table(), None)
+        scheduler.finished('a')
+        self.assertEqual(scheduler.next_table(), 'b')
+
+    def test_next_table__table_over_budget_runs_alone(self):
+        scheduler = self._scheduler(4, io_budget=10 * MB, tables=[('huge', 2, 500 * MB)])
+
+        self.assertEqual(scheduler.next_table(), 'huge')
+
+    def test_next_table__small_tables_only_backfill_while_big_table_waits(self):
+        scheduler = self._scheduler(4, io_budget=100 * MB)
+        self._learn_rate(scheduler, mb_per_second=1)
+        for (name, rank, nbytes) in [('running', 1, 60 * MB), ('big', 2, 90 * MB), ('quick', 2, 5 * MB)]:
+            scheduler.add(name, rank, nbytes)
+
+        self.assertEqual(scheduler.next_table(), 'running')
+        self.assertEqual(scheduler.next_table(), 'quick')
+        self.assertEqual(scheduler.next_table(), None)
+        scheduler.finished('running')
+        self.assertEqual(scheduler.next_table(), 'big')
+
+    def test_next_table__backfill_must_finish_before_blocked_table_can_start(self):
+        scheduler = self._scheduler(4, io_budget=100 * MB)
+        self._learn_rate(scheduler, mb_per_second=1)
+        for (name, nbytes) in [('running', 60 * MB), ('blocked', 50 * MB), ('long', 39 * MB)]:
+            scheduler.add(name, 2, nbytes)
+        self.assertEqual(scheduler.next_table(), 'running')
+        self.clock.advance(40)
+
+        # 'running' has ~20s left, 'long' would take 39s
+        self.assertEqual(scheduler.next_table(), None)
+
+    def test_next_table__skips_tables_that_cannot_finish_before_end_time(self):
+        scheduler = self._scheduler(1, end_time=self.clock() + datetime.timedelta(seconds=100))
+        self._learn_rate(scheduler, mb_per_second=1)
+        scheduler.add('too_big', 2, 200 * MB)
+        scheduler.add('fits', 2, 50 * MB)
+
+        self.assertEqual(scheduler.next_table(), 'fits')
+        self.clock.advance(50)
+        scheduler.finished('fits')
+        self.assertEqual(scheduler.next_table(), None)
+        self.assertTrue(scheduler.has_pending())
+
+    def test_eta__uses_rate_of_redistributed_tables(self):
+        scheduler = self._scheduler(2, tables=[('a', 2, 100 * MB), ('b', 2, 100 * MB)])
+        self.assertEqual(scheduler.eta(), None)
+
+        self._learn_rate(scheduler, mb_per_second=2)
+
+        self.assertEqual(scheduler.rate(), 2 * MB)
+        self.assertEqual(scheduler.eta(), 50)
+
+    def test_finished__failed_tables_do_not_count_towards_rate(self):
+        scheduler = self._scheduler(1, tables=[('a', 2, 100 * MB)])
+        scheduler.next_table()
+        self.clock.advance(1)
+
+        scheduler.finished('a', expanded=False)
+
+        self.assertEqual(scheduler.rate(), None)
+        self.assertFalse(scheduler.is_running())
+
+
+if __name__ == '__main__':
+    run_tests()
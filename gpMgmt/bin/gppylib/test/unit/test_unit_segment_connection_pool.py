@@ -0,0 +1,113 @@
+from mock import *
+
+from gp_unittest import *
+from gpcheckcat_modules.segment_connection_pool import SegmentConnectionPool
+
+
+class SegmentConnectionPoolTestCase(GpTestCase):
+    def setUp(self):
+        self.cfgs = [dict(dbid=1, content=-1, hostname='mdw', port=5432),
+                     dict(dbid=2, content=0, hostname='sdw1', port=40000),
+                     dict(dbid=3, content=1, hostname='sdw2', port=40000)]
+        self.connections = {}
+        self.connect_fn = Mock(side_effect=self._connect)
+        self.subject = SegmentConnectionPool(self.connect_fn, 2)
+
+    def _connect(self, cfg, database, **options):
+        conn = Mock(spec=['query', 'close'])
+        conn.query.return_value = 'cursor %s' % cfg['dbid']
+        self.connections[(cfg['dbid'], database)] = conn
+        return conn
+
+    def test_run__returns_one_result_per_segment_in_order(self):
+        results = self.subject.run(self.cfgs, 'db1', 'select 1')
+
+        self.assertEqual(results, [(self.cfgs[0], 'cursor 1', None),
+                                   (self.cfgs[1], 'cursor 2', None),
+                                   (self.cfgs[2], 'cursor 3', None)])
+
+    def test_run__reuses_connections_across_queries(self):
+        self.subject.run(self.cfgs, 'db1', 'select 1')
+        self.subject.run(self.cfgs, 'db1', 'select 2')
+
+        self.assertEqual(self.connect_fn.call_count, 3)
+        self.assertEqual(self.connections[(2, 'db1')].query.call_args_list, [call('select 1'), call('select 2')])
+
+    def test_run__connects_separately_per_database(self):
+        self.subject.run(self.cfgs, 'db1', 'select 1')
+        self.subject.run(self.cfgs, 'db2', 'select 1')
+
+        self.assertEqual(self.connect_fn.call_count, 6)
+
+    def test_get_connection__pools_connections_by_their_options(self):
+        default = self.subject.get_connection(self.cfgs[1], 'db1')
+        other_user = self.subject.get_connection(self.cfgs[1], 'db1', options={'user': 'u1'})
+
+        self.assertIsNot(default, other_user)
+        self.assertIs(self.subject.get_connection(self.cfgs[1], 'db1', options={'user': 'u1'}), other_user)
+        self.assertIs(self.subject.get_connection(self.cfgs[1], 'db1', options={}), default)
+        self.assertEqual(self.connect_fn.call_args_list, [call(self.cfgs[1], 'db1'),
+                                                          call(self.cfgs[1], 'db1', user='u1')])
+
+    def test_run__when_query_fails__returns_the_error(self):
+        self.subject.run(self.cfgs, 'db1', 'select 1')
+        error = Exception('boom')
+        self.connections[(3, 'db1')].query.side_effect = error
+
+        results = self.subject.run(self.cfgs, 'db1', 'select 2')
+
+        self.assertEqual(results[2], (self.cfgs[2], None, error))
+        self.assertEqual(self.subject.latency[3].errors, 1)
+
+    def test_run__when_connect_fails__returns_the_error(self):
+        error = Exception('could not connect')
+        self.connect_fn.side_effect = error
+
+        results = self.subject.run(self.cfgs[1:2], 'db1', 'select 1')
+
+        self.assertEqual(results, [(self.cfgs[1], None, error)])
+
+    def test_run__when_connect_exits__exits_once_every_segment_is_done(self):
+        def connect(cfg, database):
+            if cfg['dbid'] == 2:
+                raise SystemExit(1)
+            return self._connect(cfg, database)
+        self.connect_fn.side_effect = connect
+
+        with self.assertRaises(SystemExit):
+            self.subject.run(self.cfgs, 'db1', 'select 1')
+
+        self.assertEqual(self.connections[(3, 'db1')].query.call_args_list, [call('select 1')])
+        self.assertEqual(self.subject.latency[2].errors, 0)
+
+    def test_run__never_starts_more_workers_than_requested(self):
+        self.subject.run(self.cfgs, 'db1', 'select 1')
+        self.subject.run(self.cfgs, 'db1', 'select 2')
+
+        self.assertEqual(len(self.subject.workers), 2)
+
+    def test_close__only_closes_connections_to_given_database(self):
+        self.subject.run(self.cfgs, 'db1', 'select 1')
+        self.subject.run(self.cfgs, 'db2', 'select 1')
+
+        self.subject.close('db1')
+
+        self.assertTrue(self.connections[(2, 'db1')].close.called)
+        self.assertFalse(self.connections[(2, 'db2')].close.called)
+        self.subject.run(self.cfgs, 'db1', 'select 1')
+        self.assertEqual(self.connect_fn.call_count, 9)
+
+    def test_latency_report__has_a_line_per_segment(self):
+        self.subject.run(self.cfgs, 'db1', 'select 1')
+        self.subject.run(self.cfgs, 'db1', 'select 2')
+
+        lines = self.subject.latency_report()
+
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(self.subject.latency[2].connects, 1)
+        self.assertEqual(self.subject.latency[2].queries, 2)
+        self.assertIn('sdw1:40000', ''.join(lines))
+
+
+if __name__ == '__main__':
+    run_tests()
@@ -0,0 +1,95 @@
+from mock import *
+
+from gp_unittest import *
+from gpcheckcat_modules.streaming_compare import StreamingCompare, SegmentCursor, \
+    key_expressions, merge_by_key, ordered_query
+
+
+class FakeCursor:
+    def __init__(self, segid, rows):
+        self.segid = segid
+        self.rows = rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class StreamingCompareTestCase(GpTestCase):
+    def setUp(self):
+        self.subject = StreamingCompare([-1, 0, 1], 1)
+
+    def _groups(self, rows_by_segid, key_len=1):
+        return merge_by_key([FakeCursor(segid, rows) for segid, rows in sorted(rows_by_segid.items())], key_len)
+
+    def test_key_expressions__compares_numbers_as_numbers_and_others_as_bytes(self):
+        select_exprs, order_exprs = key_expressions(['attrelid', 'attname', 'aggfnoid'],
+                                                    dict(attrelid='oid', attname='name', aggfnoid='regproc'),
+                                                    {'regproc': '::oid'})
+
+        self.assertEqual(select_exprs, ['attrelid', '(attname)::text', 'aggfnoid::oid'])
+        self.assertEqual(order_exprs, ['attrelid NULLS FIRST', '(attname)::text COLLATE "C" NULLS FIRST',
+                                       'aggfnoid::oid NULLS FIRST'])
+
+    def test_ordered_query__selects_keys_then_columns(self):
+        qry = ordered_query('pg_depend', ['classid', 'objid'], ['classid', 'objid'], ['deptype'], 'WHERE classid != 2603')
+
+        self.assertEqual(qry, 'SELECT classid, objid, deptype FROM pg_depend WHERE classid != 2603 ORDER BY classid, objid')
+
+    def test_merge_by_key__groups_rows_from_all_segments(self):
+        groups = list(self._groups({-1: [(1,), (3,)], 0: [(1,), (2,), (3,)], 1: [(2,), (3,)]}))
+
+        self.assertEqual(groups, [((1,), [(-1, (1,)), (0, (1,))]),
+                                  ((2,), [(0, (2,)), (1, (2,))]),
+                                  ((3,), [(-1, (3,)), (0, (3,)), (1, (3,))])])
+
+    def test_merge_by_key__is_lazy(self):
+        def rows():
+            yield (1,)
+            yield (2,)
+            raise Exception('read too far')
+
+        groups = merge_by_key([FakeCursor(-1, rows())], 1)
+
+        self.assertEqual(groups.next(), ((1,), [(-1, (1,))]))
+
+    def test_missing__reports_keys_not_on_every_segment(self):
+        groups = self._groups({-1: [(1,), (3,)], 0: [(1,), (2,), (3,)], 1: [(2,), (3,)]})
+
+        self.assertEqual(list(self.subject.missing(groups)), [(1, '{-1,0}'), (2, '{0,1}')])
+
+    def test_duplicate__reports_segments_by_number_of_copies(self):
+        groups = self._groups({-1: [(1,), (1,)], 0: [(1,), (1,), (1,)], 1: [(1,), (1,)], })
+
+        self.assertEqual(list(self.subject.duplicate(groups)), [(1, 2, '{-1,1}'), (1, 3, '{0}')])
+
+    def test_inconsistent__reports_majority_once_and_minority_by_segment(self):
+        subject = StreamingCompare([-1, 0, 1, 2], 1)
+        groups = self._groups({-1: [(1, 1, 'a'), (2, 2, 'x')],
+                               0: [(1, 1, 'a'), (2, 2, 'x')],
+                               1: [(1, 1, 'a'), (2, 2, 'x')],
+                               2: [(1, 1, 'b'), (2, 2, 'x')]})
+
+        self.assertEqual(list(subject.inconsistent(groups)), [(1, 'b', '{2}'), (1, 'a', '{NULL}')])
+
+    def test_inconsistent__skips_keys_that_are_missing_somewhere(self):
+        groups = self._groups({-1: [(1, 1, 'a')], 0: [(1, 1, 'b')], 1: []})
+
+        self.assertEqual(list(self.subject.inconsistent(groups)), [])
+
+    def test_segment_cursor__fetches_in_batches_and_rolls_back(self):
+        db = Mock(spec=['query'])
+        batches = [[(1,), (2,)], [(3,)], []]
+        db.query.side_effect = lambda sql: Mock(getresult=Mock(return_value=batches.pop(0))) \
+            if sql.startswith('FETCH') else None
+
+        rows = list(SegmentCursor(db, 0, 'SELECT oid FROM pg_class ORDER BY oid', 'c1', batch_size=2))
+
+        self.assertEqual(rows, [(1,), (2,), (3,)])
+        self.assertEqual(db.query.call_args_list[0], call('BEGIN ISOLATION LEVEL SERIALIZABLE'))
+        self.assertEqual(db.query.call_args_list[1], call('DECLARE c1 NO SCROLL CURSOR FOR SELECT oid FROM pg_class ORDER BY oid'))
+        self.assertEqual(db.query.call_args_list[2], call('FETCH 2 FROM c1'))
+        self.assertEqual(db.query.call_args_list[-1], call('ROLLBACK'))
+
+
+if __name__ == '__main__':
+    run_tests()
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+
+from gp_unittest import *
+from gptransfer_modules.transfer_journal import TransferJournal, STARTED, DONE, FAILED, SCHEMA
+
+
+class TransferJournalTestCase(GpTestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.work_dir, 'gptransfer.journal')
+        self.subject = TransferJournal(self.path, 'src:5432 dest:5432')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+        super(TransferJournalTestCase, self).tearDown()
+
+    def test_load__without_journal__returns_nothing(self):
+        self.assertEqual(self.subject.load(), {})
+
+    def test_load__returns_last_state_of_each_table(self):
+        self.subject.open()
+        self.subject.record(SCHEMA, '')
+        self.subject.record(STARTED, 'db.s.t1', 'db.s.t1', replace=True)
+        self.subject.record(STARTED, 'db.s.t2', 'db.s.t2')
+        self.subject.record(STARTED, 'db.s.t3', 'db.s.t3', replace=True)
+        self.subject.record(DONE, 'db.s.t1', 'db.s.t1', rows=20, detail='validated')
+        self.subject.record(FAILED, 'db.s.t3', 'db.s.t3', detail='Validation failed')
+        self.subject.close()
+
+        entries = TransferJournal(self.path, 'src:5432 dest:5432').load()
+
+        self.assertEqual(entries['db.s.t1'].state, DONE)
+        self.assertEqual(entries['db.s.t1'].rows, 20)
+        self.assertEqual(TransferJournal.completed(entries), set(['db.s.t1']))
+        self.assertEqual(TransferJournal.restartable(entries), set(['db.s.t3']))
+        self.assertTrue(TransferJournal.schema_restored(entries))
+
+    def test_open__without_resume__starts_a_new_journal(self):
+        self.subject.open()
+        self.subject.record(DONE, 'db.s.t1', 'db.s.t1')
+        self.subject.close()
+
+        self.subject.open(resume=True)
+        self.subject.record(DONE, 'db.s.t2', 'db.s.t2')
+        self.subject.close()
+        self.assertEqual(sorted(self.subject.load()), ['db.s.t1', 'db.s.t2'])
+
+        self.subject.open()
+        self.subject.close()
+        self.assertEqual(self.subject.load(), {})
+
+    def test_open__while_another_run_records__raises_and_keeps_its_journal(self):
+        self.subject.open()
+        self.subject.record(DONE, 'db.s.t1', 'db.s.t1')
+
+        other = TransferJournal(self.path, 'src:5432 dest:5432')
+        with self.assertRaisesRegexp(Exception, 'in use by another gptransfer'):
+            other.open()
+        self.subject.close()
+
+        self.assertEqual(sorted(self.subject.load()), ['db.s.t1'])
+        other.open()
+        other.close()
+
+    def test_load__ignores_partially_written_last_line(self):
+        with open(self.path, 'w') as f:
+            f.write('gptransfer journal|src:5432 dest:5432\ndone|db.s.t1|db.s.t1|1|20|\ndone|db.s.t2|db')
+
+        self.assertEqual(sorted(self.subject.load()), ['db.s.t1'])
+
+    def test_load__journal_of_other_systems__raises(self):
+        self.subject.open()
+        self.subject.close()
+
+        with self.assertRaisesRegexp(Exception, 'other systems'):
+            TransferJournal(self.path, 'src:5432 other:5432').load()
+
+
+if __name__ == '__main__':
+    run_tests()
@@ -505,6 +505,30 @@ class TableLogger:
     def hasWarnings(self):
         return self.getNumWarnings() > 0
 
+def logHostTimings(label, hostTimings, logger=get_default_logger(), numSlowest=5):
+    """
+    Log how long label took on each host: the spread and a table of the
+    slowest hosts at info level, and every host at debug level.
+
+    hostTimings: {host name: seconds}
+    """
+    if not hostTimings:
+        return
+
+    ordered = sorted(hostTimings.items(), key=lambda (host, seconds): (-seconds, host))
+    for host, seconds in ordered:
+        logger.debug("%s on host %s took %.1f seconds" % (label, host, seconds))
+
+    seconds = sorted(hostTimings.values())
+    logger.info("%s took %.1f to %.1f seconds per host (median %.1f) on %d hosts" %
+                (label, seconds[0], seconds[-1], seconds[len(seconds) / 2], len(seconds)))
+
+    tableLog = TableLogger(logger)
+    tableLog.info(["Slowest hosts", "Seconds"])
+    for host, seconds in ordered[:numSlowest]:
+        tableLog.info([host, "%.1f" % seconds])
+    tableLog.outputTable()
+
 class ParsedConfigFile:
     """
     returned by call to parseMirroringConfigFile
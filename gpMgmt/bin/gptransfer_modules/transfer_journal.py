@@ -0,0 +1,144 @@
+"""
+A journal of the table transfers of a gptransfer run, so that an interrupted
+run can be resumed with --resume.
+
+The first line names the source and destination systems.  Every other line
+records one state change of a table transfer:
+
+    <state>|<source table>|<dest table>|<replace>|<rows>|<detail>
+
+replace is 1 if the transfer replaces all the data of the destination table
+(the table was created, truncated or dropped for it), so that a transfer
+that did not finish can be restarted by truncating the table first.  Lines
+are appended and synced to disk as they are written; the last line for a
+source table is its current state.
+
+A run holds an exclusive lock on the journal while it records in it, so
+that concurrent runs between the same systems do not overwrite each other's
+journal.
+"""
+
+import fcntl
+import os
+import threading
+
+STARTED = 'started'
+DONE = 'done'
+FAILED = 'failed'
+# the full schema has been restored on the destination system
+SCHEMA = 'schema'
+
+HEADER = 'gptransfer journal'
+
+
+class JournalEntry(object):
+
+    def __init__(self, state, source, dest, replace, rows, detail):
+        self.state = state
+        self.source = source
+        self.dest = dest
+        self.replace = replace
+        self.rows = rows
+        self.detail = detail
+
+
+class TransferJournal(object):
+
+    def __init__(self, path, systems):
+        """
+        path: the journal file
+        systems: description of the source and destination systems; a journal
+                 can only be resumed against the same systems
+        """
+        self._path = path
+        self._systems = systems
+        self._lock = threading.Lock()
+        self._file = None
+
+    def load(self):
+        """
+        return: {source table: JournalEntry} with the last state of every table
+                in the journal, or an empty dict if there is no journal
+        """
+        entries = {}
+        if not os.path.exists(self._path):
+            return entries
+
+        with open(self._path) as f:
+            header = f.readline().rstrip('\n')
+            if header != '%s|%s' % (HEADER, self._systems):
+                raise Exception('Journal %s is for a transfer between other systems (%s)'
+                                % (self._path, header))
+            for line in f:
+                fields = line.rstrip('\n').split('|', 5)
+                # a partially written last line is ignored
+                if len(fields) != 6:
+                    continue
+                (state, source, dest, replace, rows, detail) = fields
+                replace = replace == '1'
+                if state != STARTED and source in entries:
+                    # the outcome of a transfer keeps the replace flag of its start
+                    replace = replace or entries[source].replace
+                entries[source] = JournalEntry(state, source, dest, replace, int(rows), detail)
+        return entries
+
+    def open(self, resume=False):
+        """
+        Opens and locks the journal for recording, starting a new one unless
+        resuming an existing one.  Raises an exception if another run holds
+        the lock.
+        """
+        # only truncated once the lock is held
+        self._file = open(self._path, 'a')
+        try:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            self._file.close()
+            self._file = None
+            raise Exception('Journal %s is in use by another gptransfer' % self._path)
+
+        if not resume or os.path.getsize(self._path) == 0:
+            self._file.truncate(0)
+            self._write('%s|%s' % (HEADER, self._systems))
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def record(self, state, source, dest='', replace=False, rows=-1, detail=''):
+        """
+        Appends the state of a table transfer to the journal.
+        """
+        self._write('%s|%s|%s|%d|%d|%s' % (state, source, dest, 1 if replace else 0, rows,
+                                          detail.replace('\n', ' ')))
+
+    def _write(self, line):
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    @staticmethod
+    def completed(entries):
+        """
+        return: the source tables whose transfer has finished
+        """
+        return set(source for (source, entry) in entries.iteritems() if entry.state == DONE)
+
+    @staticmethod
+    def restartable(entries):
+        """
+        return: the source tables whose transfer did not finish and whose
+                destination table can be truncated before restarting it
+        """
+        return set(source for (source, entry) in entries.iteritems()
+                   if entry.state in (STARTED, FAILED) and entry.replace)
+
+    @staticmethod
+    def schema_restored(entries):
+        """
+        return: True if the full schema has been restored on the destination
+        """
+        return any(entry.state == SCHEMA for entry in entries.itervalues())
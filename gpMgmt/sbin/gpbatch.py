@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+#
+# Runs a batch of commands and operations sent by gppylib.commands.batch.RemoteBatch.
+#
+# stdin holds, pickled one after the other: the name of the calling program,
+# the maximum number of items to run at once and the list of items, each
+# either ('command', cmdStr, stdin) or ('operation', operation).
+#
+# One line is written to stdout as each item finishes:
+#   GPBATCH:<base64 of the pickled tuple (index, elapsed, result)>
+# where result is (rc, stdout, stderr) for a command, and the return value
+# or exception for an operation.
+#
+import sys
+import base64
+import pickle
+import time
+import traceback
+from Queue import Queue, Empty
+from threading import Lock, Thread
+
+
+class NullDevice():
+    def write(self, s):
+        pass
+
+
+# Prevent use of stdout, as it disrupts the result lines
+old_stdout = sys.stdout
+sys.stdout = NullDevice()
+
+# log initialization must be done only AFTER rerouting stdout
+from gppylib import gplog
+from gppylib.commands import unix
+from gppylib.commands.base import Command
+from gppylib.commands.batch import BATCH_RESULT_PREFIX
+
+hostname = unix.getLocalHostname()
+username = unix.getUserName()
+execname = pickle.load(sys.stdin)
+gplog.setup_tool_logging(execname, hostname, username)
+logger = gplog.get_default_logger()
+
+maxConcurrency = pickle.load(sys.stdin)
+items = pickle.load(sys.stdin)
+
+output_lock = Lock()
+
+
+def report(index, elapsed, result):
+    try:
+        pickled_result = pickle.dumps((index, elapsed, result))
+    except Exception, e:
+        # No hope of pickling the precise result, send it as text
+        logger.debug("cannot pickle result of item %d: %s" % (index, e))
+        pickled_result = pickle.dumps((index, elapsed, Exception(str(result))))
+    with output_lock:
+        old_stdout.write(BATCH_RESULT_PREFIX + base64.b64encode(pickled_result) + '\n')
+        old_stdout.flush()
+
+
+def run_item(index, item):
+    start = time.time()
+    try:
+        if item[0] == 'command':
+            (cmdStr, stdin) = item[1:]
+            cmd = Command('batch item %d' % index, cmdStr, stdin=stdin)
+            cmd.run()
+            results = cmd.get_results()
+            result = (results.rc, results.stdout, results.stderr)
+        else:
+            try:
+                result = item[1].run()
+            except Exception, e:
+                logger.debug(traceback.format_exc())
+                result = e
+    except Exception, e:
+        pretty_trace = traceback.format_exc()
+        logger.critical(pretty_trace)
+        result = (1, '', pretty_trace) if item[0] == 'command' else e
+    report(index, time.time() - start, result)
+
+
+def worker(queue):
+    while True:
+        try:
+            (index, item) = queue.get_nowait()
+        except Empty:
+            return
+        run_item(index, item)
+
+
+queue = Queue()
+for index, item in enumerate(items):
+    queue.put((index, item))
+
+threads = [Thread(target=worker, args=(queue,)) for i in range(max(1, min(maxConcurrency, len(items))))]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+
+sys.exit(0)